@@ -1,36 +1,408 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
 import json
-from datetime import datetime, time
+import csv
+import io
+import logging
+from datetime import datetime, time, timedelta
 import time as time_module
-import requests
+import random
 import serial
 import threading
+import queue
+from collections import deque, namedtuple
+from bisect import bisect_left, bisect_right
+import sqlite3
+import os
+import sys
+import argparse
+import subprocess
+import secrets
+import socket
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import mimetypes
+from multiprocessing.connection import Listener, Client
 import serial.tools.list_ports
 
+try:
+    import pyudev  # optional: instant hotplug events on Linux
+except ImportError:
+    pyudev = None
+
+# Optional: /reports analytics. Imported by load_numpy() on first use, off the startup path
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+np = None
+
+try:
+    import brotli  # optional: brotli variants of the frontend assets
+except ImportError:
+    brotli = None
+
 app = Flask(__name__)
+log = logging.getLogger("attendance")
 
 # ---------------- CONFIG ----------------
-WEB_APP_URL = "https://script.google.com/macros/s/AKfycbx8LK-Caj0IVcoP4hEeBK3lcitvLX67vx9s4BVef2QVcHN9gIxY6xHQDrbm0PdpdAERZQ/exec"
+LOG_LEVEL = os.environ.get("ATTENDANCE_LOG_LEVEL", "INFO")   # DEBUG logs every scan, frame and batch
+LOG_FORMAT = os.environ.get("ATTENDANCE_LOG_FORMAT", "text")  # text | json
+HTTP_HOST = '0.0.0.0'
+HTTP_PORT = 5001
+
+# Production serving: one hardware-owner process runs the readers, journal and
+# session state; HTTP worker processes forward API calls to it over a Unix socket.
+APP_ROLE = os.environ.get("ATTENDANCE_ROLE", "standalone")  # standalone | owner | worker
+IPC_SOCKET_PATH = os.environ.get("ATTENDANCE_IPC_SOCKET", "/tmp/attendance-owner.sock")
+IPC_AUTHKEY = bytes.fromhex(os.environ.get("ATTENDANCE_IPC_KEY", "")) or None
+PRODUCTION_WORKERS = os.cpu_count() or 2
+PRODUCTION_THREADS = 16      # threads per worker; each open /events stream holds one
+WORKER_LOCAL_ENDPOINTS = {'index', 'static', 'frontend_asset'}
+ipc_local = threading.local()
+
+WEB_APP_URL = os.environ.get("ATTENDANCE_WEB_APP_URL") or "https://script.google.com/macros/s/AKfycbx8LK-Caj0IVcoP4hEeBK3lcitvLX67vx9s4BVef2QVcHN9gIxY6xHQDrbm0PdpdAERZQ/exec"
+
+# Building aggregator: kiosks forward their journal to one node on the LAN instead of
+# the Apps Script; it dedups, uploads in large batches and serves the Register tab back.
+AGGREGATOR_URL = os.environ.get("ATTENDANCE_AGGREGATOR_URL") or None  # set on kiosks, e.g. http://10.0.0.2:5001
+AGGREGATOR_MODE = os.environ.get("ATTENDANCE_AGGREGATOR") == "1"       # this node is the aggregator
+KIOSK_ID = os.environ.get("ATTENDANCE_KIOSK_ID") or socket.gethostname()
+AGGREGATOR_KEY = os.environ.get("ATTENDANCE_AGGREGATOR_KEY") or None  # shared by the aggregator and its kiosks
+AGGREGATOR_KEY_HEADER = "X-Attendance-Aggregator-Key"
+AGGREGATOR_UPLOAD_BATCH_SIZE = 500  # rows per Apps Script POST once streams from every room are merged
+AGGREGATOR_UPLOAD_LINGER = 2.0      # seconds to let batches from other kiosks pile up
+AGGREGATOR_INSTANCE = secrets.token_hex(4)  # part of the mirror generation, so kiosks reload after a restart
+forwarded_events_lock = threading.Lock()    # one dedup check + journal write at a time
+register_mirror_lock = threading.Lock()
+register_mirror = {
+    'rows': [],               # Register tab rows in sheet order, as the Apps Script returns them
+    'ready': False,           # a full read has completed since startup
+    'sheet_generation': None,
+    'epoch': 0                # bumped whenever rows are replaced rather than appended to
+}
 
 # RFID Configuration - Auto-detect or manual
 RFID_BAUD_RATE = 9600
-rfid_serial = None
-rfid_connected = False
-
-REGISTERED_USERS = {}
-attendance_enabled = False
-current_teacher_subject = None
-current_teacher_card = None
-last_scanned_card = None
-card_scan_callback = None
+RFID_READ_TIMEOUT = 1.0     # blocking read wakes at least this often when idle
+RFID_DEBOUNCE_TIME = 2      # seconds before the same card is accepted again
+EM18_FRAME_LENGTH = 12      # 10 hex data characters + 2 hex checksum characters
+RFID_RECONNECT_DELAY = 30   # fallback retry interval when no hotplug event arrives
+HOTPLUG_SETTLE_DELAY = 0.5  # let udev finish setting up a new device node
+PORT_INVENTORY_TTL = 60     # rescan ports at least this often
+PORT_WATCH_INTERVAL = 1.0   # /dev change check when pyudev is not installed
+port_inventory = []
+port_inventory_at = 0
+port_inventory_lock = threading.Lock()
+hotplug_condition = threading.Condition()
+hotplug_generation = 0
+SCAN_QUEUE_LENGTH = 32      # scanned cards kept per reader until the UI collects them
+TRANSITION_LOG_LENGTH = 200 # lecture state transitions kept per reader
+
+# Readers served by this process, e.g. [{"id": "room-101", "port": "/dev/ttyUSB0"}].
+# Without a config file a single auto-detected reader is used.
+READERS_CONFIG_PATH = "readers.json"
+DEFAULT_READER_ID = "default"
+DEFAULT_SCAN_MODE = os.environ.get("ATTENDANCE_SCAN_MODE") or None  # "auto" runs without a browser
+reader_sessions = {}
+reader_sessions_lock = threading.Lock()
+
+# Server-Sent Events pushed to browser tabs
+EVENT_CLIENT_BUFFER = 100   # events buffered per client before the oldest are dropped
+SSE_KEEPALIVE = 15          # seconds between session refreshes on an idle stream
+event_subscribers = []
+event_subscribers_lock = threading.Lock()
+
+# Write-behind upload queue for Google Sheet rows
+UPLOAD_BATCH_SIZE = 50        # max rows coalesced into one POST
+UPLOAD_LINGER = 0.5           # seconds to wait for more rows before flushing
+UPLOAD_RETRY_DELAY = 5        # seconds to wait after a failed batch
+UPLOAD_IDLE_RECHECK = 30      # seconds between journal checks when idle
+upload_wakeup = threading.Event()
+upload_stats_lock = threading.Lock()
+upload_stats = {
+    'rows_sent': 0,
+    'batches_sent': 0,
+    'failed_batches': 0,
+    'last_batch_size': 0,
+    'last_flush_latency_ms': None,
+    'max_flush_latency_ms': None,
+    'last_flush_at': None,
+    'last_error': None
+}
 
-# Lecture timings (24-hour format)
+# Apps Script HTTP client
+BACKEND_CONNECT_TIMEOUT = 5        # seconds to establish TCP + TLS
+BACKEND_READ_TIMEOUT = 30          # seconds to wait for Apps Script to answer
+BACKEND_MAX_RETRIES = 3
+BACKEND_BACKOFF_BASE = 0.5         # seconds; doubled each retry, with full jitter
+BACKEND_BACKOFF_MAX = 8
+BACKEND_BREAKER_THRESHOLD = 5      # consecutive failed calls that open the circuit
+BACKEND_BREAKER_COOLDOWN = 60      # seconds to fail fast before trying again
+BACKEND_RETRY_STATUSES = {429, 500, 502, 503, 504}
+SHEET_PAGE_SIZE = 500              # sheet rows per doGet page (the script caps it at 2000)
+SHEET_PAGE_FETCHERS = 4            # pages in flight at once when reading a whole tab
+backend_session = None
+backend_lock = threading.Lock()
+backend_stats = {
+    'calls': 0,
+    'failed_calls': 0,
+    'retries': 0,
+    'fast_failures': 0,
+    'consecutive_failures': 0,
+    'circuit_open_until': 0,
+    'cold_calls': 0,       # needed a new TCP/TLS connection
+    'cold_total_ms': 0.0,
+    'warm_calls': 0,       # reused a pooled connection
+    'warm_total_ms': 0.0
+}
+backend_recent_calls = deque(maxlen=50)
+
+# Registered user directory cache
+USERS_SNAPSHOT_PATH = "registered_users.json"
+DIRECTORY_REFRESH_INTERVAL = 300   # seconds between incremental refreshes
+DIRECTORY_FULL_REFRESH_EVERY = 12  # every Nth refresh re-reads the whole tab to pick up edits
+users_last_row = 0                 # last Register sheet row merged into REGISTERED_USERS
+users_generation = None            # Register tab generation users_last_row counts rows of (bumped when the script compacts it)
+directory_lock = threading.Lock()     # one sheet refresh at a time
+registration_lock = threading.Lock()  # local registrations and directory swaps
+REGISTER_ROLES = ("student", "teacher", "admin")
+
+# Local attendance journal (primary store, synced to the sheet)
+JOURNAL_DB_PATH = "attendance_journal.db"
+JOURNAL_SYNCHRONOUS = "NORMAL"  # WAL + NORMAL survives app crashes without an fsync per scan
+journal_lock = threading.Lock()
+journal_conn = None
+
+# Startup: HTTP and the readers come up at once, everything else warms up in the background
+WARMUP_REQUIRED = ("timetable", "journal", "users")  # stages /ready waits for
+PENDING_SCANS_MAX = 5000    # taps held while the user directory loads
+USERS_RETRY_DELAY = 10      # seconds between downloads when there is no snapshot to start from
+HELD_SCAN_MODES = ("attendance", "start_attendance", "auto")  # the modes whose handlers look users up
+WARMUP_RETRY_AFTER = 5      # seconds scan API clients are asked to wait while users load
+warmup_stages = {}          # stage -> {'state', 'seconds' (since process start), 'error'}
+startup_marks = {'first_scan': None, 'first_result': None}  # seconds since process start
+scans_on_hold = threading.Event()  # set by start_background_services until users are loaded
+pending_scans = deque(maxlen=PENDING_SCANS_MAX)
+pending_scans_lock = threading.Lock()
+warmup_lock = threading.Lock()
+readers_attempted = set()
+
+# Batch attendance API (offline catch-up from handheld readers and mobile clients)
+MARK_BATCH_MAX = 10000             # scans accepted per /mark_attendance_batch request
+CLIENT_EVENT_RETENTION_DAYS = 30   # how long a client event id is remembered for replays
+
+# Frontend: the static/ files index.html links are fingerprinted and compressed once,
+# then served from memory with validators
+FRONTEND_ASSETS = ("app.css", "app.js")
+FRONTEND_ASSET_MAX_AGE = 31536000  # a fingerprinted URL never changes content
+frontend = None
+frontend_lock = threading.Lock()
+
+# Attendance reports (columnar copy of the journal's attendance rows)
+REPORTS_SNAPSHOT_PATH = "attendance_columns.npz"
+REPORTS_SNAPSHOT_EVERY = 5000  # rows folded in before the columnar snapshot is rewritten
+attendance_columns = None
+attendance_columns_lock = threading.Lock()
+
+# Lecture timings (24-hour format), used when timetable.json is missing
 LECTURE_SLOTS = {
     1: {"start": time(19, 0), "end": time(20, 0)},
     2: {"start": time(10, 30), "end": time(12, 30)},
     3: {"start": time(13, 0), "end": time(15, 0)},
     4: {"start": time(15, 45), "end": time(17, 0)}
 }
+GRACE_MINUTES = 15   # students scanning within this many minutes of the start are On-time
+
+# Per-weekday / per-room timetable, e.g.
+# {"grace_minutes": 15,
+#  "slots": {"1": ["09:00", "10:00"]},
+#  "weekdays": {"sat": {"1": ["09:00", "11:00"]}},
+#  "rooms": {"room-101": {"slots": {...}, "weekdays": {...}}}}
+TIMETABLE_PATH = "timetable.json"
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+# ---------------- LOGGING ----------------
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "thread": record.threadName,
+            "msg": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+def configure_logging(level=None, fmt=None):
+    """Send app logs to stdout at `level` (names as in the logging module)"""
+    global LOG_FORMAT
+    LOG_FORMAT = fmt or LOG_FORMAT
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s [%(threadName)s] %(message)s"))
+    log.handlers[:] = [handler]
+    log.setLevel((level or LOG_LEVEL).upper())
+    log.propagate = False
+    # Werkzeug logs one line per HTTP request at INFO; only show it when we are that verbose too
+    logging.getLogger("werkzeug").setLevel(max(log.level, logging.INFO))
+
+# ---------------- METRICS ----------------
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+metrics_registry = []
+
+class Metric:
+    """Base for the /metrics registry: one time series per label-value tuple"""
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def label_text(self, key, extra=None):
+        pairs = list(zip(self.labels, key)) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.extend(self.render_series(key, value))
+        return lines
+
+    def render_series(self, key, value):
+        return [f"{self.name}{self.label_text(key)} {value}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Set directly, or computed at scrape time by `collect` returning {label tuple: value}"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), collect=None):
+        super().__init__(name, help_text, labels)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def render(self):
+        if self.collect:
+            try:
+                collected = self.collect()
+            except Exception as e:
+                log.warning(f"⚠️ Metric {self.name} failed to collect: {e}")
+                collected = {}
+            with self.lock:
+                self.values = dict(collected)
+        return super().render()
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)  # first bucket with bound >= value; len() is +Inf
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self.lock:
+            self.values = {key: [list(series[0]), series[1], series[2]] for key, series in self.values.items()}
+        return super().render()
+
+    def render_series(self, key, series):
+        counts, total, count = series
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{self.name}_bucket{self.label_text(key, ('le', le))} {cumulative}")
+        lines.append(f"{self.name}_sum{self.label_text(key)} {total}")
+        lines.append(f"{self.name}_count{self.label_text(key)} {count}")
+        return lines
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Reader hot path
+SCANS_TOTAL = Counter("attendance_scans_total", "Cards accepted from a reader", ("reader", "mode", "outcome"))
+SCAN_SECONDS = Histogram("attendance_scan_seconds", "Time to run a scan through its pipeline", ("reader", "mode"))
+FRAME_READ_SECONDS = Histogram("rfid_frame_read_seconds", "First byte of an EM-18 frame to the decoded card")
+INVALID_FRAMES_TOTAL = Counter("rfid_invalid_frames_total", "EM-18 frames rejected by the checksum")
+DEBOUNCE_DROPS_TOTAL = Counter("rfid_debounce_drops_total", "Repeat reads dropped inside the debounce window",
+                               ("reader",))
+READER_ERRORS_TOTAL = Counter("rfid_reader_errors_total", "Serial failures that forced a reconnect", ("reader",))
+
+# Apps Script backend and sheet sync
+BACKEND_SECONDS = Histogram("backend_request_seconds", "Apps Script call time including retries", ("method",))
+BACKEND_REQUESTS_TOTAL = Counter("backend_requests_total", "Apps Script calls by result", ("method", "outcome"))
+BACKEND_RETRIES_TOTAL = Counter("backend_retries_total", "Apps Script attempts retried after an error")
+UPLOAD_ROWS_TOTAL = Counter("upload_rows_total", "Journal rows confirmed by the sheet")
+UPLOAD_BATCHES_TOTAL = Counter("upload_batches_total", "Batch uploads by result", ("outcome",))
+AGGREGATOR_EVENTS_TOTAL = Counter("aggregator_events_total", "Journal events forwarded by kiosks",
+                                  ("kiosk", "outcome"))
+
+# HTTP
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds", "Flask request latency", ("endpoint", "method", "status"))
+
+# Computed when /metrics is scraped
+UPLOAD_QUEUE_DEPTH = Gauge("upload_queue_depth", "Journaled rows not yet confirmed by the sheet",
+                           collect=lambda: {(): count_unsynced_events()})
+READER_CONNECTED = Gauge("rfid_reader_connected", "1 while the reader's serial port is open", ("reader",),
+                         collect=lambda: {(s.reader_id,): int(s.connected) for s in list(reader_sessions.values())})
+LECTURE_ACTIVE = Gauge("attendance_lecture_active", "1 while a lecture is running on the reader", ("reader",),
+                       collect=lambda: {(s.reader_id,): int(s.lecture.attendance_enabled)
+                                        for s in list(reader_sessions.values())})
+SSE_CLIENTS = Gauge("sse_clients", "Open /events streams", collect=lambda: {(): len(event_subscribers)})
+BACKEND_CIRCUIT_OPEN = Gauge("backend_circuit_open", "1 while the Apps Script circuit breaker fails fast",
+                             collect=lambda: {(): int(time_module.time() < backend_stats['circuit_open_until'])})
+REGISTERED_USERS_COUNT = Gauge("registered_users", "Cards in the user directory",
+                               collect=lambda: {(): len(REGISTERED_USERS)})
+STARTUP_STAGE_SECONDS = Gauge("startup_stage_seconds", "Process start to each warm-up stage finishing", ("stage",),
+                              collect=lambda: {(stage,): info['seconds'] for stage, info in list(warmup_stages.items())
+                                               if info['seconds'] is not None})
+STARTUP_FIRST_SCAN_SECONDS = Gauge("startup_first_scan_seconds",
+                                   "Process start to the first tap accepted (scan) and answered (result)", ("event",),
+                                   collect=lambda: {(event[6:],): seconds for event, seconds in startup_marks.items()
+                                                    if seconds is not None})
 
 # ---------------- RFID FUNCTIONS ----------------
 
@@ -45,94 +417,291 @@ def detect_serial_ports():
                 'description': port.description,
                 'hwid': port.hwid
             })
-            print(f"🔍 Found port: {port.device} - {port.description}")
     except Exception as e:
-        print(f"❌ Error detecting ports: {e}")
+        log.error(f"❌ Error detecting ports: {e}")
     return ports
 
-def setup_rfid_reader():
-    """Initialize RFID reader with auto-detection"""
-    global rfid_serial, rfid_connected
+# ---------------- PORT INVENTORY ----------------
 
-    # Try to auto-detect RFID reader
+def refresh_port_inventory():
+    """Rescan serial ports and wake reconnecting readers if anything changed"""
+    global port_inventory, port_inventory_at, hotplug_generation
     ports = detect_serial_ports()
-    target_port = None
+    with port_inventory_lock:
+        old_devices = {p['device'] for p in port_inventory}
+        changed = ports != port_inventory
+        port_inventory = ports
+        port_inventory_at = time_module.monotonic()
+
+    if changed:
+        new_devices = {p['device'] for p in ports}
+        for device in sorted(new_devices - old_devices):
+            log.info(f"🔍 Found port: {device}")
+        for device in sorted(old_devices - new_devices):
+            log.info(f"🔌 Port removed: {device}")
+        with hotplug_condition:
+            hotplug_generation += 1
+            hotplug_condition.notify_all()
+    return ports
 
-    # Common RFID reader descriptions
-    rfid_keywords = ['usb', 'serial', 'uart', 'ch340', 'cp210', 'ftdi', 'em-18', 'rfid']
+def get_port_inventory():
+    """Cached port list; only rescans when the cache is older than PORT_INVENTORY_TTL"""
+    with port_inventory_lock:
+        fresh = port_inventory_at and time_module.monotonic() - port_inventory_at < PORT_INVENTORY_TTL
+        if fresh:
+            return port_inventory
+    return refresh_port_inventory()
+
+def wait_for_hotplug(timeout):
+    """Block until the port inventory changes or `timeout` seconds pass"""
+    with hotplug_condition:
+        generation = hotplug_generation
+        changed = hotplug_condition.wait_for(lambda: hotplug_generation != generation, timeout)
+    if changed:
+        time_module.sleep(HOTPLUG_SETTLE_DELAY)
+    return changed
+
+def dev_directory_mtime():
+    """Adding or removing a device node changes the mtime of /dev"""
+    try:
+        return os.stat('/dev').st_mtime_ns
+    except OSError:
+        return None  # no /dev (Windows): rely on the TTL alone
 
-    for port in ports:
-        description_lower = port['description'].lower()
-        if any(keyword in description_lower for keyword in rfid_keywords):
-            target_port = port['device']
-            print(f"🎯 Potential RFID reader found: {port['device']} - {port['description']}")
-            break
+def port_watcher_thread():
+    """Refresh the port inventory on hotplug (udev, or /dev changes as a fallback)"""
+    refresh_port_inventory()
 
-    # If no auto-detection, try common ports
-    common_ports = ['COM3', 'COM4', 'COM5', 'COM6', '/dev/ttyUSB0', '/dev/ttyACM0', '/dev/tty.usbserial']
+    if pyudev:
+        try:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by('tty')
+            log.info("🔌 Watching serial hotplug events via udev")
+            for _ in iter(monitor.poll, None):
+                refresh_port_inventory()
+        except Exception as e:
+            log.warning(f"⚠️ udev monitor failed, falling back to polling /dev: {e}")
 
-    for port in common_ports:
-        if not target_port:  # Only try if no target from auto-detection
-            try:
-                test_ser = serial.Serial(port, RFID_BAUD_RATE, timeout=1)
-                test_ser.close()
-                target_port = port
-                print(f"✅ Port {port} is available")
+    last_dev_mtime = dev_directory_mtime()
+    while True:
+        time_module.sleep(PORT_WATCH_INTERVAL)
+        dev_mtime = dev_directory_mtime()
+
+        stale = time_module.monotonic() - port_inventory_at >= PORT_INVENTORY_TTL
+        if (dev_mtime is not None and dev_mtime != last_dev_mtime) or stale:
+            last_dev_mtime = dev_mtime
+            refresh_port_inventory()
+
+def open_rfid_serial(port):
+    """Open a serial port with the EM-18 line settings"""
+    return serial.Serial(
+        port=port,
+        baudrate=RFID_BAUD_RATE,
+        parity=serial.PARITY_NONE,
+        stopbits=serial.STOPBITS_ONE,
+        bytesize=serial.EIGHTBITS,
+        timeout=RFID_READ_TIMEOUT  # Reads block until bytes arrive, no polling
+    )
+
+def claimed_ports(exclude=None):
+    """Ports already opened by other reader sessions"""
+    with reader_sessions_lock:
+        return {s.port for s in reader_sessions.values() if s is not exclude and s.connected and s.port}
+
+def setup_rfid_reader(session):
+    """Initialize a session's RFID reader on its configured port, or auto-detect one"""
+    target_port = session.configured_port
+
+    if not target_port:
+        # Try to auto-detect RFID reader, skipping ports other readers own
+        ports = get_port_inventory()
+        taken = claimed_ports(exclude=session)
+
+        # Common RFID reader descriptions
+        rfid_keywords = ['usb', 'serial', 'uart', 'ch340', 'cp210', 'ftdi', 'em-18', 'rfid']
+
+        for port in ports:
+            description_lower = port['description'].lower()
+            if port['device'] not in taken and any(keyword in description_lower for keyword in rfid_keywords):
+                target_port = port['device']
+                log.debug("🎯 Potential RFID reader found: %s - %s", port['device'], port['description'])
                 break
-            except:
-                print(f"❌ Port {port} not available")
-                continue
+
+        # If no auto-detection, try common ports (only device nodes that exist; COM ports only on Windows)
+        common_ports = ['COM3', 'COM4', 'COM5', 'COM6'] if os.name == 'nt' else \
+            [port for port in ['/dev/ttyUSB0', '/dev/ttyACM0', '/dev/tty.usbserial'] if os.path.exists(port)]
+
+        for port in common_ports:
+            if not target_port and port not in taken:  # Only try if no target from auto-detection
+                try:
+                    test_ser = serial.Serial(port, RFID_BAUD_RATE, timeout=1)
+                    test_ser.close()
+                    target_port = port
+                    log.debug("✅ Port %s is available", port)
+                    break
+                except:
+                    log.debug("❌ Port %s not available", port)
+                    continue
 
     if not target_port:
-        print("❌ No suitable serial port found for RFID reader")
+        log.error(f"❌ [{session.reader_id}] No suitable serial port found for RFID reader")
         return None
 
     try:
-        rfid_serial = serial.Serial(
-            port=target_port,
-            baudrate=RFID_BAUD_RATE,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            bytesize=serial.EIGHTBITS,
-            timeout=0.1  # Short timeout for responsive reading
-        )
-        rfid_connected = True
-        print(f"✅ RFID Reader connected on {target_port}")
-        return rfid_serial
+        session.attach_serial(open_rfid_serial(target_port), target_port)
+        log.info(f"✅ [{session.reader_id}] RFID Reader connected on {target_port}")
+        return session.serial
     except Exception as e:
-        print(f"❌ Failed to connect to RFID reader on {target_port}: {e}")
-        rfid_connected = False
+        log.error(f"❌ [{session.reader_id}] Failed to connect to RFID reader on {target_port}: {e}")
+        session.mark_disconnected()
         return None
 
-def read_rfid_card(ser):
-    """Read RFID card from serial port with improved parsing"""
-    if not ser:
-        return None
+class EM18Framer:
+    """Reassemble EM-18 frames from the serial byte stream and validate checksums"""
 
-    try:
-        if ser.in_waiting > 0:
-            # Read all available data
-            data = ser.readline().decode('utf-8', errors='ignore').strip()
-
-            # EM-18 typically sends 12-character IDs (sometimes with \r\n)
-            if len(data) >= 10:  # Allow for some variations
-                # Extract only alphanumeric characters (remove any control characters)
-                clean_data = ''.join(char for char in data if char.isalnum())
-
-                if len(clean_data) >= 10:  # Valid RFID card ID
-                    print(f"📖 Raw RFID data: '{data}' -> Clean: '{clean_data}'")
-                    return clean_data
-                else:
-                    print(f"📖 Invalid RFID data: '{data}'")
+    HEX_DIGITS = frozenset(b"0123456789ABCDEFabcdef")
 
-        return None
-    except Exception as e:
-        print(f"❌ Error reading RFID: {e}")
-        return None
+    def __init__(self):
+        self.buffer = bytearray()
+        self.rejected = 0
+        self.frame_started = None
+
+    def feed(self, data):
+        """Consume raw bytes and return the card IDs of all complete, valid frames"""
+        cards = []
+        for byte in data:
+            if byte not in self.HEX_DIGITS:
+                # CR/LF/STX/ETX or line noise: whatever came before is not a frame
+                self.buffer.clear()
+                continue
 
-def simulate_rfid_reader():
+            if not self.buffer:
+                self.frame_started = time_module.perf_counter()
+            self.buffer.append(byte)
+            if len(self.buffer) == EM18_FRAME_LENGTH:
+                frame = self.buffer.decode('ascii')
+                if em18_checksum_ok(frame):
+                    cards.append(frame)
+                    self.buffer.clear()
+                    FRAME_READ_SECONDS.observe(time_module.perf_counter() - self.frame_started)
+                else:
+                    # Slide by one character to resynchronise on the next frame
+                    self.rejected += 1
+                    INVALID_FRAMES_TOTAL.inc()
+                    log.debug("📖 Invalid RFID frame: '%s'", frame)
+                    del self.buffer[0]
+        return cards
+
+def em18_checksum_ok(frame):
+    """EM-18 checksum is the XOR of the five data bytes"""
+    data = bytes.fromhex(frame[:10])
+    checksum = 0
+    for byte in data:
+        checksum ^= byte
+    return checksum == int(frame[10:12], 16)
+
+class CardDebouncer:
+    """Per-card debounce table: each card is accepted at most once per window"""
+
+    def __init__(self, window=RFID_DEBOUNCE_TIME):
+        self.window = window
+        self.last_seen = {}
+
+    def accept(self, card_id, now):
+        last = self.last_seen.get(card_id)
+        self.last_seen[card_id] = now
+        if len(self.last_seen) > 1024:
+            self.last_seen = {card: seen for card, seen in self.last_seen.items() if now - seen < self.window}
+        return last is None or now - last >= self.window
+
+def read_rfid_cards(ser, framer):
+    """Block until bytes arrive on the serial port and return any complete card IDs"""
+    data = ser.read(1)  # returns b'' after RFID_READ_TIMEOUT with no CPU spent waiting
+    if not data:
+        return []
+    waiting = ser.in_waiting
+    if waiting:
+        data += ser.read(waiting)
+    return framer.feed(data)
+
+def dispatch_card_scan(session, card_id):
+    """Run the session's scan pipeline on a card (or hold it during warm-up), then tell the UI"""
+    log.debug("🎫 [%s] Card scanned: %s", session.reader_id, card_id)
+    if startup_marks['first_scan'] is None:
+        startup_marks['first_scan'] = seconds_since_start()
+    if scans_on_hold.is_set() and hold_scan(session, card_id):
+        return
+    run_card_scan(session, card_id)
+
+def run_card_scan(session, card_id, scanned_at=None):
+    started = time_module.perf_counter()
+    mode = session.scan_mode
+    callback = session.card_scan_callback
+    result = None
+    if callback:
+        try:
+            result = callback(session, card_id, scanned_at)
+        except Exception as e:
+            # A failing handler must never take the reader thread down with it
+            log.exception(f"❌ [{session.reader_id}] Scan handler error: {e}")
+            result = {'success': False, 'message': f'Error: {str(e)}'}
+    SCAN_SECONDS.observe(time_module.perf_counter() - started, reader=session.reader_id, mode=mode)
+    SCANS_TOTAL.inc(reader=session.reader_id, mode=mode, outcome=scan_outcome(result))
+
+    if startup_marks['first_result'] is None:
+        startup_marks['first_result'] = seconds_since_start()
+
+    scan = {'card_id': card_id, 'mode': mode, 'result': result}
+    session.scan_queue.append(scan)
+    publish_event('scan', scan, session.reader_id)
+
+def hold_scan(session, card_id):
+    """Keep a tap made before the user directory is loaded; False once taps are let through.
+
+    Only taps of modes that look the card up are held: a registration tap goes
+    straight to the browser form, which must see it exactly once.
+    """
+    if session.scan_mode not in HELD_SCAN_MODES:
+        return False
+    with pending_scans_lock:
+        if not scans_on_hold.is_set():
+            return False
+        if len(pending_scans) == pending_scans.maxlen:
+            log.warning("⚠️ Too many scans held during startup, dropping the oldest")
+        pending_scans.append((session, card_id, datetime.now()))
+    scan = {'card_id': card_id, 'mode': session.scan_mode, 'result': {
+        'success': True,
+        'buffered': True,
+        'message': 'Scan saved, it is processed as soon as the user list is loaded'
+    }}
+    session.scan_queue.append(scan)
+    publish_event('scan', scan, session.reader_id)
+    return True
+
+def release_held_scans():
+    """Run the taps held during warm-up with their own timestamps, oldest first, then stop holding"""
+    with pending_scans_lock:
+        held = len(pending_scans)
+        while pending_scans:
+            session, card_id, scanned_at = pending_scans.popleft()
+            run_card_scan(session, card_id, scanned_at)
+        scans_on_hold.clear()
+    if held:
+        log.info(f"✅ Processed {held} scan(s) made during startup")
+
+def scan_outcome(result):
+    """Metric label for a pipeline result"""
+    if result is None:
+        return "none"
+    if result.get('duplicate'):
+        return "duplicate"
+    if result.get('action') == 'end_lecture':
+        return "lecture_ended"
+    return "ok" if result.get('success') else "rejected"
+
+def simulate_rfid_reader(session):
     """Simulate RFID reader for testing without hardware"""
-    print("🎮 Using simulated RFID reader for testing")
+    log.info(f"🎮 [{session.reader_id}] Using simulated RFID reader for testing")
     simulated_cards = [
         "123456789012",
         "234567890123",
@@ -146,159 +715,2253 @@ def simulate_rfid_reader():
         # Simulate card scan every 10 seconds for testing
         time_module.sleep(10)
 
-        global last_scanned_card
         simulated_card = simulated_cards[card_index]
-        last_scanned_card = simulated_card
-        print(f"🎫 Simulated card scan: {simulated_card}")
-
-        # Call callback function if set
-        if card_scan_callback:
-            card_scan_callback(simulated_card)
+        log.debug("🎮 Simulated scan")
+        dispatch_card_scan(session, simulated_card)
 
         card_index = (card_index + 1) % len(simulated_cards)
 
-def rfid_reading_thread():
-    """Background thread for continuous RFID reading"""
-    global rfid_connected
-
-    print("🔄 Starting RFID reader thread...")
+def rfid_reading_thread(session):
+    """Background thread for continuous RFID reading on one reader"""
+    log.info(f"🔄 [{session.reader_id}] Starting RFID reader thread...")
 
     # Try to setup real RFID reader
-    ser = setup_rfid_reader()
+    ser = setup_rfid_reader(session)
+    reader_attempted(session)
 
-    if not ser:
-        print("❌ No RFID hardware found. Using simulation mode.")
-        rfid_connected = False
-        simulate_rfid_reader()
+    if not ser and not session.configured_port and len(reader_sessions) == 1:
+        log.error("❌ No RFID hardware found. Using simulation mode.")
+        session.mark_disconnected()
+        simulate_rfid_reader(session)
         return
 
-    rfid_connected = True
-    last_card = None
-    last_read_time = 0
-    debounce_time = 2  # seconds between same card reads
-
-    print("✅ RFID reader thread started successfully")
+    debouncer = CardDebouncer()
+    log.info(f"✅ [{session.reader_id}] RFID reader thread started successfully")
 
     while True:
+        ser = session.serial
         try:
-            card_id = read_rfid_card(ser)
-            current_time = time_module.time()
-
-            if card_id and card_id != last_card or (current_time - last_read_time) > debounce_time:
-                last_card = card_id
-                last_read_time = current_time
-
-                print(f"🎫 Card scanned: {card_id}")
-
-                # Store the scanned card globally
-                global last_scanned_card
-                last_scanned_card = card_id
-
-                # Call callback function if set
-                if card_scan_callback:
-                    card_scan_callback(card_id)
-
+            if not ser:
+                raise RuntimeError("reader not connected")
+            rfid_read_loop(session, ser, debouncer)
         except Exception as e:
-            print(f"❌ RFID thread error: {e}")
+            if session.serial is not ser:
+                # The port was swapped through /manual_port; read from the new one
+                continue
+            log.error(f"❌ [{session.reader_id}] RFID thread error: {e}")
+            READER_ERRORS_TOTAL.inc(reader=session.reader_id)
+            session.mark_disconnected()
             # Try to reconnect
             try:
                 ser.close()
             except:
                 pass
-            time_module.sleep(5)
-            ser = setup_rfid_reader()
+            # Retry as soon as a port appears instead of sleeping blindly
+            wait_for_hotplug(RFID_RECONNECT_DELAY)
+            setup_rfid_reader(session)
+
+def rfid_read_loop(session, ser, debouncer=None):
+    """Read frames from an open reader and dispatch accepted cards until the port fails"""
+    framer = EM18Framer()
+    debouncer = debouncer or CardDebouncer()
+
+    while True:
+        for card_id in read_rfid_cards(ser, framer):
+            if debouncer.accept(card_id, time_module.monotonic()):
+                dispatch_card_scan(session, card_id)
+            else:
+                DEBOUNCE_DROPS_TOTAL.inc(reader=session.reader_id)
+
+# ---------------- READER SESSIONS ----------------
+
+class ReaderSession:
+    """One RFID reader (one classroom door) with its own lecture session and scan queue"""
+
+    def __init__(self, reader_id, port=None, room=None, scan_mode=None):
+        self.reader_id = reader_id
+        self.room = room or reader_id  # timetable room this door belongs to
+        self.configured_port = port
+        self.port = None
+        self.serial = None
+        self.connected = False
+        self.scan_queue = deque(maxlen=SCAN_QUEUE_LENGTH)
+        self.scan_mode = None
+        self.card_scan_callback = None
+        self.start_subject = None      # subject picked for the next lecture a teacher tap starts
+        self.register_queue = deque()  # people waiting for a card in a bulk registration session
+        if scan_mode:
+            self.set_scan_mode(scan_mode)
+        # Lecture state is an immutable snapshot: readers take `self.lecture` without
+        # locking, transitions replace it whole under `transition_lock`
+        self.lecture = IDLE_LECTURE
+        self.transition_lock = threading.Lock()
+        self.transition_log = deque(maxlen=TRANSITION_LOG_LENGTH)
+        # Dedup index for the current lecture: card_id -> first scan (date+slot+subject key)
+        self.attendance_key = None
+        self.attendance_index = {}
+        self.attendance_lock = threading.Lock()
+        self.ended_scans = (None, {})  # (lecture key, index) frozen when the last lecture ended
+
+    def attach_serial(self, ser, port):
+        """Switch the session to a newly opened port, closing the previous one"""
+        old = self.serial
+        self.serial = ser
+        self.port = port
+        self.connected = True
+        if old and old is not ser:
+            try:
+                old.close()
+            except Exception:
+                pass
+        publish_event('rfid_status', self.rfid_status(), self.reader_id)
+
+    def mark_disconnected(self):
+        self.connected = False
+        publish_event('rfid_status', self.rfid_status(), self.reader_id)
+
+    def set_scan_mode(self, mode, start_subject=None):
+        """Choose what the reader thread does with each tap (None: only report the card).
+
+        `start_subject` is the subject picked for the lecture the next teacher tap starts.
+        """
+        handler = SCAN_MODE_HANDLERS.get(mode)
+        self.scan_mode = mode if handler else None
+        self.card_scan_callback = handler
+        self.start_subject = start_subject or None
+
+    @property
+    def attendance_enabled(self):
+        return self.lecture.attendance_enabled
+
+    @property
+    def current_teacher_subject(self):
+        return self.lecture.subject
+
+    @property
+    def current_teacher_card(self):
+        return self.lecture.teacher_card
+
+    def transition(self, event, expected, new_state_fn):
+        """Atomically replace the lecture state if it still matches `expected`.
+
+        `expected` is a predicate on the current state; returns (old, new) on success
+        or (current, None) when the transition is not allowed.
+        """
+        with self.transition_lock:
+            old = self.lecture
+            if not expected(old):
+                return old, None
+            new = new_state_fn(old)
+            # Taps check the version under attendance_lock, so none lands in a lecture once it ended
+            with self.attendance_lock:
+                self.lecture = new
+                if old.attendance_enabled and not new.attendance_enabled:
+                    # The roster's copy, kept even if the next lecture starts before it is built
+                    key = lecture_key(old)
+                    self.ended_scans = (key, dict(self.attendance_index) if self.attendance_key == key else {})
+            self.transition_log.append({
+                'at': datetime.now().isoformat(timespec='milliseconds'),
+                'event': event,
+                'from': old.phase,
+                'to': new.phase,
+                'version': new.version,
+                'subject': new.subject or old.subject
+            })
+        publish_event('session', self.session_info(), self.reader_id)
+        return old, new
+
+    def start_lecture(self, teacher_card, subject, slot=None, started_at=None):
+        """idle -> active; returns the new state, or None if a lecture is already running"""
+        started_at = (started_at or datetime.now()).isoformat(timespec='seconds')
+        _, new = self.transition(
+            'start',
+            lambda state: not state.attendance_enabled,
+            lambda state: LectureState(True, teacher_card, subject, slot, started_at, state.version + 1)
+        )
+        return new
+
+    def end_lecture(self, version=None, event='end'):
+        """active -> idle; returns the ended state, or None if it was already ended/replaced"""
+        old, new = self.transition(
+            event,
+            lambda state: state.attendance_enabled and (version is None or state.version == version),
+            lambda state: IDLE_LECTURE._replace(version=state.version + 1)
+        )
+        return old if new else None
+
+    def check_in(self, lecture_key, card_id, scan_time, status, version=None):
+        """Record a student's scan; returns None the first time, else the first-scan entry.
+
+        With `version`, raises LectureEnded unless that lecture is still the running one.
+        """
+        with self.attendance_lock:
+            if version is not None and self.lecture.version != version:
+                raise LectureEnded(f"Lecture {version} has ended")
+            if self.attendance_key != lecture_key:
+                self.attendance_key = lecture_key
+                self.attendance_index = {}
+            entry = self.attendance_index.get(card_id)
+            if entry is None:
+                self.attendance_index[card_id] = {'time': scan_time, 'status': status, 'retaps': 0}
+                return None
+            entry['retaps'] += 1
+            return entry
+
+    def undo_check_in(self, lecture_key, card_id):
+        """Forget a first scan that could not be journaled"""
+        with self.attendance_lock:
+            if self.attendance_key == lecture_key:
+                self.attendance_index.pop(card_id, None)
+
+    def lecture_scans(self, key):
+        """card_id -> first scan of the lecture with dedup key `key`: as frozen when it ended, else the live index"""
+        with self.attendance_lock:
+            if self.ended_scans[0] == key:
+                return dict(self.ended_scans[1])
+            if self.attendance_key == key:
+                return dict(self.attendance_index)
+        return {}
+
+    def seed_attendance_index(self, lecture_key):
+        """Rebuild the dedup index from the journal (e.g. a lecture restarted after a reboot)"""
+        date, slot, subject = lecture_key
+        index = {}
+        for payload in read_journal_payloads("mark_attendance", date):
+            if (payload.get("reader") == self.reader_id and payload.get("lecture_slot") == slot
+                    and payload.get("subject") == subject and payload.get("date") == date):
+                entry = index.get(payload["card_id"])
+                if entry:
+                    entry['retaps'] += 1
+                else:
+                    index[payload["card_id"]] = {'time': payload["time"], 'status': payload["status"], 'retaps': 0}
+        with self.attendance_lock:
+            self.attendance_key = lecture_key
+            self.attendance_index = index
+        return len(index)
+
+    def rfid_status(self):
+        return {'reader': self.reader_id, 'rfid_connected': self.connected}
+
+    def session_info(self):
+        lecture = self.lecture
+        return {
+            'reader': self.reader_id,
+            'attendance_enabled': lecture.attendance_enabled,
+            'current_subject': lecture.subject,
+            'current_lecture_slot': get_lecture_slot(room=self.room),
+            'marked_count': len(self.attendance_index) if lecture.attendance_enabled else 0,
+            'scan_mode': self.scan_mode,
+            'register_pending': len(self.register_queue)
+        }
 
-        time_module.sleep(0.1)  # Small delay to prevent excessive CPU usage
+    def status(self):
+        lecture = self.lecture
+        return {
+            'reader': self.reader_id,
+            'port': self.port or self.configured_port,
+            'rfid_connected': self.connected,
+            'attendance_enabled': lecture.attendance_enabled,
+            'current_subject': lecture.subject,
+            'scan_mode': self.scan_mode
+        }
 
-# ---------------- EXISTING FUNCTIONS ----------------
+LectureState = namedtuple("LectureState", "attendance_enabled teacher_card subject slot started_at version")
+LectureState.phase = property(lambda state: 'active' if state.attendance_enabled else 'idle')
+IDLE_LECTURE = LectureState(False, None, None, None, None, 0)
 
-def get_lecture_slot():
-    """Get current lecture slot based on time"""
-    now = datetime.now().time()
-    for slot_num, slot_info in LECTURE_SLOTS.items():
-        if slot_info["start"] <= now <= slot_info["end"]:
-            return slot_num
-    return None
+class LectureEnded(Exception):
+    """A tap read the lecture just before it ended; it must not be marked"""
 
-def get_student_status():
-    """Determine if student is On-time or Late"""
-    now = datetime.now()
-    current_slot = get_lecture_slot()
-    if not current_slot:
-        return "Invalid Time"
+def lecture_key(lecture):
+    """Dedup key of a running lecture: fixed when it starts, so it lasts exactly as long as the lecture"""
+    return (lecture.started_at[:10], lecture.slot, lecture.subject)
 
-    slot_start = LECTURE_SLOTS[current_slot]["start"]
-    grace_end_minutes = slot_start.minute + 15
-    grace_end_hours = slot_start.hour
-    if grace_end_minutes >= 60:
-        grace_end_hours += 1
-        grace_end_minutes -= 60
-    grace_period_end = time(grace_end_hours, grace_end_minutes)
+def register_reader(reader_id, port=None, room=None, scan_mode=None):
+    """Add a reader to the session registry (idempotent)"""
+    with reader_sessions_lock:
+        session = reader_sessions.get(reader_id)
+        if not session:
+            session = ReaderSession(reader_id, port, room, scan_mode or DEFAULT_SCAN_MODE)
+            reader_sessions[reader_id] = session
+        return session
+
+def load_reader_config():
+    """Create one session per configured reader, or a single auto-detected one"""
+    try:
+        with open(READERS_CONFIG_PATH, encoding="utf-8") as f:
+            readers = json.load(f)
+    except FileNotFoundError:
+        readers = []
+    except Exception as e:
+        log.warning(f"⚠️ Error reading {READERS_CONFIG_PATH}: {e}")
+        readers = []
+
+    for reader in readers:
+        register_reader(str(reader["id"]), reader.get("port"), reader.get("room"), reader.get("scan_mode"))
+    if not reader_sessions:
+        register_reader(DEFAULT_READER_ID)
+    log.info(f"✅ Serving {len(reader_sessions)} reader(s): {', '.join(reader_sessions)}")
+
+def get_reader_session(reader_id=None):
+    """Look up a reader session; the only/default reader is used when no id is given"""
+    with reader_sessions_lock:
+        if reader_id:
+            return reader_sessions.get(reader_id)
+        if not reader_sessions:
+            reader_sessions[DEFAULT_READER_ID] = ReaderSession(DEFAULT_READER_ID, scan_mode=DEFAULT_SCAN_MODE)
+        session = reader_sessions.get(DEFAULT_READER_ID)
+        if not session and len(reader_sessions) == 1:
+            session = next(iter(reader_sessions.values()))
+        return session
+
+def start_reader_threads():
+    for session in list(reader_sessions.values()):
+        threading.Thread(target=rfid_reading_thread, args=(session,), daemon=True, name=f"reader-{session.reader_id}").start()
+
+# ---------------- LECTURE TIMETABLE ----------------
+
+LectureSlot = namedtuple("LectureSlot", "number start end grace_end subject", defaults=(None,))
+
+def seconds_of_day(t):
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+
+def parse_clock(value):
+    """'HH:MM' or 'HH:MM:SS' -> seconds since midnight"""
+    parts = [int(p) for p in value.split(":")]
+    return seconds_of_day(time(*parts))
+
+class DayTimetable:
+    """One day's slots for one room, sorted by start for bisect lookup"""
+
+    def __init__(self, slots, grace_minutes):
+        compiled = sorted(
+            (LectureSlot(number, start, end, min(start + grace_minutes * 60, end), subject)
+             for number, (start, end, subject) in slots.items()),
+            key=lambda slot: slot.start
+        )
+        for earlier, later in zip(compiled, compiled[1:]):
+            if later.start <= earlier.end:
+                log.warning(f"⚠️ Lecture slots {earlier.number} and {later.number} overlap; slot {later.number} wins")
+        self.slots = compiled
+        self.starts = [slot.start for slot in compiled]
+        self.by_number = {slot.number: slot for slot in compiled}
+
+    def lookup(self, seconds):
+        index = bisect_right(self.starts, seconds) - 1
+        if index >= 0 and seconds <= self.slots[index].end:
+            return self.slots[index]
+        return None
 
-    if slot_start <= now.time() <= grace_period_end:
+class Timetable:
+    """Compiled timetable: one DayTimetable per (room, weekday)"""
+
+    def __init__(self, config):
+        grace_minutes = config.get("grace_minutes", GRACE_MINUTES)
+        default_day = self.compile_layer(config, {}, grace_minutes)
+        self.default = default_day
+        self.rooms = {}
+        for room, room_config in config.get("rooms", {}).items():
+            self.rooms[room] = self.compile_layer(room_config, default_day, grace_minutes)
+
+    @staticmethod
+    def compile_layer(config, inherited, grace_minutes):
+        """Build the 7 weekday tables for one layer, inheriting unset days"""
+        base_slots = config.get("slots")
+        weekdays = config.get("weekdays", {})
+        days = {}
+        for weekday, name in enumerate(WEEKDAYS):
+            slots = weekdays.get(name, base_slots)
+            if slots is None:
+                days[weekday] = inherited[weekday]
+            else:
+                days[weekday] = DayTimetable(
+                    # [start, end] or [start, end, subject]: the subject taught in that slot
+                    {int(number): (parse_clock(spec[0]), parse_clock(spec[1]), spec[2] if len(spec) > 2 else None)
+                     for number, spec in slots.items()},
+                    grace_minutes
+                )
+        return days
+
+    def lookup(self, now, room=None):
+        days = self.rooms.get(room, self.default)
+        return days[now.weekday()].lookup(seconds_of_day(now))
+
+    def slot(self, number, day, room=None):
+        """Slot `number` as timetabled on `day` in `room`, or None"""
+        days = self.rooms.get(room, self.default)
+        return days[day.weekday()].by_number.get(number)
+
+def lecture_slots_config():
+    """LECTURE_SLOTS in timetable.json form"""
+    return {
+        "grace_minutes": GRACE_MINUTES,
+        "slots": {
+            str(number): [info["start"].strftime("%H:%M:%S"), info["end"].strftime("%H:%M:%S")]
+            for number, info in LECTURE_SLOTS.items()
+        }
+    }
+
+def load_timetable():
+    """Compile timetable.json (or LECTURE_SLOTS) and swap it in"""
+    global TIMETABLE
+    try:
+        with open(TIMETABLE_PATH, encoding="utf-8") as f:
+            config = json.load(f)
+        config.setdefault("slots", lecture_slots_config()["slots"])
+        TIMETABLE = Timetable(config)
+        log.info(f"✅ Loaded timetable from {TIMETABLE_PATH} ({len(TIMETABLE.rooms)} room overrides)")
+    except FileNotFoundError:
+        TIMETABLE = Timetable(lecture_slots_config())
+    except Exception as e:
+        log.warning(f"⚠️ Error reading {TIMETABLE_PATH}, using default slots: {e}")
+        TIMETABLE = Timetable(lecture_slots_config())
+
+TIMETABLE = Timetable(lecture_slots_config())
+
+def lookup_lecture_slot(now=None, room=None):
+    """LectureSlot active at `now` in `room`, or None"""
+    return TIMETABLE.lookup(now or datetime.now(), room)
+
+def get_lecture_slot(now=None, room=None):
+    """Get current lecture slot based on time"""
+    slot = lookup_lecture_slot(now, room)
+    return slot.number if slot else None
+
+def running_lecture_slot(lecture, room=None):
+    """LectureSlot the running lecture was started in (its times, even after the slot is over)"""
+    return TIMETABLE.slot(lecture.slot, datetime.fromisoformat(lecture.started_at), room)
+
+def get_student_status(now=None, room=None, slot=None):
+    """Determine if student is On-time or Late (pass `slot` if it is already known)"""
+    now = now or datetime.now()
+    slot = slot or lookup_lecture_slot(now, room)
+    if not slot:
+        return "Invalid Time"
+
+    if seconds_of_day(now) <= slot.grace_end:
         return "On-time"
     else:
         return "Late"
 
-def send_to_google_sheet(role, data, register_only=False):
+def build_sheet_payload(role, data, register_only=False):
+    """Build the JSON payload understood by the Apps Script doPost"""
     payload = data.copy()
     payload["role"] = role
     if register_only:
         payload["register_only"] = True
+    return payload
+
+def send_to_google_sheet(role, data, register_only=False):
+    payload = build_sheet_payload(role, data, register_only)
 
     try:
-        response = requests.post(WEB_APP_URL, data=json.dumps(payload))
+        response = backend_request("POST", data=json.dumps(payload))
         if response.status_code == 200:
-            print("✅ Data sent successfully!")
+            log.debug("✅ Data sent successfully!")
             return True
         else:
-            print(f"❌ Failed to send data ({response.status_code})")
+            log.error(f"❌ Failed to send data ({response.status_code})")
             return False
     except Exception as e:
-        print(f"⚠️ Error: {e}")
+        log.warning(f"⚠️ Error: {e}")
         return False
 
-def preload_registered_users():
-    global REGISTERED_USERS
-    try:
-        response = requests.get(WEB_APP_URL + "?tab=Register", timeout=10)
-        if response.status_code != 200:
-            print("❌ Failed to fetch registered users")
+# ---------------- APPS SCRIPT CLIENT ----------------
+
+class BackendUnavailable(Exception):
+    """Raised without touching the network while the circuit breaker is open"""
+
+def get_backend_session():
+    """Shared keep-alive session (script.google.com plus its googleusercontent redirect)"""
+    global backend_session
+    with backend_lock:
+        if backend_session is None:
+            # requests is imported here rather than at startup, which it would slow down
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            backend_session = session
+        return backend_session
+
+def count_backend_connections(session):
+    """Total connections ever opened by the session's pools (grows on each TLS handshake)"""
+    total = 0
+    for adapter in session.adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool:
+                total += pool.num_connections
+    return total
+
+def backend_backoff(attempt, response=None):
+    """Exponential backoff with full jitter, honouring Retry-After on 429"""
+    if response is not None and response.headers.get("Retry-After", "").isdigit():
+        return min(int(response.headers["Retry-After"]), BACKEND_BACKOFF_MAX)
+    return random.uniform(0, min(BACKEND_BACKOFF_MAX, BACKEND_BACKOFF_BASE * 2 ** attempt))
+
+def backend_request(method, params=None, data=None):
+    """Call the Apps Script web app (or the building aggregator) with pooling, timeouts, retries and a circuit breaker"""
+    with backend_lock:
+        if time_module.time() < backend_stats['circuit_open_until']:
+            backend_stats['fast_failures'] += 1
+            BACKEND_REQUESTS_TOTAL.inc(method=method, outcome="fast_fail")
+            raise BackendUnavailable("Apps Script backend marked down, failing fast")
+
+    session = get_backend_session()
+    import requests  # already loaded by get_backend_session
+    started = time_module.perf_counter()
+    connections_before = count_backend_connections(session)
+    response = None
+    error = None
+    attempt = 0
+
+    url = f"{AGGREGATOR_URL.rstrip('/')}/aggregator/exec" if AGGREGATOR_URL else WEB_APP_URL
+    headers = {AGGREGATOR_KEY_HEADER: AGGREGATOR_KEY} if AGGREGATOR_URL else None
+    while True:
+        try:
+            response = session.request(method, url, params=params, data=data, headers=headers,
+                                       timeout=(BACKEND_CONNECT_TIMEOUT, BACKEND_READ_TIMEOUT))
+            error = None
+            if response.status_code not in BACKEND_RETRY_STATUSES:
+                break
+            error = RuntimeError(f"HTTP {response.status_code}")
+        except requests.exceptions.ReadTimeout as e:
+            error = e
+            if method != "GET":
+                # The script may already have written the rows; let the caller decide
+                break
+            response = None
+        except requests.exceptions.RequestException as e:
+            error = e
+            response = None
+
+        if attempt >= BACKEND_MAX_RETRIES:
+            break
+        with backend_lock:
+            backend_stats['retries'] += 1
+        BACKEND_RETRIES_TOTAL.inc()
+        time_module.sleep(backend_backoff(attempt, response))
+        attempt += 1
+
+    record_backend_call(method, started, connections_before, session, response, error, attempt + 1)
+    if error:
+        raise error
+    return response
+
+def record_backend_call(method, started, connections_before, session, response, error, attempts):
+    """Update breaker state and timing metrics for one backend call"""
+    total_ms = (time_module.perf_counter() - started) * 1000
+    BACKEND_SECONDS.observe(total_ms / 1000, method=method)
+    BACKEND_REQUESTS_TOTAL.inc(method=method, outcome="error" if error else "ok")
+    new_connections = count_backend_connections(session) - connections_before
+    call = {
+        'at': datetime.now().strftime("%H:%M:%S"),
+        'method': method,
+        'status': response.status_code if response is not None else None,
+        'attempts': attempts,
+        'total_ms': round(total_ms, 1),
+        'new_connections': new_connections,
+        'error': str(error) if error else None
+    }
+    if response is not None:
+        # First hop runs the script; the redirect hop only fetches its output
+        hops = list(response.history) + [response]
+        call['script_ms'] = round(hops[0].elapsed.total_seconds() * 1000, 1)
+        call['redirect_ms'] = round(sum(h.elapsed.total_seconds() for h in hops[1:]) * 1000, 1)
+
+    with backend_lock:
+        backend_stats['calls'] += 1
+        if error:
+            backend_stats['failed_calls'] += 1
+            backend_stats['consecutive_failures'] += 1
+            if backend_stats['consecutive_failures'] >= BACKEND_BREAKER_THRESHOLD:
+                backend_stats['circuit_open_until'] = time_module.time() + BACKEND_BREAKER_COOLDOWN
+                log.warning(f"🚫 Apps Script backend down, failing fast for {BACKEND_BREAKER_COOLDOWN}s")
+        else:
+            backend_stats['consecutive_failures'] = 0
+            backend_stats['circuit_open_until'] = 0
+        kind = 'cold' if new_connections else 'warm'
+        backend_stats[f'{kind}_calls'] += 1
+        backend_stats[f'{kind}_total_ms'] += total_ms
+        backend_recent_calls.append(call)
+
+def backend_client_status():
+    """Backend call counters, circuit state and cold vs. warm connection timings"""
+    with backend_lock:
+        stats = dict(backend_stats)
+        recent = list(backend_recent_calls)
+    open_for = stats.pop('circuit_open_until') - time_module.time()
+    cold_total = stats.pop('cold_total_ms')
+    warm_total = stats.pop('warm_total_ms')
+    stats['circuit_open'] = open_for > 0
+    stats['circuit_open_for_s'] = round(max(open_for, 0), 1)
+    stats['avg_cold_ms'] = round(cold_total / stats['cold_calls'], 1) if stats['cold_calls'] else None
+    stats['avg_warm_ms'] = round(warm_total / stats['warm_calls'], 1) if stats['warm_calls'] else None
+    stats['recent_calls'] = recent
+    return stats
+
+def fetch_sheet_page(tab, offset, fields, page_size, filters):
+    """One doGet page (a list from script deployments without paging)"""
+    params = {"tab": tab, "offset": offset, "limit": page_size}
+    if fields:
+        params["fields"] = ",".join(fields)
+    params.update({name: value for name, value in filters.items() if value is not None})
+
+    response = backend_request("GET", params=params)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    result = response.json()
+    if isinstance(result, dict) and "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+def iter_sheet_pages(tab, offset=0, fields=None, page_size=SHEET_PAGE_SIZE, parallel=1, **filters):
+    """Stream a tab from the Apps Script one page at a time.
+
+    `offset` is the 0-based data row to start at; `fields` projects columns and
+    `filters` (date, from, to, subject, card_id) are applied by the script. Each
+    page is a dict with `rows`, `next_offset`, `total_rows` and `last_row`; only
+    one page is held in memory, and nothing is fetched until the caller iterates.
+    With `parallel` > 1 the first page's total_rows is used to keep that many
+    later pages in flight at once; they are still yielded in order.
+    """
+    result = fetch_sheet_page(tab, offset, fields, page_size, filters)
+    if isinstance(result, list):
+        # Script deployment without paging returns the whole tab (unfiltered)
+        yield {"rows": result[offset:], "next_offset": None, "total_rows": len(result),
+               "last_row": len(result) + 1}
+        return
+    yield result
+
+    if parallel > 1 and result.get("next_offset") is not None:
+        # Pages cover fixed windows of sheet rows, so every later offset is known up front
+        offsets = deque(range(result["next_offset"], result["total_rows"], page_size))
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            in_flight = deque()
+            while offsets or in_flight:
+                while offsets and len(in_flight) < parallel:
+                    in_flight.append(pool.submit(fetch_sheet_page, tab, offsets.popleft(), fields, page_size, filters))
+                result = in_flight.popleft().result()
+                yield result
+
+    # Sequentially from here (and for whatever was appended while the pages were in flight)
+    while result.get("next_offset") is not None:
+        result = fetch_sheet_page(tab, result["next_offset"], fields, page_size, filters)
+        yield result
+
+def iter_sheet_rows(tab, offset=0, fields=None, page_size=SHEET_PAGE_SIZE, **filters):
+    """Rows of a tab, fetched lazily page by page (see iter_sheet_pages)"""
+    for page in iter_sheet_pages(tab, offset, fields, page_size, **filters):
+        yield from page["rows"]
+
+# ---------------- ATTENDANCE JOURNAL ----------------
+
+def get_journal():
+    """Open (once) the local SQLite journal in WAL mode"""
+    global journal_conn
+    with journal_lock:
+        if journal_conn is None:
+            conn = sqlite3.connect(JOURNAL_DB_PATH, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={JOURNAL_SYNCHRONOUS}")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recorded_at TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS register_conflicts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    detected_at TEXT NOT NULL,
+                    card_id TEXT NOT NULL,
+                    local TEXT NOT NULL,
+                    sheet TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS client_events (
+                    event_id TEXT PRIMARY KEY,
+                    received_at TEXT NOT NULL,
+                    result TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS events_recorded_at ON events (recorded_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS client_events_received_at ON client_events (received_at)")
+            conn.execute("INSERT OR IGNORE INTO sync_state (name, value) VALUES ('sheet_cursor', 0)")
+            # Random per journal file, so event ids forwarded to an aggregator stay unique if the file is recreated
+            conn.execute("INSERT OR IGNORE INTO sync_state (name, value) VALUES ('journal_id', ?)",
+                         (random.getrandbits(62),))
+            journal_conn = conn
+            log.info(f"✅ Attendance journal ready: {JOURNAL_DB_PATH}")
+        return journal_conn
+
+def journal_event(kind, role, data, register_only=False):
+    """Commit an attendance event to the local journal and wake the uploader"""
+    payload = build_sheet_payload(role, data, register_only)
+    conn = get_journal()
+    with journal_lock:
+        cursor = conn.execute(
+            "INSERT INTO events (recorded_at, kind, payload) VALUES (?, ?, ?)",
+            (datetime.now().isoformat(timespec='milliseconds'), kind, json.dumps(payload))
+        )
+    upload_wakeup.set()
+    return cursor.lastrowid
+
+def journal_events(kind, rows, register_only=False):
+    """Commit several events (each row carries its own role) in one transaction and wake the uploader"""
+    recorded_at = datetime.now().isoformat(timespec='milliseconds')
+    values = [(recorded_at, kind, json.dumps(build_sheet_payload(row["role"], row, register_only))) for row in rows]
+    conn = get_journal()
+    with journal_lock:
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("INSERT INTO events (recorded_at, kind, payload) VALUES (?, ?, ?)", values)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    upload_wakeup.set()
+
+def read_client_results(event_ids):
+    """Stored results of client event ids that were already processed: event_id -> result"""
+    conn = get_journal()
+    event_ids = list(event_ids)
+    found = {}
+    with journal_lock:
+        # Chunked to stay under SQLite's bound-parameter limit
+        for start in range(0, len(event_ids), 500):
+            chunk = event_ids[start:start + 500]
+            found.update(conn.execute(
+                f"SELECT event_id, result FROM client_events WHERE event_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ).fetchall())
+    return {event_id: json.loads(result) for event_id, result in found.items()}
+
+def journal_client_events(kind, rows, results):
+    """Journal `rows` and remember each client event's result in the same transaction.
+
+    `results` maps event_id -> result dict; a retry of any of them is answered from it.
+    """
+    now = datetime.now()
+    recorded_at = now.isoformat(timespec='milliseconds')
+    prune_before = (now - timedelta(days=CLIENT_EVENT_RETENTION_DAYS)).isoformat(timespec='milliseconds')
+    conn = get_journal()
+    with journal_lock:
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT INTO events (recorded_at, kind, payload) VALUES (?, ?, ?)",
+                [(recorded_at, kind, json.dumps(build_sheet_payload(row["role"], row))) for row in rows]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO client_events (event_id, received_at, result) VALUES (?, ?, ?)",
+                [(event_id, recorded_at, json.dumps(result)) for event_id, result in results.items()]
+            )
+            conn.execute("DELETE FROM client_events WHERE received_at < ?", (prune_before,))
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    if rows:
+        upload_wakeup.set()
+
+def read_journal_payloads(kind, since_date):
+    """Payloads of `kind` events journaled on or after `since_date` (YYYY-MM-DD)"""
+    conn = get_journal()
+    with journal_lock:
+        rows = conn.execute(
+            "SELECT payload FROM events WHERE recorded_at >= ? AND kind = ? ORDER BY id",
+            (since_date, kind)
+        ).fetchall()
+    return [json.loads(payload) for (payload,) in rows]
+
+def read_journal_events(kinds, after_id):
+    """(id, kind, payload) of every `kinds` event journaled after `after_id`, oldest first"""
+    conn = get_journal()
+    placeholders = ", ".join("?" * len(kinds))
+    with journal_lock:
+        return conn.execute(
+            f"SELECT id, kind, payload FROM events WHERE id > ? AND kind IN ({placeholders}) ORDER BY id",
+            (after_id, *kinds)
+        ).fetchall()
+
+def get_sync_cursor():
+    """Id of the last journal event confirmed by the sheet"""
+    conn = get_journal()
+    with journal_lock:
+        row = conn.execute("SELECT value FROM sync_state WHERE name = 'sheet_cursor'").fetchone()
+    return row[0]
+
+def get_journal_id():
+    conn = get_journal()
+    with journal_lock:
+        return conn.execute("SELECT value FROM sync_state WHERE name = 'journal_id'").fetchone()[0]
+
+def read_unsynced_events(limit):
+    """Fetch up to `limit` (id, kind, payload) journal events the sheet has not seen yet"""
+    conn = get_journal()
+    with journal_lock:
+        return conn.execute(
+            "SELECT id, kind, payload FROM events "
+            "WHERE id > (SELECT value FROM sync_state WHERE name = 'sheet_cursor') "
+            "ORDER BY id LIMIT ?",
+            (limit,)
+        ).fetchall()
+
+def advance_sync_cursor(event_id):
+    """Record that every event up to `event_id` reached the sheet"""
+    conn = get_journal()
+    with journal_lock:
+        conn.execute("UPDATE sync_state SET value = ? WHERE name = 'sheet_cursor' AND value < ?", (event_id, event_id))
+
+def count_unsynced_events():
+    conn = get_journal()
+    with journal_lock:
+        return conn.execute(
+            "SELECT COUNT(*) FROM events "
+            "WHERE id > (SELECT value FROM sync_state WHERE name = 'sheet_cursor')"
+        ).fetchone()[0]
+
+# ---------------- SHEET SYNC ----------------
+
+def post_sheet_batch(rows):
+    """POST several rows (or an aggregator body) to the backend in a single request"""
+    response = backend_request("POST", data=json.dumps(rows if isinstance(rows, dict) else {"batch": rows}))
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    result = response.json()
+    if not result.get("success"):
+        raise RuntimeError(result.get("error") or result.get("message") or "Batch rejected")
+    return result
+
+def journal_event_uid(journal_id, event_id):
+    """Id of a journal event that stays unique across kiosks and recreated journal files"""
+    return f"{KIOSK_ID}/{journal_id}/{event_id}"
+
+def upload_journal_batch(events):
+    """POST journal events to the sheet; each row carries its event id, so a resent batch adds no rows"""
+    journal_id = get_journal_id()
+    return post_sheet_batch([dict(json.loads(payload), event_id=journal_event_uid(journal_id, event_id))
+                             for event_id, _, payload in events])
+
+def forward_journal_batch(events):
+    """POST journal events to the building aggregator; it answers once they are in its own journal"""
+    journal_id = get_journal_id()
+    body = {"kiosk": KIOSK_ID, "events": [
+        {"id": journal_event_uid(journal_id, event_id), "kind": kind, "row": json.loads(payload)}
+        for event_id, kind, payload in events
+    ]}
+    return post_sheet_batch(body)
+
+def upload_flusher_thread():
+    """Background thread that replays unsynced journal events to the sheet in batches"""
+    log.info("🔄 Starting upload flusher thread...")
+
+    while True:
+        events = read_unsynced_events(UPLOAD_BATCH_SIZE)
+        if not events:
+            # Sleep until a new event is journaled (or recheck periodically)
+            upload_wakeup.wait(UPLOAD_IDLE_RECHECK)
+            upload_wakeup.clear()
+            continue
+
+        if len(events) < UPLOAD_BATCH_SIZE:
+            # Give the rush a moment to pile up so we send fewer, bigger batches
+            time_module.sleep(UPLOAD_LINGER)
+            events = read_unsynced_events(UPLOAD_BATCH_SIZE)
+
+        started = time_module.time()
+        try:
+            result = forward_journal_batch(events) if AGGREGATOR_URL else upload_journal_batch(events)
+        except Exception as e:
+            log.warning(f"⚠️ Batch upload of {len(events)} rows failed: {e}")
+            UPLOAD_BATCHES_TOTAL.inc(outcome="failed")
+            with upload_stats_lock:
+                upload_stats['failed_batches'] += 1
+                upload_stats['last_error'] = str(e)
+            # Rows stay in the journal; the cursor only moves on success
+            time_module.sleep(UPLOAD_RETRY_DELAY)
+            continue
+
+        advance_sync_cursor(events[-1][0])
+        if result.get("conflicts"):
+            record_register_conflicts(result["conflicts"])
+        latency_ms = round((time_module.time() - started) * 1000, 1)
+        with upload_stats_lock:
+            upload_stats['rows_sent'] += len(events)
+            upload_stats['batches_sent'] += 1
+            upload_stats['last_batch_size'] = len(events)
+            upload_stats['last_flush_latency_ms'] = latency_ms
+            upload_stats['max_flush_latency_ms'] = max(upload_stats['max_flush_latency_ms'] or 0, latency_ms)
+            upload_stats['last_flush_at'] = datetime.now().strftime("%H:%M:%S")
+            upload_stats['last_error'] = None
+        UPLOAD_BATCHES_TOTAL.inc(outcome="ok")
+        UPLOAD_ROWS_TOTAL.inc(len(events))
+        log.debug("✅ Uploaded batch of %d rows in %s ms", len(events), latency_ms)
+
+def get_upload_queue_status():
+    """Snapshot of the upload backlog and flush statistics"""
+    with upload_stats_lock:
+        status = dict(upload_stats)
+    status['queue_depth'] = count_unsynced_events()
+    status['sync_cursor'] = get_sync_cursor()
+    return status
+
+# ---------------- BUILDING AGGREGATOR ----------------
+
+def accept_forwarded_events(kiosk, events):
+    """Journal events a kiosk forwarded, skipping ids already journaled; returns (accepted, duplicates).
+
+    Readers are renamed `<kiosk>:<reader>` so rooms with the same reader id stay apart here.
+    """
+    with forwarded_events_lock:
+        seen = read_client_results(event["id"] for event in events)
+        groups = {}
+        for event in events:
+            if event["id"] in seen:
+                continue
+            seen[event["id"]] = None
+            row = dict(event["row"])
+            if row.get("reader"):
+                row["reader"] = f"{kiosk}:{row['reader']}"
+            groups.setdefault(event["kind"], []).append((event["id"], row))
+        for kind, group in groups.items():
+            journal_client_events(kind, [row for _, row in group],
+                                  {event_id: {"status": "journaled", "kiosk": kiosk} for event_id, _ in group})
+    accepted = sum(len(group) for group in groups.values())
+    AGGREGATOR_EVENTS_TOTAL.inc(accepted, kiosk=kiosk, outcome="accepted")
+    AGGREGATOR_EVENTS_TOTAL.inc(len(events) - accepted, kiosk=kiosk, outcome="duplicate")
+    return accepted, len(events) - accepted
+
+def update_register_mirror(rows, generation, complete):
+    """Fold a Register fetch into the copy served to kiosks"""
+    with register_mirror_lock:
+        current = register_mirror['rows']
+        if complete:
+            # Kiosks only need a full reload if rows they already have changed
+            appended = (generation == register_mirror['sheet_generation'] and len(rows) >= len(current)
+                        and rows[:len(current)] == current)
+            if not appended:
+                register_mirror['epoch'] += 1
+            register_mirror['rows'] = rows
+            register_mirror['ready'] = True
+        elif rows:
+            # A new list, so pages being served from the old one are unaffected
+            register_mirror['rows'] = current + rows
+        register_mirror['sheet_generation'] = generation
+
+def register_mirror_page(offset, limit):
+    """One page of the mirrored Register tab, shaped like the Apps Script's doGet page"""
+    with register_mirror_lock:
+        rows = register_mirror['rows']
+        generation = f"{AGGREGATOR_INSTANCE}.{register_mirror['epoch']}"
+    total = len(rows)
+    end = min(offset + limit, total)
+    return {"rows": rows[offset:end], "offset": offset, "next_offset": end if end < total else None,
+            "total_rows": total, "last_row": total + 1, "generation": generation}
+
+# ---------------- ATTENDANCE REPORTS ----------------
+
+class AttendanceColumns:
+    """Columnar copy of the journal's attendance log for fast aggregation.
+
+    Each lecture (date, slot, subject) gets a code with day/slot/subject columns
+    and running present/late rollups, plus the roster size journaled when it
+    ended (-1 before rosters existed); each first scan of a student in a lecture
+    is one (student, lecture, late) row. New journal events are folded in
+    incrementally, and the arrays are snapshotted to REPORTS_SNAPSHOT_PATH so a
+    restart does not re-parse the whole semester.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_event_id = 0
+        self.saved_event_id = 0
+        self.students = []        # code -> [card_id, name, roll_no]
+        self.student_codes = {}
+        self.subjects = []        # code -> subject name
+        self.subject_codes = {}
+        self.lecture_codes = {}   # (day ordinal, slot, subject code) -> lecture code
+        self.lecture_day = np.zeros(0, np.int32)
+        self.lecture_slot = np.zeros(0, np.int32)
+        self.lecture_subject = np.zeros(0, np.int32)
+        self.lecture_present = np.zeros(0, np.int64)   # rollup: distinct students per lecture
+        self.lecture_late = np.zeros(0, np.int64)
+        self.lecture_expected = np.zeros(0, np.int64)  # roster size, -1 when no roster was journaled
+        self.scan_student = np.zeros(0, np.int32)
+        self.scan_lecture = np.zeros(0, np.int32)
+        self.scan_late = np.zeros(0, np.bool_)
+        self.scan_pairs = np.zeros(0, np.int64)        # sorted student << 32 | lecture, for dedup
+
+    def code(self, codes, values, key, value):
+        code = codes.get(key)
+        if code is None:
+            code = codes[key] = len(values)
+            values.append(value)
+        return code
+
+    def lecture_code(self, day, slot, subject, new_lectures):
+        key = (day, slot, self.code(self.subject_codes, self.subjects, subject, subject))
+        code = self.lecture_codes.get(key)
+        if code is None:
+            code = self.lecture_codes[key] = len(self.lecture_codes)
+            new_lectures.append(key)
+        return code
+
+    def refresh(self):
+        """Fold journal events recorded since the last refresh into the columns"""
+        with self.lock:
+            events = read_journal_events(("start_attendance", "mark_attendance", "lecture_roster"), self.last_event_id)
+            if not events:
+                return 0
+
+            day_cache = {}
+            new_lectures = []
+            students, lectures, late = [], [], []
+            rosters = {}  # lecture code -> roster size; a lecture restarted and ended again keeps the last
+            for _, kind, payload in events:
+                row = json.loads(payload)
+                date = row.get("date")
+                day = day_cache.get(date)
+                if day is None:
+                    day = day_cache[date] = datetime.strptime(date, "%Y-%m-%d").toordinal()
+                slot = row.get("lecture_slot")
+                lecture = self.lecture_code(day, -1 if slot is None else int(slot), row.get("subject") or "-",
+                                            new_lectures)
+                if kind == "mark_attendance":
+                    card_id = row["card_id"]
+                    students.append(self.code(self.student_codes, self.students, card_id,
+                                              [card_id, row.get("name"), row.get("roll_no")]))
+                    lectures.append(lecture)
+                    late.append(row.get("status") == "Late")
+                elif kind == "lecture_roster":
+                    rosters[lecture] = len(row.get("roster") or ())
+
+            if new_lectures:
+                days, slots, subjects = (np.array(column, np.int32) for column in zip(*new_lectures))
+                self.lecture_day = np.concatenate([self.lecture_day, days])
+                self.lecture_slot = np.concatenate([self.lecture_slot, slots])
+                self.lecture_subject = np.concatenate([self.lecture_subject, subjects])
+                padding = np.zeros(len(new_lectures), np.int64)
+                self.lecture_present = np.concatenate([self.lecture_present, padding])
+                self.lecture_late = np.concatenate([self.lecture_late, padding])
+                self.lecture_expected = np.concatenate([self.lecture_expected, np.full(len(new_lectures), -1, np.int64)])
+
+            if rosters:
+                expected = self.lecture_expected.copy()  # replaced, never mutated (see columns())
+                expected[list(rosters)] = list(rosters.values())
+                self.lecture_expected = expected
+
+            if students:
+                students = np.array(students, np.int32)
+                lectures = np.array(lectures, np.int32)
+                late = np.array(late, np.bool_)
+                # A student seen at two doors of the same lecture counts once
+                pairs = (students.astype(np.int64) << 32) | lectures
+                pairs, first = np.unique(pairs, return_index=True)
+                position = np.searchsorted(self.scan_pairs, pairs)
+                known = position < len(self.scan_pairs)
+                known[known] = self.scan_pairs[position[known]] == pairs[known]
+                keep = first[~known]
+                students, lectures, late = students[keep], lectures[keep], late[keep]
+                self.scan_pairs = np.insert(self.scan_pairs, position[~known], pairs[~known])
+
+                self.scan_student = np.concatenate([self.scan_student, students])
+                self.scan_lecture = np.concatenate([self.scan_lecture, lectures])
+                self.scan_late = np.concatenate([self.scan_late, late])
+                self.lecture_present = self.lecture_present + np.bincount(lectures, minlength=len(self.lecture_present))
+                self.lecture_late = self.lecture_late + np.bincount(lectures[late], minlength=len(self.lecture_late))
+
+            self.last_event_id = events[-1][0]
+            if self.last_event_id - self.saved_event_id >= REPORTS_SNAPSHOT_EVERY:
+                self.save_snapshot()
+            return len(events)
+
+    def save_snapshot(self):
+        """Write the columns atomically (temp file, then rename); caller holds `self.lock`"""
+        meta = json.dumps({
+            "last_event_id": self.last_event_id,
+            "students": self.students,
+            "subjects": self.subjects
+        })
+        tmp_path = REPORTS_SNAPSHOT_PATH + ".tmp.npz"
+        try:
+            np.savez(tmp_path, meta=np.array(meta),
+                     lecture_day=self.lecture_day, lecture_slot=self.lecture_slot,
+                     lecture_subject=self.lecture_subject, lecture_present=self.lecture_present,
+                     lecture_late=self.lecture_late, lecture_expected=self.lecture_expected,
+                     scan_student=self.scan_student,
+                     scan_lecture=self.scan_lecture, scan_late=self.scan_late, scan_pairs=self.scan_pairs)
+            os.replace(tmp_path, REPORTS_SNAPSHOT_PATH)
+            self.saved_event_id = self.last_event_id
+        except Exception as e:
+            log.warning(f"⚠️ Error saving report snapshot: {e}")
+
+    def load_snapshot(self):
+        """Start from the last snapshot instead of re-reading the whole journal"""
+        try:
+            with np.load(REPORTS_SNAPSHOT_PATH, allow_pickle=False) as snapshot:
+                meta = json.loads(str(snapshot["meta"]))
+                columns = {name: snapshot[name] for name in snapshot.files if name != "meta"}
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            log.warning(f"⚠️ Error reading report snapshot: {e}")
             return
-        users = response.json()
-        REGISTERED_USERS = {
-            str(u["card_id"]): {
-                "role": u["role"].lower(),
-                "name": u["name"],
-                "roll_no": u.get("roll_no", "-"),
-                "subject": u.get("subject", "-")
+
+        conn = get_journal()
+        with journal_lock:
+            newest = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        if meta["last_event_id"] > newest:
+            log.info("ℹ️ Report snapshot is ahead of the journal, rebuilding")
+            return
+
+        with self.lock:
+            for name, column in columns.items():
+                setattr(self, name, column)
+            if len(self.lecture_expected) != len(self.lecture_day):
+                # Snapshot from before rosters were journaled
+                self.lecture_expected = np.full(len(self.lecture_day), -1, np.int64)
+            self.students = meta["students"]
+            self.student_codes = {student[0]: code for code, student in enumerate(self.students)}
+            self.subjects = meta["subjects"]
+            self.subject_codes = {subject: code for code, subject in enumerate(self.subjects)}
+            self.lecture_codes = {
+                key: code for code, key in enumerate(zip(self.lecture_day.tolist(), self.lecture_slot.tolist(),
+                                                         self.lecture_subject.tolist()))
+            }
+            self.last_event_id = self.saved_event_id = meta["last_event_id"]
+        log.info(f"✅ Loaded report columns: {len(self.scan_student)} rows, {len(self.lecture_day)} lectures")
+
+    def columns(self):
+        """Consistent references to the current arrays (they are replaced, never mutated)"""
+        with self.lock:
+            return {
+                "students": self.students, "subjects": self.subjects,
+                "lecture_day": self.lecture_day, "lecture_slot": self.lecture_slot,
+                "lecture_subject": self.lecture_subject, "lecture_present": self.lecture_present,
+                "lecture_late": self.lecture_late, "lecture_expected": self.lecture_expected,
+                "scan_student": self.scan_student,
+                "scan_lecture": self.scan_lecture, "scan_late": self.scan_late,
+                "last_event_id": self.last_event_id
             }
-            for u in users
+
+def load_numpy():
+    """Import numpy on first use; False when it is not installed"""
+    global np
+    if np is None and NUMPY_AVAILABLE:
+        import numpy
+        np = numpy
+    return np is not None
+
+def get_attendance_columns():
+    """The shared columnar store, created (from the snapshot) on first use"""
+    global attendance_columns
+    with attendance_columns_lock:
+        if attendance_columns is None:
+            columns = AttendanceColumns()
+            columns.load_snapshot()
+            attendance_columns = columns
+        return attendance_columns
+
+def ratio(numerator, denominator):
+    """Element-wise numerator/denominator as percentages, 0 where the denominator is 0"""
+    return np.round(np.divide(100.0 * numerator, denominator, out=np.zeros(len(numerator)),
+                              where=denominator > 0), 1)
+
+def build_attendance_report(cols, view="all", date_from=None, date_to=None, subject=None, student=None):
+    """Aggregate attendance percentages, late ratios and streaks from the columns"""
+    subjects = cols["subjects"]
+    lecture_day = cols["lecture_day"]
+    lecture_subject = cols["lecture_subject"]
+    lecture_slot = cols["lecture_slot"]
+
+    # Lecture filter first; scans follow their lecture
+    lecture_mask = np.ones(len(lecture_day), np.bool_)
+    if date_from:
+        lecture_mask &= lecture_day >= datetime.strptime(date_from, "%Y-%m-%d").toordinal()
+    if date_to:
+        lecture_mask &= lecture_day <= datetime.strptime(date_to, "%Y-%m-%d").toordinal()
+    if subject:
+        lecture_mask &= lecture_subject == (subjects.index(subject) if subject in subjects else -1)
+    scan_mask = lecture_mask[cols["scan_lecture"]]
+
+    present = np.where(lecture_mask, cols["lecture_present"], 0)
+    late = np.where(lecture_mask, cols["lecture_late"], 0)
+    held = np.bincount(lecture_subject[lecture_mask], minlength=len(subjects))
+    report = {}
+
+    if view in ("all", "subjects"):
+        subject_present = np.bincount(lecture_subject, weights=present, minlength=len(subjects))
+        subject_late = np.bincount(lecture_subject, weights=late, minlength=len(subjects))
+        pairs = np.unique(cols["scan_student"][scan_mask].astype(np.int64) * len(subjects)
+                          + lecture_subject[cols["scan_lecture"][scan_mask]])
+        enrolled = np.bincount(pairs % max(1, len(subjects)), minlength=len(subjects))
+        # Lectures with a roster know who was expected; older ones assume everyone ever seen in the subject
+        lecture_expected = cols["lecture_expected"]
+        expected = np.where(lecture_expected >= 0, lecture_expected, enrolled[lecture_subject])
+        subject_expected = np.bincount(lecture_subject, weights=np.where(lecture_mask, expected, 0),
+                                       minlength=len(subjects))
+        attendance_pct = ratio(subject_present, subject_expected)
+        late_pct = ratio(subject_late, subject_present)
+        report["subjects"] = [
+            {"subject": subjects[code], "lectures_held": int(held[code]), "students": int(enrolled[code]),
+             "absences": int(max(subject_expected[code] - subject_present[code], 0)),
+             "attendance_pct": float(attendance_pct[code]), "late_pct": float(late_pct[code])}
+            for code in np.flatnonzero(held)
+        ]
+
+    if view in ("all", "slots"):
+        slots, slot_index = np.unique(lecture_slot[lecture_mask], return_inverse=True)
+        slot_present = np.bincount(slot_index, weights=present[lecture_mask], minlength=len(slots))
+        slot_late = np.bincount(slot_index, weights=late[lecture_mask], minlength=len(slots))
+        slot_lectures = np.bincount(slot_index, minlength=len(slots))
+        late_pct = ratio(slot_late, slot_present)
+        report["slots"] = [
+            {"lecture_slot": None if slot < 0 else int(slot), "lectures_held": int(slot_lectures[i]),
+             "avg_present": round(float(slot_present[i]) / slot_lectures[i], 1), "late_pct": float(late_pct[i])}
+            for i, slot in enumerate(slots.tolist())
+        ]
+
+    if view in ("all", "daily"):
+        days, day_index = np.unique(lecture_day[lecture_mask], return_inverse=True)
+        day_present = np.bincount(day_index, weights=present[lecture_mask], minlength=len(days))
+        day_late = np.bincount(day_index, weights=late[lecture_mask], minlength=len(days))
+        day_lectures = np.bincount(day_index, minlength=len(days))
+        report["daily"] = [
+            {"date": datetime.fromordinal(day).strftime("%Y-%m-%d"), "lectures": int(day_lectures[i]),
+             "present": int(day_present[i]), "late": int(day_late[i])}
+            for i, day in enumerate(days.tolist())
+        ]
+
+    if view in ("all", "students"):
+        report["students"] = build_student_report(cols, lecture_mask, scan_mask, held, student)
+
+    return report
+
+def build_student_report(cols, lecture_mask, scan_mask, held, student=None):
+    """Per student and subject: attended/held, late ratio, current and longest streak"""
+    students = cols["students"]
+    subject_count = max(1, len(cols["subjects"]))
+    lecture_subject = cols["lecture_subject"]
+
+    # Rank each held lecture within its subject in time order: streaks run over these ranks
+    order = np.lexsort((cols["lecture_slot"], cols["lecture_day"], lecture_subject))
+    order = order[lecture_mask[order]]
+    rank = np.zeros(len(lecture_mask), np.int64)
+    subject_sorted = lecture_subject[order]
+    group_start = np.r_[0, np.flatnonzero(np.diff(subject_sorted)) + 1]
+    rank[order] = np.arange(len(order)) - np.repeat(group_start, np.diff(np.r_[group_start, len(order)]))
+
+    scan_student = cols["scan_student"][scan_mask].astype(np.int64)
+    scan_lecture = cols["scan_lecture"][scan_mask]
+    if student is not None:
+        code = next((code for code, entry in enumerate(students) if entry[0] == student), -1)
+        keep = scan_student == code
+        scan_student, scan_lecture = scan_student[keep], scan_lecture[keep]
+        scan_late = cols["scan_late"][scan_mask][keep]
+    else:
+        scan_late = cols["scan_late"][scan_mask]
+
+    # One group per (student, subject); sort its scans by lecture rank
+    group = scan_student * subject_count + lecture_subject[scan_lecture]
+    scan_rank = rank[scan_lecture]
+    order = np.lexsort((scan_rank, group))
+    group, scan_rank, scan_late = group[order], scan_rank[order], scan_late[order]
+    groups, group_first, attended = np.unique(group, return_index=True, return_counts=True)
+    late_count = np.add.reduceat(scan_late.astype(np.int64), group_first) if len(group) else np.zeros(0, np.int64)
+
+    # Runs of consecutive lecture ranks inside a group are streaks
+    breaks = np.ones(len(group), np.bool_)
+    breaks[1:] = (group[1:] != group[:-1]) | (scan_rank[1:] != scan_rank[:-1] + 1)
+    run_start = np.flatnonzero(breaks)
+    run_length = np.diff(np.r_[run_start, len(group)])
+    run_group = np.searchsorted(groups, group[run_start])
+    longest = np.zeros(len(groups), np.int64)
+    np.maximum.at(longest, run_group, run_length)
+    last_run = np.r_[run_group[1:] != run_group[:-1], True] if len(run_group) else np.zeros(0, np.bool_)
+    group_subject = groups % subject_count
+    current = np.zeros(len(groups), np.int64)
+    ends_now = scan_rank[run_start[last_run] + run_length[last_run] - 1] == held[group_subject[run_group[last_run]]] - 1
+    current[run_group[last_run][ends_now]] = run_length[last_run][ends_now]
+
+    subject_held = held[group_subject]
+    attendance_pct = ratio(attended, subject_held)
+    late_pct = ratio(late_count, attended)
+    report = {}
+    for i, key in enumerate(groups.tolist()):
+        code, subject_code = divmod(key, subject_count)
+        entry = report.get(code)
+        if entry is None:
+            card_id, name, roll_no = students[code]
+            entry = report[code] = {"card_id": card_id, "name": name, "roll_no": roll_no,
+                                    "attended": 0, "held": 0, "late": 0, "subjects": []}
+        entry["attended"] += int(attended[i])
+        entry["held"] += int(subject_held[i])
+        entry["late"] += int(late_count[i])
+        entry["subjects"].append({
+            "subject": cols["subjects"][subject_code], "attended": int(attended[i]),
+            "held": int(subject_held[i]), "attendance_pct": float(attendance_pct[i]),
+            "late_pct": float(late_pct[i]), "current_streak": int(current[i]), "longest_streak": int(longest[i])
+        })
+    for entry in report.values():
+        entry["attendance_pct"] = round(100.0 * entry["attended"] / entry["held"], 1) if entry["held"] else 0.0
+        entry["late_pct"] = round(100.0 * entry["late"] / entry["attended"], 1) if entry["attended"] else 0.0
+    return list(report.values())
+
+# ---------------- REGISTERED USER DIRECTORY ----------------
+
+class UserRecord:
+    """One registered card. Slotted; role and subject tuples are interned and shared"""
+    __slots__ = ("card_id", "role", "name", "roll_no", "subjects")
+    subject_sets = {}  # every distinct subject tuple, shared by all records that have it
+
+    def __init__(self, card_id, role, name, roll_no="-", subject="-"):
+        self.card_id = card_id
+        self.role = sys.intern(role.lower())
+        self.name = name
+        self.roll_no = roll_no
+        # A student's subject cell may list several enrolled subjects: "Math, Physics"
+        subjects = tuple(sys.intern(part.strip()) for part in subject.split(",") if part.strip() not in ("", "-"))
+        self.subjects = self.subject_sets.setdefault(subjects, subjects)
+
+    @property
+    def subject(self):
+        return ", ".join(self.subjects) or "-"
+
+    def to_dict(self):
+        return {"role": self.role, "name": self.name, "roll_no": self.roll_no, "subject": self.subject}
+
+class UserDirectory:
+    """Registered users indexed by card_id, roll_no, role and subject.
+
+    Refreshes build a new directory and swap it in whole; only registrations
+    change the live one (under registration_lock). Lookups never take a lock:
+    they iterate over a list taken from a bucket in one step, never the live dict.
+    """
+
+    def __init__(self, records=()):
+        self.by_card = {}
+        self.by_roll = {}     # roll_no -> record (roll numbers are unique; "-" is not indexed)
+        self.by_role = {}     # role -> {card_id: record}, in insertion order
+        self.by_subject = {}  # subject -> {card_id: record}
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        """Insert or replace the record for its card"""
+        old = self.by_card.get(record.card_id)
+        if old:
+            self.unindex(old)
+        self.by_card[record.card_id] = record
+        if record.roll_no not in ("", "-"):
+            self.by_roll[record.roll_no] = record
+        self.by_role.setdefault(record.role, {})[record.card_id] = record
+        for subject in record.subjects:
+            self.by_subject.setdefault(subject, {})[record.card_id] = record
+
+    def remove(self, card_id):
+        record = self.by_card.pop(card_id, None)
+        if record:
+            self.unindex(record)
+
+    def unindex(self, record):
+        if self.by_roll.get(record.roll_no) is record:
+            del self.by_roll[record.roll_no]
+        for index, key in [(self.by_role, record.role)] + [(self.by_subject, subject) for subject in record.subjects]:
+            bucket = index.get(key, {})
+            if bucket.get(record.card_id) is record:
+                del bucket[record.card_id]
+
+    def get(self, card_id, default=None):
+        return self.by_card.get(card_id, default)
+
+    def __len__(self):
+        return len(self.by_card)
+
+    def __contains__(self, card_id):
+        return card_id in self.by_card
+
+    def copy(self):
+        return UserDirectory(list(self.by_card.values()))
+
+    def find(self, role=None, subject=None, roll_no=None):
+        """Records matching every given filter: the smallest index bucket, checked against the rest"""
+        role = role.lower() if role is not None else None
+        if roll_no is not None:
+            record = self.by_roll.get(roll_no)
+            candidates = [record] if record else []
+        elif subject is not None and role is not None:
+            by_subject = self.by_subject.get(subject, {})
+            by_role = self.by_role.get(role, {})
+            candidates = list((by_subject if len(by_subject) <= len(by_role) else by_role).values())
+        elif subject is not None:
+            candidates = list(self.by_subject.get(subject, {}).values())
+        elif role is not None:
+            candidates = list(self.by_role.get(role, {}).values())
+        else:
+            candidates = list(self.by_card.values())
+        return [record for record in candidates
+                if (role is None or record.role == role) and (subject is None or subject in record.subjects)]
+
+    def students_in(self, subject):
+        """Students enrolled in `subject`, e.g. everyone expected at its lecture"""
+        return self.find(role="student", subject=subject)
+
+    def to_dict(self):
+        return {card_id: record.to_dict() for card_id, record in list(self.by_card.items())}
+
+REGISTERED_USERS = UserDirectory()
+
+def parse_registered_user(u):
+    """Convert a Register sheet row into a UserRecord"""
+    return UserRecord(str(u["card_id"]), u["role"], u["name"], u.get("roll_no", "-"), u.get("subject", "-"))
+
+def load_users_snapshot():
+    """Load the last known directory from disk so startup does not wait on the sheet"""
+    global REGISTERED_USERS, users_last_row, users_generation
+    try:
+        with open(USERS_SNAPSHOT_PATH, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        REGISTERED_USERS = UserDirectory(
+            UserRecord(card_id, user["role"], user["name"], user["roll_no"], user["subject"])
+            for card_id, user in snapshot["users"].items()
+        )
+        users_last_row = snapshot["last_row"]
+        users_generation = snapshot.get("generation")
+        log.info(f"✅ Loaded {len(REGISTERED_USERS)} registered users from snapshot")
+    except FileNotFoundError:
+        log.info("ℹ️ No user snapshot found, a full download is needed")
+    except Exception as e:
+        log.warning(f"⚠️ Error reading user snapshot: {e}")
+
+def save_users_snapshot(users, last_row, generation=None):
+    """Persist the directory atomically (write temp file, then rename)"""
+    tmp_path = USERS_SNAPSHOT_PATH + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"last_row": last_row, "generation": generation, "users": users.to_dict()}, f)
+        os.replace(tmp_path, USERS_SNAPSHOT_PATH)
+    except Exception as e:
+        log.warning(f"⚠️ Error saving user snapshot: {e}")
+
+def fetch_register_rows(since):
+    """Fetch Register rows after sheet row `since`; returns (rows, last_row, generation, complete)"""
+    rows = []
+    last_row = since
+    generation = None
+    # Sheet row `since` is data row `since - 1` counted from 0, so the next one starts there
+    for page in iter_sheet_pages("Register", offset=max(since - 1, 0), parallel=SHEET_PAGE_FETCHERS):
+        rows.extend(page["rows"])
+        last_row = page["last_row"]
+        generation = page.get("generation")
+    return rows, last_row, generation, since <= 1
+
+def preload_registered_users(full=False):
+    """Refresh REGISTERED_USERS, fetching only rows appended since the last refresh; False on failure"""
+    global REGISTERED_USERS, users_last_row, users_generation
+    with directory_lock:
+        # Registrations the sheet may not have had when it answered are laid back on top
+        synced_before = get_sync_cursor()
+        try:
+            # The aggregator's mirror needs every row, not just those after its snapshot
+            full = full or (AGGREGATOR_MODE and not register_mirror['ready'])
+            since = 1 if full or not users_last_row else users_last_row
+            rows, last_row, generation, complete = fetch_register_rows(since)
+            if last_row < since:
+                # Rows were deleted from the sheet; start over from scratch
+                log.info("ℹ️ Register tab shrank, doing a full refresh")
+                rows, last_row, generation, complete = fetch_register_rows(1)
+            elif not complete and generation != users_generation:
+                # The script compacted the tab, so row numbers no longer line up with ours
+                log.info("ℹ️ Register tab was compacted, doing a full refresh")
+                rows, last_row, generation, complete = fetch_register_rows(1)
+        except Exception as e:
+            log.error(f"❌ Failed to fetch registered users: {e}")
+            return False
+        if AGGREGATOR_MODE:
+            update_register_mirror(rows, generation, complete)
+
+        with registration_lock:
+            users = UserDirectory() if complete else REGISTERED_USERS.copy()
+            for u in rows:
+                users.add(parse_registered_user(u))
+            uploaded = get_sync_cursor()
+            rejected = conflicted_cards() if uploaded > synced_before else set()
+            for event_id, _, payload in read_journal_events(["register"], synced_before):
+                u = json.loads(payload)
+                # Uploaded while we were fetching: keep it unless the sheet refused it
+                if not (event_id <= uploaded and str(u["card_id"]) in rejected):
+                    users.add(parse_registered_user(u))
+            # Swap in the new directory in one step so readers never see a partial directory
+            REGISTERED_USERS = users
+            users_last_row = last_row
+            users_generation = generation
+        save_users_snapshot(users, last_row, generation)
+        log.info(f"✅ Loaded {len(REGISTERED_USERS)} registered users ({len(rows)} rows fetched)")
+        return True
+
+def directory_refresh_thread():
+    """Background thread that keeps the user directory fresh"""
+    refresh_count = 1  # startup already has a snapshot or a full load
+    while True:
+        full = refresh_count % DIRECTORY_FULL_REFRESH_EVERY == 0
+        preload_registered_users(full=full)
+        refresh_count += 1
+        time_module.sleep(DIRECTORY_REFRESH_INTERVAL)
+
+# ---------------- REGISTRATION ----------------
+
+def registration_row(data):
+    """Normalise a registration (form, CSV line or roster entry) to Register tab fields"""
+    return {
+        "card_id": str(data.get("card_id") or "").strip(),
+        "role": str(data.get("role") or "").strip().lower(),
+        "name": str(data.get("name") or "").strip(),
+        "roll_no": str(data.get("roll_no") or "").strip() or "-",
+        "subject": str(data.get("subject") or "").strip() or "-"
+    }
+
+def check_registration(row, record, overwrite=False):
+    """(status, message) when `row` cannot be registered against the live directory, else None"""
+    if not all([row["card_id"], row["name"], row["role"]]):
+        return "missing", "Missing required fields"
+    if row["role"] not in REGISTER_ROLES:
+        return "invalid", f"Unknown role: {row['role']}"
+    existing = REGISTERED_USERS.get(row["card_id"])
+    if existing and existing.to_dict() == record.to_dict():
+        return "unchanged", f"Card already registered to {existing.name}"
+    if existing and not overwrite:
+        return "duplicate_card", f"Card already registered to {existing.name}"
+    holder = REGISTERED_USERS.by_roll.get(record.roll_no)
+    if holder and holder.card_id != record.card_id:
+        return "duplicate_roll_no", f"Roll no {record.roll_no} already belongs to {holder.name} ({holder.card_id})"
+    return None
+
+def register_users(entries, overwrite=False):
+    """Register cards in the local directory at once and journal them for the Register tab.
+
+    Each journaled row carries `base`, the card as this kiosk knew it (None for a
+    new card), so the script can refuse edits made against a stale copy.
+    Returns one {'card_id', 'status', 'message'} per entry.
+    """
+    results = []
+    accepted = []
+    seen = set()
+    today = datetime.now().strftime("%Y-%m-%d")
+    with registration_lock:
+        for data in entries:
+            row = registration_row(data)
+            record = UserRecord(row["card_id"], row["role"], row["name"], row["roll_no"], row["subject"])
+            if row["card_id"] in seen:
+                problem = ("duplicate_card", "Card appears more than once in this upload")
+            else:
+                problem = check_registration(row, record, overwrite)
+            if problem:
+                results.append({'card_id': row["card_id"], 'status': problem[0], 'message': problem[1]})
+                continue
+
+            existing = REGISTERED_USERS.get(row["card_id"])
+            row.update(record.to_dict(), date=today, base=existing.to_dict() if existing else None)
+            REGISTERED_USERS.add(record)
+            accepted.append(row)
+            seen.add(row["card_id"])
+            results.append({'card_id': row["card_id"], 'status': 'updated' if existing else 'registered',
+                            'message': f"{record.name} registered"})
+        if accepted:
+            journal_events("register", accepted, register_only=True)
+    if accepted:
+        log.info(f"📝 Registered {len(accepted)} card(s) locally, queued for the Register tab")
+    return results
+
+def parse_registration_csv(text):
+    """Rows of a CSV with a header line: card_id,role,name[,roll_no][,subject]"""
+    reader = csv.DictReader(io.StringIO(text.lstrip("\ufeff")))
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+    return list(reader)
+
+def record_register_conflicts(conflicts):
+    """Keep registrations the sheet refused; the sheet's copy of the card wins until resolved"""
+    detected_at = datetime.now().isoformat(timespec='seconds')
+    conn = get_journal()
+    with registration_lock:
+        with journal_lock:
+            conn.executemany(
+                "INSERT INTO register_conflicts (detected_at, card_id, local, sheet) VALUES (?, ?, ?, ?)",
+                [(detected_at, str(c["card_id"]), json.dumps(c["local"]),
+                  json.dumps(c["sheet"]) if c.get("sheet") else None) for c in conflicts]
+            )
+        for c in conflicts:
+            if c.get("sheet"):
+                REGISTERED_USERS.add(parse_registered_user(dict(c["sheet"], card_id=c["card_id"])))
+            else:
+                REGISTERED_USERS.remove(str(c["card_id"]))
+    log.warning(f"⚠️ Register tab refused {len(conflicts)} stale registration(s): "
+                f"{', '.join(str(c['card_id']) for c in conflicts)}")
+
+def read_register_conflicts():
+    conn = get_journal()
+    with journal_lock:
+        rows = conn.execute("SELECT id, detected_at, card_id, local, sheet FROM register_conflicts ORDER BY id").fetchall()
+    return [{'id': conflict_id, 'detected_at': detected_at, 'card_id': card_id,
+             'local': json.loads(local), 'sheet': json.loads(sheet) if sheet else None}
+            for conflict_id, detected_at, card_id, local, sheet in rows]
+
+def conflicted_cards():
+    conn = get_journal()
+    with journal_lock:
+        return {card_id for (card_id,) in conn.execute("SELECT card_id FROM register_conflicts")}
+
+def resolve_register_conflict(conflict_id, keep):
+    """Settle a refused registration: keep the sheet's card, or register the local one over it"""
+    conflict = next((c for c in read_register_conflicts() if c['id'] == conflict_id), None)
+    if conflict is None:
+        return {'success': False, 'message': 'Unknown conflict'}
+    if keep == 'local':
+        result = register_users([dict(conflict['local'], card_id=conflict['card_id'])], overwrite=True)[0]
+        if result['status'] not in ('registered', 'updated', 'unchanged'):
+            return {'success': False, 'message': result['message']}
+    elif keep != 'sheet':
+        return {'success': False, 'message': "keep must be 'local' or 'sheet'"}
+    conn = get_journal()
+    with journal_lock:
+        conn.execute("DELETE FROM register_conflicts WHERE id = ?", (conflict_id,))
+    return {'success': True, 'message': f"Kept the {keep} registration of {conflict['card_id']}"}
+
+# ---------------- LIVE EVENTS (SSE) ----------------
+
+def publish_event(event_type, data, reader_id=None):
+    """Push an event to every subscribed client of the reader (or all clients)"""
+    with event_subscribers_lock:
+        subscribers = list(event_subscribers)
+    for subscriber_reader, client_queue in subscribers:
+        if reader_id is not None and subscriber_reader != reader_id:
+            continue
+        while True:
+            try:
+                client_queue.put_nowait((event_type, data))
+                break
+            except queue.Full:
+                # Slow client: drop its oldest event rather than block the reader thread
+                try:
+                    client_queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+def subscribe_events(reader_id):
+    client_queue = queue.Queue(maxsize=EVENT_CLIENT_BUFFER)
+    with event_subscribers_lock:
+        event_subscribers.append((reader_id, client_queue))
+    return client_queue
+
+def unsubscribe_events(client_queue):
+    with event_subscribers_lock:
+        event_subscribers[:] = [sub for sub in event_subscribers if sub[1] is not client_queue]
+
+def format_sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+# ---------------- SCAN PIPELINE ----------------
+
+def lecture_roster(session, ended):
+    """Present/late/absent roster of an ended lecture, or None if nobody was expected or seen.
+
+    Absentees are the subject's enrolled students minus the cards in the session's
+    dedup index, so this costs O(class size) once per lecture; students who
+    tapped in without being enrolled are listed too, with enrolled "No".
+    """
+    key = lecture_key(ended)
+    scans = session.lecture_scans(key)
+    expected = {record.card_id: record for record in REGISTERED_USERS.students_in(ended.subject)}
+    if not expected and not scans:
+        return None
+    absent = expected.keys() - scans.keys()
+
+    roster = []
+    for card_id, record in expected.items():
+        scan = None if card_id in absent else scans[card_id]
+        roster.append({"card_id": card_id, "name": record.name, "roll_no": record.roll_no,
+                       "status": scan["status"] if scan else "Absent", "time": scan["time"] if scan else "-",
+                       "enrolled": "Yes"})
+    for card_id in scans.keys() - expected.keys():
+        record = REGISTERED_USERS.get(card_id)
+        roster.append({"card_id": card_id, "name": record.name if record else "-",
+                       "roll_no": record.roll_no if record else "-", "status": scans[card_id]["status"],
+                       "time": scans[card_id]["time"], "enrolled": "No"})
+    return {
+        "date": key[0],
+        "subject": ended.subject,
+        "lecture_slot": ended.slot,
+        "teacher_card": ended.teacher_card,
+        "reader": session.reader_id,
+        "absent": len(absent),
+        "roster": roster
+    }
+
+def end_lecture_and_journal(session, now, version=None, forced=False):
+    """End the session's lecture (if `version` is still current) and journal the teacher row and roster"""
+    ended = session.end_lecture(version, 'force_end' if forced else 'end')
+    if not ended:
+        return None
+
+    teacher_user = REGISTERED_USERS.get(ended.teacher_card)
+    if teacher_user:
+        journal_event("force_end_lecture" if forced else "end_lecture", "teacher", {
+            "card_id": ended.teacher_card,
+            "name": teacher_user.name,
+            "subject": ended.subject,
+            "time": now.strftime("%H:%M:%S"),
+            "date": now.strftime("%Y-%m-%d"),
+            "status": "Lecture Ended (Forced)" if forced else "Lecture Ended",
+            "lecture_slot": ended.slot,
+            "reader": session.reader_id
+        })
+    roster = lecture_roster(session, ended)
+    if roster:
+        # One journal event, so the whole roster reaches the sheet in one upload and one write
+        journal_event("lecture_roster", "roster", roster)
+        log.info(f"📋 [{session.reader_id}] {ended.subject} roster: {len(roster['roster']) - roster['absent']} present, "
+                 f"{roster['absent']} absent")
+    return ended
+
+def choose_lecture_subject(teacher, requested, slot):
+    """(subject, None) for the lecture `teacher` starts in `slot`, or (None, message) when it is not clear.
+
+    A lecture is for one subject: the requested one (it must be one the teacher
+    teaches), else the slot's subject in the timetable, else the teacher's only one.
+    """
+    if requested:
+        if requested in teacher.subjects:
+            return requested, None
+        return None, f'{teacher.name} does not teach {requested}'
+    if slot.subject in teacher.subjects:
+        return slot.subject, None
+    if len(teacher.subjects) > 1:
+        return None, f'{teacher.name} teaches {teacher.subject}: choose the subject, then tap again'
+    return (teacher.subjects[0] if teacher.subjects else "-"), None
+
+def process_start_attendance(session, teacher_card, now=None, subject=None):
+    """Start a lecture on `session` from a teacher card; returns the result dict.
+
+    `subject` (or the one picked with the scan mode) says which of the teacher's
+    subjects it is for; see choose_lecture_subject.
+    """
+    try:
+        now = now or datetime.now()  # one timestamp for the whole event, so date/time/slot agree
+        if not REGISTERED_USERS:
+            return {
+                'success': False,
+                'message': 'No registered users found. Please load users first.'
+            }
+
+        slot = lookup_lecture_slot(now, session.room)
+        if not slot:
+            return {
+                'success': False,
+                'message': 'No active lecture session'
+            }
+        current_slot = slot.number
+
+        teacher_user = REGISTERED_USERS.get(teacher_card)
+        if not teacher_user or teacher_user.role != "teacher":
+            return {
+                'success': False,
+                'message': 'Invalid teacher card'
+            }
+
+        subject, problem = choose_lecture_subject(teacher_user, subject or session.start_subject, slot)
+        if problem:
+            return {
+                'success': False,
+                'message': problem,
+                'choose_subject': list(teacher_user.subjects)
+            }
+
+        lecture = session.start_lecture(teacher_card, subject, current_slot, started_at=now)
+        if not lecture:
+            return {
+                'success': False,
+                'message': f'Lecture already in progress: {session.lecture.subject}'
+            }
+
+        try:
+            journal_event("start_attendance", "teacher", {
+                "card_id": teacher_card,
+                "name": teacher_user.name,
+                "subject": lecture.subject,
+                "time": now.strftime("%H:%M:%S"),
+                "date": now.strftime("%Y-%m-%d"),
+                "status": f"Lecture Started - Slot {current_slot}",
+                "lecture_slot": current_slot,
+                "reader": session.reader_id
+            })
+        except Exception:
+            session.end_lecture(lecture.version, 'start_failed')
+            raise
+
+        session.start_subject = None  # picked for this lecture only
+        seeded = session.seed_attendance_index(lecture_key(lecture))
+        if seeded:
+            log.info(f"ℹ️ [{session.reader_id}] {seeded} students already marked for this lecture")
+
+        return {
+            'success': True,
+            'message': f'Lecture started! Subject: {lecture.subject}',
+            'subject': lecture.subject,
+            'lecture_slot': current_slot
         }
-        print(f"✅ Loaded {len(REGISTERED_USERS)} registered users")
+
     except Exception as e:
-        print(f"⚠️ Error fetching users: {e}")
+        return {
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }
+
+def process_attendance_scan(session, card_id, now=None):
+    """Validate, dedup, classify and journal one attendance tap; returns the result dict"""
+    try:
+        now = now or datetime.now()  # one timestamp for the whole event, so date/time/slot agree
+        lecture = session.lecture  # one consistent snapshot, even if the lecture ends meanwhile
+        if not lecture.attendance_enabled:
+            return {
+                'success': False,
+                'message': 'Attendance session not started'
+            }
+
+        # Handle force end, or the teacher tapping again to end the lecture
+        if card_id == 'FORCE_END' or card_id == lecture.teacher_card:
+            if not end_lecture_and_journal(session, now, lecture.version, forced=card_id == 'FORCE_END'):
+                return {
+                    'success': False,
+                    'message': 'Lecture already ended'
+                }
+
+            return {
+                'success': True,
+                'message': 'Lecture ended successfully',
+                'action': 'end_lecture'
+            }
+
+        user = REGISTERED_USERS.get(card_id)
+        if not user:
+            return {
+                'success': False,
+                'message': 'Card not registered'
+            }
+
+        role = user.role
+        time_now = now.strftime("%H:%M:%S")
+        # Taps belong to the running lecture, also once its slot is over (a lecture that overruns)
+        key = lecture_key(lecture)
+        date_today, current_slot = key[0], key[1]
+
+        if role == "student":
+            slot = running_lecture_slot(lecture, session.room) or lookup_lecture_slot(now, session.room)
+            status = get_student_status(now, slot=slot)
+
+            # Repeat taps are answered from memory and never produce another row
+            try:
+                first_scan = session.check_in(key, card_id, time_now, status, lecture.version)
+            except LectureEnded:
+                return {
+                    'success': False,
+                    'message': 'Lecture already ended'
+                }
+            if first_scan:
+                return {
+                    'success': True,
+                    'message': f'Already marked: {user.name} - {first_scan["status"]} at {first_scan["time"]}',
+                    'name': user.name,
+                    'status': first_scan['status'],
+                    'role': 'student',
+                    'duplicate': True,
+                    'retaps': first_scan['retaps']
+                }
+
+            # Committed locally first; the flusher syncs it to the sheet in the background
+            try:
+                journal_event("mark_attendance", "student", {
+                    "card_id": card_id,
+                    "name": user.name,
+                    "roll_no": user.roll_no,
+                    "subject": lecture.subject,
+                    "time": time_now,
+                    "date": date_today,
+                    "status": status,
+                    "lecture_slot": current_slot,
+                    "reader": session.reader_id
+                })
+            except Exception as e:
+                session.undo_check_in(key, card_id)
+                log.error(f"❌ Failed to journal attendance: {e}")
+                return {
+                    'success': False,
+                    'message': 'Failed to record attendance data'
+                }
+
+            return {
+                'success': True,
+                'message': f'Attendance marked: {user.name} - {status}',
+                'name': user.name,
+                'status': status,
+                'role': 'student'
+            }
+
+        elif role == "teacher":
+            return {
+                'success': True,
+                'message': f'Teacher attendance: {user.name}',
+                'name': user.name,
+                'role': 'teacher'
+            }
+
+        elif role == "admin":
+            return {
+                'success': True,
+                'message': f'Admin attendance: {user.name}',
+                'name': user.name,
+                'role': 'admin'
+            }
+
+        return {
+            'success': False,
+            'message': f'Unsupported role: {user.role}'
+        }
+
+    except Exception as e:
+        return {
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }
+
+def process_auto_scan(session, card_id, now=None):
+    """Headless mode: a teacher tap starts the lecture when idle, every other tap is attendance"""
+    user = REGISTERED_USERS.get(card_id)
+    if not session.lecture.attendance_enabled and user and user.role == "teacher":
+        return process_start_attendance(session, card_id, now)
+    return process_attendance_scan(session, card_id, now)
+
+def parse_scan_time(value):
+    """A client's scan time (ISO 8601 or epoch seconds) as a naive local datetime"""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    scanned_at = datetime.fromisoformat(str(value))
+    if scanned_at.tzinfo:
+        scanned_at = scanned_at.astimezone().replace(tzinfo=None)
+    return scanned_at
+
+def journaled_lectures(since_date):
+    """Lectures journaled from `since_date` on.
+
+    Returns {(date, slot, reader): subject} for lectures started, and
+    {(date, slot, subject, card_id): first scan} for students already marked.
+    """
+    subjects = {}
+    for p in read_journal_payloads("start_attendance", since_date):
+        subjects[(p.get("date"), p.get("lecture_slot"), p.get("reader"))] = p.get("subject")
+    marked = {}
+    for p in read_journal_payloads("mark_attendance", since_date):
+        marked.setdefault((p.get("date"), p.get("lecture_slot"), p.get("subject"), p.get("card_id")),
+                          {'time': p.get("time"), 'status': p.get("status"), 'retaps': 0})
+    return subjects, marked
+
+def process_scan_batch(scans, default_session):
+    """Mark a batch of timestamped scans (e.g. a handheld reader's backlog) in one pass.
+
+    Each scan is {"event_id", "card_id", "scanned_at"} plus optional "reader"
+    and "subject" (for lectures no kiosk started). Scans are applied oldest
+    first, so the first tap of a lecture decides On-time/Late, and journaled
+    in one transaction. A successful event_id is remembered: sending it again,
+    in this batch or a later one, returns its first result with 'replayed'
+    and never adds a row. Failed scans are not remembered and can be resent.
+    Returns one result per scan, in request order.
+    """
+    event_ids = [str(scan.get("event_id") or "") for scan in scans]
+    previous = read_client_results({event_id for event_id in event_ids if event_id})
+    results = [None] * len(scans)
+    pending = []   # (scanned_at, index, session)
+    first_index = {}
+    repeats = []   # (index, index of the same event_id earlier in the batch)
+
+    for index, (scan, event_id) in enumerate(zip(scans, event_ids)):
+        if not event_id or not scan.get("card_id"):
+            results[index] = {'success': False, 'message': 'event_id and card_id are required'}
+        elif event_id in previous:
+            results[index] = dict(previous[event_id], replayed=True)
+        elif event_id in first_index:
+            repeats.append((index, first_index[event_id]))
+        else:
+            first_index[event_id] = index
+            session = get_reader_session(scan["reader"]) if scan.get("reader") else default_session
+            try:
+                scanned_at = parse_scan_time(scan.get("scanned_at"))
+            except (TypeError, ValueError):
+                results[index] = {'success': False, 'message': 'scanned_at must be ISO 8601 or epoch seconds'}
+                continue
+            if not session:
+                results[index] = {'success': False, 'message': 'Unknown reader'}
+                continue
+            pending.append((scanned_at, index, session))
+
+    rows = []
+    remembered = {}
+    checked_in = []
+    if pending:
+        subjects, marked = journaled_lectures(min(pending)[0].strftime("%Y-%m-%d"))
+    for scanned_at, index, session in sorted(pending, key=lambda item: (item[0], item[1])):
+        scan = scans[index]
+        card_id = str(scan["card_id"])
+        user = REGISTERED_USERS.get(card_id)
+        if not user:
+            results[index] = {'success': False, 'message': 'Card not registered'}
+            continue
+        if user.role not in ("student", "teacher", "admin"):
+            results[index] = {'success': False, 'message': f'Unsupported role: {user.role}'}
+            continue
+        if user.role != "student":
+            # Like a live tap: staff cards are acknowledged but add no row
+            results[index] = {'success': True, 'message': f'{user.role.title()} attendance: {user.name}',
+                              'name': user.name, 'role': user.role}
+            remembered[event_ids[index]] = results[index]
+            continue
+        date, time_now = scanned_at.strftime("%Y-%m-%d"), scanned_at.strftime("%H:%M:%S")
+        slot = lookup_lecture_slot(scanned_at, session.room)
+        lecture = session.lecture
+        # The running lecture first, also once it has run past its slot; the timetable otherwise
+        live = (lecture.attendance_enabled and lecture.started_at[:10] == date
+                and scan.get("subject") in (None, lecture.subject)
+                and (scanned_at >= datetime.fromisoformat(lecture.started_at) or (slot and slot.number == lecture.slot)))
+        if live:
+            key = lecture_key(lecture)
+            subject = lecture.subject
+            slot = running_lecture_slot(lecture, session.room) or slot
+        else:
+            if not slot:
+                results[index] = {'success': False, 'message': 'No lecture at that time'}
+                continue
+            subject = scan.get("subject") or subjects.get((date, slot.number, session.reader_id))
+            if not subject:
+                results[index] = {'success': False, 'message': 'No lecture was started in that slot; send its subject'}
+                continue
+            key = (date, slot.number, subject)
+
+        status = get_student_status(scanned_at, slot=slot)
+        if live:
+            # Shares the running lecture's dedup index, so live taps and catch-up agree
+            try:
+                first_scan = session.check_in(key, card_id, time_now, status, lecture.version)
+            except LectureEnded:
+                results[index] = {'success': False, 'message': 'Lecture already ended'}
+                continue
+            if first_scan is None:
+                checked_in.append((session, key, card_id))
+        else:
+            first_scan = marked.get(key + (card_id,))
+            if first_scan is None:
+                marked[key + (card_id,)] = {'time': time_now, 'status': status, 'retaps': 0}
+            else:
+                first_scan['retaps'] += 1
+
+        if first_scan:
+            results[index] = {
+                'success': True,
+                'message': f'Already marked: {user.name} - {first_scan["status"]} at {first_scan["time"]}',
+                'name': user.name,
+                'status': first_scan['status'],
+                'role': 'student',
+                'duplicate': True
+            }
+        else:
+            rows.append({
+                "role": "student",
+                "card_id": card_id,
+                "name": user.name,
+                "roll_no": user.roll_no,
+                "subject": subject,
+                "time": time_now,
+                "date": date,
+                "status": status,
+                "lecture_slot": key[1],
+                "reader": session.reader_id,
+                "event_id": event_ids[index]
+            })
+            results[index] = {
+                'success': True,
+                'message': f'Attendance marked: {user.name} - {status}',
+                'name': user.name,
+                'status': status,
+                'role': 'student'
+            }
+        remembered[event_ids[index]] = results[index]
+
+    try:
+        journal_client_events("mark_attendance", rows, remembered)
+    except Exception as e:
+        log.error(f"❌ Failed to journal a batch of {len(rows)} scans: {e}")
+        for session, key, card_id in checked_in:
+            session.undo_check_in(key, card_id)
+        for _, index, _ in pending:
+            results[index] = {'success': False, 'message': 'Failed to record attendance data'}
+        remembered = {}
+
+    for index, earlier in repeats:
+        results[index] = dict(results[earlier], replayed=True) if results[earlier]['success'] else results[earlier]
+    for _, index, session in pending:
+        SCANS_TOTAL.inc(reader=session.reader_id, mode="batch", outcome=scan_outcome(results[index]))
+    for session in {session for session, _, _ in checked_in}:
+        publish_event('session', session.session_info(), session.reader_id)
+    for result, event_id in zip(results, event_ids):
+        result['event_id'] = event_id
+    if rows:
+        log.info(f"📥 Batch of {len(scans)} scans: {len(rows)} marked, {len(remembered) - len(rows)} already known")
+    return results
+
+# ---------------- STATIC FRONTEND ----------------
+
+FrontendAsset = namedtuple("FrontendAsset", "content_type digest encodings")
+
+def compress_asset(body, content_type):
+    """An asset with its gzip and (when the brotli module is installed) brotli variants"""
+    encodings = {"identity": body, "gzip": gzip.compress(body, 9, mtime=0)}
+    if brotli:
+        encodings["br"] = brotli.compress(body, quality=11)
+    encodings = {name: data for name, data in encodings.items() if len(data) <= len(body)}
+    return FrontendAsset(content_type, hashlib.sha256(body).hexdigest()[:12], encodings)
+
+def frontend_sources():
+    """Modification times of index.html and its assets, to rebuild after an edit"""
+    paths = [os.path.join(app.root_path, app.template_folder, "index.html")]
+    paths += [os.path.join(app.static_folder, name) for name in FRONTEND_ASSETS]
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+
+def build_frontend():
+    """Fingerprint the static assets and pre-render index.html linking them; returns (index, assets)"""
+    assets = {}
+    urls = {}
+    for name in FRONTEND_ASSETS:
+        with open(os.path.join(app.static_folder, name), "rb") as f:
+            asset = compress_asset(f.read(), f"{mimetypes.guess_type(name)[0]}; charset=utf-8")
+        stem, ext = os.path.splitext(name)
+        assets[f"{stem}.{asset.digest}{ext}"] = asset
+        urls[name] = f"/assets/{stem}.{asset.digest}{ext}"
+    with app.app_context():
+        page = render_template("index.html", asset_url=urls.__getitem__)
+    index_page = compress_asset(page.encode("utf-8"), "text/html; charset=utf-8")
+    log.info(f"✅ Frontend built: {', '.join(urls.values())} "
+             f"({', '.join(f'{name} {len(data)} B' for name, data in index_page.encodings.items())} page)")
+    return index_page, assets
+
+def get_frontend():
+    """The built frontend, rebuilt when a source file changed"""
+    global frontend
+    sources = frontend_sources()
+    with frontend_lock:
+        if frontend is None or frontend[0] != sources:
+            frontend = (sources, *build_frontend())
+        return frontend[1], frontend[2]
+
+def serve_frontend_asset(asset, cache_control):
+    """Answer with the best encoding the client accepts, or 304 if it already has it"""
+    encoding = next((name for name in ("br", "gzip") if name in asset.encodings and request.accept_encodings[name]),
+                    "identity")
+    etag = f"{asset.digest}-{encoding}"  # each encoding is its own representation
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(asset.encodings[encoding], content_type=asset.content_type)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
 
 # ---------------- FLASK ROUTES ----------------
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time_module.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(time_module.perf_counter() - started, endpoint=request.endpoint or "unmatched",
+                                     method=request.method, status=response.status_code)
+    return response
+
+def request_reader_session():
+    """Reader session addressed by the request (?reader=<id> or "reader" in the JSON body)"""
+    reader_id = request.args.get('reader')
+    if not reader_id:
+        data = request.get_json(silent=True) or {}
+        reader_id = data.get('reader')
+    return get_reader_session(reader_id)
+
+def unknown_reader_response():
+    return jsonify({
+        'success': False,
+        'message': 'Unknown reader'
+    }), 404
+
+def warming_up_response():
+    """Scan API answer while the user directory loads: try again, not 'Card not registered'"""
+    response = jsonify({
+        'success': False,
+        'message': 'Registered users are still loading, try again shortly'
+    })
+    response.headers['Retry-After'] = str(WARMUP_RETRY_AFTER)
+    return response, 503
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    index_page, _ = get_frontend()
+    # Revalidated on every load (a 304 while unchanged) so new asset URLs are picked up at once
+    return serve_frontend_asset(index_page, "no-cache")
+
+@app.route('/assets/<name>')
+def frontend_asset(name):
+    _, assets = get_frontend()
+    asset = assets.get(name)
+    if asset is None:
+        return jsonify({'success': False, 'message': 'Unknown asset'}), 404
+    return serve_frontend_asset(asset, f"public, max-age={FRONTEND_ASSET_MAX_AGE}, immutable")
 
 @app.route('/get_rfid_status', methods=['GET'])
 def get_rfid_status():
     """Get RFID reader connection status"""
-    global rfid_connected
-    ports = detect_serial_ports()
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
+    ports = get_port_inventory()
+    with reader_sessions_lock:
+        readers = [s.status() for s in reader_sessions.values()]
     return jsonify({
-        'rfid_connected': rfid_connected,
-        'available_ports': ports
+        'reader': session.reader_id,
+        'rfid_connected': session.connected,
+        'available_ports': ports,
+        'readers': readers
     })
 
 @app.route('/manual_port', methods=['POST'])
 def set_manual_port():
     """Set manual serial port"""
-    global rfid_serial, rfid_connected
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
 
     data = request.json
     port = data.get('port')
@@ -306,22 +2969,14 @@ def set_manual_port():
     if not port:
         return jsonify({'success': False, 'message': 'No port specified'})
 
+    if port in claimed_ports(exclude=session):
+        return jsonify({'success': False, 'message': f'{port} is in use by another reader'})
+
     try:
-        if rfid_serial:
-            rfid_serial.close()
-
-        rfid_serial = serial.Serial(
-            port=port,
-            baudrate=RFID_BAUD_RATE,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            bytesize=serial.EIGHTBITS,
-            timeout=0.1
-        )
-        rfid_connected = True
+        session.attach_serial(open_rfid_serial(port), port)
         return jsonify({'success': True, 'message': f'Connected to {port}'})
     except Exception as e:
-        rfid_connected = False
+        session.mark_disconnected()
         return jsonify({'success': False, 'message': f'Failed to connect: {str(e)}'})
 
 # ... (keep all the existing routes from previous code - they remain the same)
@@ -329,7 +2984,8 @@ def set_manual_port():
 @app.route('/load_users', methods=['POST'])
 def load_users():
     try:
-        preload_registered_users()
+        data = request.get_json(silent=True) or {}
+        preload_registered_users(full=bool(data.get('full')))
         return jsonify({
             'success': True,
             'message': f'Loaded {len(REGISTERED_USERS)} registered users',
@@ -341,46 +2997,43 @@ def load_users():
             'message': f'Error loading users: {str(e)}'
         })
 
+@app.route('/get_users', methods=['GET'])
+def get_users():
+    """Registered users filtered by role, subject and/or roll_no (e.g. students of a subject)"""
+    records = REGISTERED_USERS.find(
+        role=request.args.get('role'),
+        subject=request.args.get('subject'),
+        roll_no=request.args.get('roll_no')
+    )
+    return jsonify({
+        'count': len(records),
+        'users': [dict(record.to_dict(), card_id=record.card_id) for record in records]
+    })
+
+def request_registration_entries():
+    """Registrations from an uploaded CSV file, a text/csv body or JSON {"users": [...]}"""
+    upload = request.files.get('file')
+    if upload:
+        return parse_registration_csv(upload.read().decode('utf-8'))
+    if request.is_json:
+        return request.json.get('users') or []
+    return parse_registration_csv(request.get_data(as_text=True))
+
 @app.route('/register_user', methods=['POST'])
 def register_user():
+    """Register one card locally; the uploader adds it to the Register tab in the background"""
     try:
-        data = request.json
-        card_id = data.get('card_id')
-        name = data.get('name')
-        role = data.get('role')
-        roll_no = data.get('roll_no', '-')
-        subject = data.get('subject', '-')
-
-        if not all([card_id, name, role]):
-            return jsonify({
-                'success': False,
-                'message': 'Missing required fields'
-            })
-
-        success = send_to_google_sheet(role, {
-            "card_id": card_id,
-            "role": role,
-            "name": name,
-            "roll_no": roll_no,
-            "subject": subject,
-            "date": datetime.now().strftime("%Y-%m-%d")
-        }, register_only=True)
-
-        if success:
-            REGISTERED_USERS[card_id] = {
-                "role": role,
-                "name": name,
-                "roll_no": roll_no,
-                "subject": subject
-            }
+        result = register_users([request.json or {}], overwrite=True)[0]
+        if result['status'] in ('registered', 'updated', 'unchanged'):
             return jsonify({
                 'success': True,
-                'message': 'User registered successfully!'
+                'message': 'User registered successfully!',
+                'user_count': len(REGISTERED_USERS)
             })
         else:
             return jsonify({
                 'success': False,
-                'message': 'Registration failed!'
+                'message': result['message']
             })
 
     except Exception as e:
@@ -389,219 +3042,136 @@ def register_user():
             'message': f'Error: {str(e)}'
         })
 
-@app.route('/start_attendance', methods=['POST'])
-def start_attendance():
-    global attendance_enabled, current_teacher_subject, current_teacher_card
-
+@app.route('/register_bulk', methods=['POST'])
+def register_bulk():
+    """Register many cards at once from a CSV (file upload or text/csv body) or JSON {"users": [...]}"""
     try:
-        if not REGISTERED_USERS:
-            return jsonify({
-                'success': False,
-                'message': 'No registered users found. Please load users first.'
-            })
-
-        current_slot = get_lecture_slot()
-        if not current_slot:
-            return jsonify({
-                'success': False,
-                'message': 'No active lecture session'
-            })
-
-        data = request.json
-        teacher_card = data.get('card_id')
-
-        teacher_user = REGISTERED_USERS.get(teacher_card)
-        if not teacher_user or teacher_user["role"] != "teacher":
-            return jsonify({
-                'success': False,
-                'message': 'Invalid teacher card'
-            })
-
-        now = datetime.now()
-        send_to_google_sheet("teacher", {
-            "card_id": teacher_card,
-            "name": teacher_user["name"],
-            "subject": teacher_user["subject"],
-            "time": now.strftime("%H:%M:%S"),
-            "date": now.strftime("%Y-%m-%d"),
-            "status": f"Lecture Started - Slot {current_slot}",
-            "lecture_slot": current_slot
-        })
-
-        current_teacher_subject = teacher_user["subject"]
-        current_teacher_card = teacher_card
-        attendance_enabled = True
-
+        entries = request_registration_entries()
+        overwrite = request.args.get('overwrite', request.form.get('overwrite', '')).lower() in ('1', 'true', 'yes')
+
+        results = register_users(entries, overwrite=overwrite)
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        problems = [dict(result, index=index) for index, result in enumerate(results)
+                    if result['status'] not in ('registered', 'updated')]
         return jsonify({
             'success': True,
-            'message': f'Lecture started! Subject: {current_teacher_subject}',
-            'subject': current_teacher_subject,
-            'lecture_slot': current_slot
+            'message': f"Registered {counts.get('registered', 0) + counts.get('updated', 0)} of {len(results)} cards",
+            'counts': counts,
+            'problems': problems,
+            'user_count': len(REGISTERED_USERS)
         })
-
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'Error: {str(e)}'
         })
 
-@app.route('/mark_attendance', methods=['POST'])
-def mark_attendance():
-    global attendance_enabled, current_teacher_subject, current_teacher_card
-
-    try:
-        if not attendance_enabled:
-            return jsonify({
-                'success': False,
-                'message': 'Attendance session not started'
-            })
-
-        data = request.json
-        card_id = data.get('card_id')
-
-        # Handle force end
-        if card_id == 'FORCE_END' and attendance_enabled:
-            current_slot = get_lecture_slot()
-            if current_teacher_card:
-                teacher_user = REGISTERED_USERS.get(current_teacher_card)
-                if teacher_user:
-                    send_to_google_sheet("teacher", {
-                        "card_id": current_teacher_card,
-                        "name": teacher_user["name"],
-                        "subject": teacher_user["subject"],
-                        "time": datetime.now().strftime("%H:%M:%S"),
-                        "date": datetime.now().strftime("%Y-%m-%d"),
-                        "status": "Lecture Ended (Forced)",
-                        "lecture_slot": current_slot
-                    })
-
-            attendance_enabled = False
-            current_teacher_subject = None
-            current_teacher_card = None
-
-            return jsonify({
-                'success': True,
-                'message': 'Lecture ended successfully',
-                'action': 'end_lecture'
-            })
-
-        if card_id == current_teacher_card:
-            # End lecture
-            current_slot = get_lecture_slot()
-            teacher_user = REGISTERED_USERS.get(card_id)
-            send_to_google_sheet("teacher", {
-                "card_id": card_id,
-                "name": teacher_user["name"],
-                "subject": teacher_user["subject"],
-                "time": datetime.now().strftime("%H:%M:%S"),
-                "date": datetime.now().strftime("%Y-%m-%d"),
-                "status": "Lecture Ended",
-                "lecture_slot": current_slot
-            })
-            attendance_enabled = False
-            current_teacher_subject = None
-            current_teacher_card = None
-
-            return jsonify({
-                'success': True,
-                'message': 'Lecture ended successfully',
-                'action': 'end_lecture'
-            })
-
-        user = REGISTERED_USERS.get(card_id)
-        if not user:
-            return jsonify({
-                'success': False,
-                'message': 'Card not registered'
-            })
-
-        role = user["role"]
-        now = datetime.now()
-        date_today = now.strftime("%Y-%m-%d")
-        time_now = now.strftime("%H:%M:%S")
-        current_slot = get_lecture_slot()
-
-        if role == "student":
-            status = get_student_status()
-            success = send_to_google_sheet("student", {
-                "card_id": card_id,
-                "name": user["name"],
-                "roll_no": user["roll_no"],
-                "subject": current_teacher_subject,
-                "time": time_now,
-                "date": date_today,
-                "status": status,
-                "lecture_slot": current_slot
-            })
+@app.route('/register_session', methods=['GET', 'POST'])
+def register_session():
+    """Scan-to-register: queue people (CSV or JSON, no card_id), then each tap registers the next one"""
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
+
+    if request.method == 'POST':
+        entries = request_registration_entries()
+        people = [{field: value for field, value in registration_row(entry).items() if field != 'card_id'}
+                  for entry in entries]
+        missing = [person for person in people if not person['name'] or person['role'] not in REGISTER_ROLES]
+        if missing:
+            return jsonify({'success': False, 'message': f'{len(missing)} entries lack a name or a valid role'})
+        session.register_queue = deque(people)
+        session.set_scan_mode('bulk_registration' if people else None)
+        publish_event('session', session.session_info(), session.reader_id)
+
+    pending = list(session.register_queue)
+    return jsonify({
+        'success': True,
+        'message': f'{len(pending)} people waiting for a card',
+        'remaining': len(pending),
+        'next': pending[0] if pending else None,
+        'pending': pending
+    })
 
-            if success:
-                return jsonify({
-                    'success': True,
-                    'message': f'Attendance marked: {user["name"]} - {status}',
-                    'name': user['name'],
-                    'status': status,
-                    'role': 'student'
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'message': 'Failed to send attendance data'
-                })
+@app.route('/registration_conflicts', methods=['GET'])
+def registration_conflicts():
+    """Registrations the Register tab refused because the card changed there first"""
+    conflicts = read_register_conflicts()
+    return jsonify({'count': len(conflicts), 'conflicts': conflicts})
 
-        elif role == "teacher":
-            return jsonify({
-                'success': True,
-                'message': f'Teacher attendance: {user["name"]}',
-                'name': user['name'],
-                'role': 'teacher'
-            })
+@app.route('/registration_conflicts/resolve', methods=['POST'])
+def resolve_registration_conflict():
+    data = request.json or {}
+    try:
+        return jsonify(resolve_register_conflict(int(data.get('id')), data.get('keep')))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'id must be a conflict id'})
 
-        elif role == "admin":
-            return jsonify({
-                'success': True,
-                'message': f'Admin attendance: {user["name"]}',
-                'name': user['name'],
-                'role': 'admin'
-            })
+@app.route('/start_attendance', methods=['POST'])
+def start_attendance():
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
+    if scans_on_hold.is_set():
+        return warming_up_response()
+    return jsonify(process_start_attendance(session, request.json.get('card_id'), subject=request.json.get('subject')))
 
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Error: {str(e)}'
-        })
+@app.route('/mark_attendance', methods=['POST'])
+def mark_attendance():
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
+    if scans_on_hold.is_set():
+        return warming_up_response()
+    data = request.json
+    # An optional client event_id makes retries after a timeout safe
+    event_id = data.get('event_id')
+    if event_id:
+        previous = read_client_results([str(event_id)]).get(str(event_id))
+        if previous:
+            return jsonify(dict(previous, replayed=True))
+    result = process_attendance_scan(session, data.get('card_id'))
+    if event_id and result.get('success'):
+        journal_client_events("mark_attendance", [], {str(event_id): result})
+    return jsonify(result)
+
+@app.route('/mark_attendance_batch', methods=['POST'])
+def mark_attendance_batch():
+    """Catch up many timestamped scans at once: {"scans": [{"event_id", "card_id", "scanned_at"}, ...]}"""
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
+    if scans_on_hold.is_set():
+        return warming_up_response()
+    scans = (request.get_json(silent=True) or {}).get('scans')
+    if not isinstance(scans, list) or not all(isinstance(scan, dict) for scan in scans):
+        return jsonify({'success': False, 'message': 'scans must be a list of objects'}), 400
+    if len(scans) > MARK_BATCH_MAX:
+        return jsonify({'success': False, 'message': f'At most {MARK_BATCH_MAX} scans per request'}), 413
+
+    results = process_scan_batch(scans, session)
+    counts = {}
+    for result in results:
+        outcome = 'replayed' if result.get('replayed') else scan_outcome(result)
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return jsonify({'success': True, 'counts': counts, 'results': results})
 
 @app.route('/force_end_lecture', methods=['POST'])
 def force_end_lecture():
-    global attendance_enabled, current_teacher_subject, current_teacher_card
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
 
     try:
-        if not attendance_enabled:
+        now = datetime.now()  # one timestamp for the whole event, so date/time/slot agree
+        if not end_lecture_and_journal(session, now, forced=True):
             return jsonify({
                 'success': False,
                 'message': 'No active lecture session'
             })
 
-        # Get current session info
-        current_slot = get_lecture_slot()
-
-        if current_teacher_card:
-            teacher_user = REGISTERED_USERS.get(current_teacher_card)
-            if teacher_user:
-                send_to_google_sheet("teacher", {
-                    "card_id": current_teacher_card,
-                    "name": teacher_user["name"],
-                    "subject": teacher_user["subject"],
-                    "time": datetime.now().strftime("%H:%M:%S"),
-                    "date": datetime.now().strftime("%Y-%m-%d"),
-                    "status": "Lecture Ended (Forced)",
-                    "lecture_slot": current_slot
-                })
-
-        # Reset session variables
-        attendance_enabled = False
-        current_teacher_subject = None
-        current_teacher_card = None
-
         return jsonify({
             'success': True,
             'message': 'Lecture ended successfully'
@@ -615,60 +3185,535 @@ def force_end_lecture():
 
 @app.route('/get_current_session', methods=['GET'])
 def get_current_session():
-    return jsonify({
-        'attendance_enabled': attendance_enabled,
-        'current_subject': current_teacher_subject,
-        'current_lecture_slot': get_lecture_slot()
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
+    return jsonify(session.session_info())
+
+@app.route('/get_session_log', methods=['GET'])
+def get_session_log():
+    """Get the recent lecture state transitions for a reader"""
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
+    return jsonify({'reader': session.reader_id, 'transitions': list(session.transition_log)})
+
+@app.route('/get_upload_status', methods=['GET'])
+def get_upload_status():
+    """Get write-behind queue depth and flush statistics"""
+    return jsonify(get_upload_queue_status())
+
+@app.route('/events', methods=['GET'])
+def events():
+    """Stream scan, session and reader status events for one reader"""
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
+
+    def stream():
+        client_queue = subscribe_events(session.reader_id)
+        try:
+            yield format_sse('session', session.session_info())
+            yield format_sse('rfid_status', session.rfid_status())
+            while True:
+                try:
+                    event_type, data = client_queue.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    # Keeps the connection alive and the lecture slot current
+                    event_type, data = 'session', session.session_info()
+                yield format_sse(event_type, data)
+        finally:
+            unsubscribe_events(client_queue)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
+@app.route('/reports', methods=['GET'])
+def reports():
+    """Attendance percentages, late ratios and streaks per student, subject, slot and day"""
+    if not load_numpy():
+        return jsonify({'success': False, 'message': 'Reports need numpy (pip install numpy)'}), 503
+
+    view = request.args.get('view', 'all')
+    if view not in ('all', 'students', 'subjects', 'slots', 'daily'):
+        return jsonify({'success': False, 'message': f'Unknown view: {view}'}), 400
+
+    try:
+        started = time_module.perf_counter()
+        store = get_attendance_columns()
+        new_events = store.refresh()
+        cols = store.columns()
+        report = build_attendance_report(
+            cols, view,
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to'),
+            subject=request.args.get('subject'),
+            student=request.args.get('student')
+        )
+        report.update({
+            'success': True,
+            'as_of_event': cols['last_event_id'],
+            'new_events': new_events,
+            'computed_ms': round((time_module.perf_counter() - started) * 1000, 1)
+        })
+        return jsonify(report)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Bad filter: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Warm-up progress per stage; 200 once scans are processed, 503 before"""
+    status = warmup_status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Counters, gauges and latency histograms in the Prometheus text format"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/get_backend_status', methods=['GET'])
+def get_backend_status():
+    """Get Apps Script client timings and circuit breaker state"""
+    return jsonify(backend_client_status())
+
+def aggregator_key_matches():
+    """Kiosks prove they belong to the building with the shared key; no key configured admits nobody"""
+    sent = request.headers.get(AGGREGATOR_KEY_HEADER, "")
+    return bool(AGGREGATOR_KEY) and secrets.compare_digest(sent.encode(), AGGREGATOR_KEY.encode())
+
+@app.route('/aggregator/exec', methods=['GET'])
+def aggregator_read():
+    """Register tab pages for kiosks, in the Apps Script's doGet format"""
+    if not AGGREGATOR_MODE:
+        return jsonify({"error": "This node is not an aggregator"}), 404
+    if not aggregator_key_matches():
+        return jsonify({"error": "Missing or wrong aggregator key"}), 401
+    if request.args.get('tab') != "Register":
+        return jsonify({"error": "Only the Register tab is served by the aggregator"})
+    if not register_mirror['ready']:
+        return jsonify({"error": "Registered users are still loading"}), 503
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', SHEET_PAGE_SIZE, type=int), 1), 2000)
+    return jsonify(register_mirror_page(offset, limit))
+
+@app.route('/aggregator/exec', methods=['POST'])
+def aggregator_write():
+    """Journal events forwarded by a kiosk; the kiosk advances its cursor on this answer"""
+    if not AGGREGATOR_MODE:
+        return jsonify({"success": False, "error": "This node is not an aggregator"}), 404
+    if not aggregator_key_matches():
+        return jsonify({"success": False, "error": "Missing or wrong aggregator key"}), 401
+    data = request.get_json(force=True, silent=True) or {}
+    kiosk = str(data.get("kiosk") or "").strip()
+    events = data.get("events")
+    if not kiosk or not isinstance(events, list) or not all(
+            isinstance(e, dict) and isinstance(e.get("id"), str) and isinstance(e.get("kind"), str)
+            and isinstance(e.get("row"), dict) and e["row"].get("role") for e in events):
+        return jsonify({"success": False, "error": "Expected {kiosk, events: [{id, kind, row}]}"}), 400
+    accepted, duplicates = accept_forwarded_events(kiosk, events)
+    log.debug("📥 %s forwarded %d events (%d already journaled)", kiosk, len(events), duplicates)
+    return jsonify({"success": True, "rows": accepted, "unchanged": duplicates, "conflicts": []})
+
 @app.route('/get_scanned_card', methods=['GET'])
 def get_scanned_card():
-    """Get the last scanned card ID"""
-    global last_scanned_card
-    card = last_scanned_card
-    last_scanned_card = None  # Clear after reading
-    return jsonify({'card_id': card})
+    """Get the oldest scan (card ID, mode and pipeline result) not yet collected for this reader"""
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
+    try:
+        scan = session.scan_queue.popleft()
+    except IndexError:
+        scan = {'card_id': None}
+    return jsonify(scan)
 
 @app.route('/set_scan_mode', methods=['POST'])
 def set_scan_mode():
     """Set the current scanning mode"""
-    global card_scan_callback
+    session = request_reader_session()
+    if not session:
+        return unknown_reader_response()
 
     data = request.json
     mode = data.get('mode')
+    session.set_scan_mode(mode, data.get('subject') if mode in ('start_attendance', 'auto') else None)
 
-    if mode == 'registration':
-        card_scan_callback = handle_registration_scan
-    elif mode == 'attendance':
-        card_scan_callback = handle_attendance_scan
-    elif mode == 'start_attendance':
-        card_scan_callback = handle_start_attendance_scan
-    else:
-        card_scan_callback = None
-
-    return jsonify({'success': True, 'message': f'Scan mode set to: {mode}'})
+    return jsonify({'success': True, 'message': f'Scan mode set to: {session.scan_mode}'})
 
-def handle_registration_scan(card_id):
-    """Handle card scan for registration mode"""
-    print(f"📝 Registration scan: {card_id}")
+def handle_registration_scan(session, card_id, now=None):
+    """Handle card scan for registration mode (the browser completes it with the form details)"""
+    log.debug("📝 [%s] Registration scan: %s", session.reader_id, card_id)
+    return None
 
-def handle_attendance_scan(card_id):
+def handle_bulk_registration_scan(session, card_id, now=None):
+    """Give the tapped card to the next person waiting in the bulk registration session"""
+    pending = session.register_queue
+    if not pending:
+        session.set_scan_mode(None)
+        return {'success': False, 'message': 'No one is waiting for a card'}
+    result = register_users([dict(pending[0], card_id=card_id)])[0]
+    if result['status'] not in ('registered', 'updated'):
+        # The same person gets the next card
+        return {'success': False, 'message': result['message'], 'card_id': card_id, 'remaining': len(pending)}
+    user = pending.popleft()
+    if not pending:
+        session.set_scan_mode(None)
+    log.debug("📝 [%s] Bulk registration: %s -> %s", session.reader_id, card_id, user.get('name'))
+    return {'success': True, 'message': f"{user.get('name')} registered", 'card_id': card_id,
+            'user': user, 'remaining': len(pending)}
+
+def handle_attendance_scan(session, card_id, now=None):
     """Handle card scan for attendance mode"""
-    print(f"📋 Attendance scan: {card_id}")
+    result = process_attendance_scan(session, card_id, now)
+    log.debug("📋 [%s] Attendance scan: %s - %s", session.reader_id, card_id, result['message'])
+    if result.get('action') == 'end_lecture':
+        session.set_scan_mode(None)
+    return result
 
-def handle_start_attendance_scan(card_id):
+def handle_start_attendance_scan(session, card_id, now=None):
     """Handle card scan for starting attendance"""
-    print(f"🎯 Start attendance scan: {card_id}")
+    result = process_start_attendance(session, card_id, now)
+    log.debug("🎯 [%s] Start attendance scan: %s - %s", session.reader_id, card_id, result['message'])
+    if result['success']:
+        session.set_scan_mode('attendance')
+    return result
+
+def handle_auto_scan(session, card_id, now=None):
+    """Handle card scan for headless mode: start, mark and end lectures without a browser"""
+    result = process_auto_scan(session, card_id, now)
+    log.debug("🤖 [%s] Scan: %s - %s", session.reader_id, card_id, result['message'])
+    return result
+
+SCAN_MODE_HANDLERS = {
+    'registration': handle_registration_scan,
+    'bulk_registration': handle_bulk_registration_scan,
+    'attendance': handle_attendance_scan,
+    'start_attendance': handle_start_attendance_scan,
+    'auto': handle_auto_scan
+}
 
-if __name__ == '__main__':
-    print("🏫 RFID ATTENDANCE SYSTEM READY")
-    print("Loading registered users...")
-    preload_registered_users()
+# ---------------- PRODUCTION SERVING ----------------
+
+@app.before_request
+def forward_to_hardware_owner():
+    """In worker processes, hand every API call to the hardware-owner process"""
+    if APP_ROLE != "worker" or request.endpoint in WORKER_LOCAL_ENDPOINTS:
+        return None
+    if request.endpoint == 'events':
+        return proxy_event_stream()
+
+    try:
+        status, headers, body = ipc_call({
+            'op': 'dispatch',
+            'method': request.method,
+            'path': request.path,
+            'query': request.query_string.decode('latin-1'),
+            'body': request.get_data(),
+            'content_type': request.content_type,
+            'headers': {AGGREGATOR_KEY_HEADER: request.headers.get(AGGREGATOR_KEY_HEADER, "")}
+        })
+    except (EOFError, OSError) as e:
+        log.error(f"❌ Hardware owner unreachable: {e}")
+        return jsonify({'success': False, 'message': 'Attendance service unavailable'}), 503
+    return Response(body, status=status, headers=headers)
+
+def connect_to_owner():
+    return Client(IPC_SOCKET_PATH, family='AF_UNIX', authkey=IPC_AUTHKEY)
+
+def ipc_call(message):
+    """Send one request over this thread's persistent connection to the owner"""
+    conn = getattr(ipc_local, 'conn', None)
+    if conn is None:
+        conn = ipc_local.conn = connect_to_owner()
+    try:
+        conn.send(message)
+    except (EOFError, OSError):
+        # Stale connection (owner restarted); nothing was delivered, so reconnect and resend
+        conn = ipc_local.conn = connect_to_owner()
+        conn.send(message)
+    try:
+        return conn.recv()
+    except (EOFError, OSError):
+        ipc_local.conn = None
+        raise
 
-    # Start RFID reading thread
-    print("Starting RFID reader...")
-    rfid_thread = threading.Thread(target=rfid_reading_thread, daemon=True)
-    rfid_thread.start()
+def proxy_event_stream():
+    """Relay a reader's event stream from the owner to this worker's SSE client"""
+    try:
+        conn = connect_to_owner()
+        conn.send({'op': 'subscribe', 'reader': request.args.get('reader')})
+        first = conn.recv()
+    except (EOFError, OSError) as e:
+        log.error(f"❌ Hardware owner unreachable: {e}")
+        return jsonify({'success': False, 'message': 'Attendance service unavailable'}), 503
+    if first is None:
+        conn.close()
+        return unknown_reader_response()
+
+    def stream():
+        try:
+            event = first
+            while True:
+                yield format_sse(*event)
+                event = conn.recv()
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def ipc_server_thread(listener):
+    """Accept worker connections in the hardware-owner process"""
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            log.warning(f"⚠️ Rejected IPC connection: {e}")
+            continue
+        threading.Thread(target=serve_ipc_connection, args=(conn,), daemon=True).start()
+
+def serve_ipc_connection(conn):
+    """Run forwarded requests through the real Flask routes, one connection per worker thread"""
+    client = app.test_client()
+    try:
+        while True:
+            message = conn.recv()
+            if message['op'] == 'subscribe':
+                stream_events_over_ipc(conn, message.get('reader'))
+                return
+            try:
+                response = client.open(
+                    message['path'],
+                    method=message['method'],
+                    query_string=message['query'],
+                    data=message['body'],
+                    content_type=message['content_type'],
+                    headers=message.get('headers')
+                )
+                headers = [(k, v) for k, v in response.headers if k.lower() != 'content-length']
+                conn.send((response.status_code, headers, response.get_data()))
+            except (EOFError, OSError):
+                raise
+            except Exception as e:
+                log.error(f"❌ Error handling forwarded request {message.get('path')}: {e}")
+                body = json.dumps({'success': False, 'message': f'Error: {str(e)}'}).encode()
+                conn.send((500, [('Content-Type', 'application/json')], body))
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+
+def stream_events_over_ipc(conn, reader_id):
+    session = get_reader_session(reader_id)
+    if not session:
+        conn.send(None)
+        return
+    client_queue = subscribe_events(session.reader_id)
+    try:
+        conn.send(('session', session.session_info()))
+        conn.send(('rfid_status', session.rfid_status()))
+        while True:
+            try:
+                event = client_queue.get(timeout=SSE_KEEPALIVE)
+            except queue.Empty:
+                event = ('session', session.session_info())
+            conn.send(event)
+    finally:
+        unsubscribe_events(client_queue)
 
-    app.run(debug=True, host='0.0.0.0', port=5001)
+# ---------------- STARTUP WARM-UP ----------------
 
+def process_start_time():
+    """Wall-clock time the interpreter started (Linux /proc), so import time is counted too"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time_module.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except Exception:
+        return time_module.time()
+
+PROCESS_STARTED = process_start_time()
+
+def seconds_since_start():
+    return round(time_module.time() - PROCESS_STARTED, 3)
+
+def warmup_stage(stage, state, error=None):
+    """Record a warm-up stage's progress: running, ready, retrying, failed or skipped"""
+    with warmup_lock:
+        warmup_stages[stage] = {
+            'state': state,
+            'seconds': seconds_since_start() if state in ("ready", "failed", "skipped") else None,
+            'error': error
+        }
+    if state == "ready":
+        log.info(f"⏱️ {stage} ready {seconds_since_start():.2f} s after start")
+    elif state in ("retrying", "failed"):
+        log.warning(f"⚠️ Startup stage {stage} {state}: {error}")
+
+def run_warmup_stage(stage, load):
+    """Run one warm-up step, recording how long after process start it finished"""
+    warmup_stage(stage, "running")
+    try:
+        load()
+    except Exception as e:
+        warmup_stage(stage, "failed", str(e))
+        return False
+    warmup_stage(stage, "ready")
+    return True
+
+def warmup_status():
+    with warmup_lock:
+        stages = {stage: dict(info) for stage, info in warmup_stages.items()}
+    return {
+        'ready': all(stages.get(stage, {}).get('state') == "ready" for stage in WARMUP_REQUIRED),
+        'uptime_s': seconds_since_start(),
+        'stages': stages,
+        'held_scans': len(pending_scans),
+        'first_scan_s': startup_marks['first_scan'],
+        'first_result_s': startup_marks['first_result']
+    }
+
+def load_users_for_startup():
+    """Snapshot if there is one (milliseconds), else the whole tab, retried until it arrives"""
+    load_users_snapshot()
+    while not REGISTERED_USERS and not preload_registered_users(full=True):
+        warmup_stage("users", "retrying", "no snapshot and the Register tab could not be read")
+        time_module.sleep(USERS_RETRY_DELAY)
+
+def warmup_thread():
+    """Load what scans need, then release the taps held meanwhile and start the sync threads"""
+    run_warmup_stage("timetable", load_timetable)
+    run_warmup_stage("journal", get_journal)
+    run_warmup_stage("users", load_users_for_startup)
+    release_held_scans()
+    log.info(f"🏫 RFID ATTENDANCE SYSTEM READY in {seconds_since_start():.2f} s "
+             f"({len(REGISTERED_USERS)} users, {count_unsynced_events()} rows waiting for sheet sync)")
+
+    # Keep the directory up to date and start syncing unsent rows to the sheet
+    threading.Thread(target=directory_refresh_thread, daemon=True, name="directory").start()
+    threading.Thread(target=upload_flusher_thread, daemon=True, name="uploader").start()
+
+    # Nice-to-haves, after everything a scan needs
+    run_warmup_stage("frontend", get_frontend)
+    if NUMPY_AVAILABLE:
+        # Fold the journal into the report columns now rather than on the first /reports call
+        run_warmup_stage("reports", lambda: load_numpy() and get_attendance_columns().refresh())
+    else:
+        warmup_stage("reports", "skipped", "numpy is not installed")
+
+def reader_attempted(session):
+    """Called once per reader after its first connection attempt; 'readers' is ready after the last"""
+    with warmup_lock:
+        readers_attempted.add(session.reader_id)
+        done = len(readers_attempted) >= len(reader_sessions)
+    if done:
+        connected = [s.reader_id for s in list(reader_sessions.values()) if s.connected]
+        warmup_stage("readers", "ready", None if connected else "no reader hardware found")
+
+def start_background_services():
+    """Start the readers and a warm-up thread, then return at once so HTTP can be served.
+
+    Taps are held (not dropped) until the user directory is loaded.
+    """
+    scans_on_hold.set()
+    warmup_stage("readers", "running")
+    load_reader_config()
+    threading.Thread(target=port_watcher_thread, daemon=True, name="port-watcher").start()
+    start_reader_threads()
+    threading.Thread(target=warmup_thread, daemon=True, name="warmup").start()
+
+def run_production(host, port, workers):
+    """Own the hardware here and serve HTTP from gunicorn worker processes"""
+    global APP_ROLE, IPC_AUTHKEY
+    APP_ROLE = "owner"
+
+    if not importlib.util.find_spec("gunicorn"):
+        log.warning("⚠️ gunicorn is not installed (pip install gunicorn); serving from this process only")
+        app.run(host=host, port=port, threaded=True, use_reloader=False)
+        return
+
+    IPC_AUTHKEY = secrets.token_bytes(32)
+    if os.path.exists(IPC_SOCKET_PATH):
+        os.remove(IPC_SOCKET_PATH)
+    listener = Listener(IPC_SOCKET_PATH, family='AF_UNIX', authkey=IPC_AUTHKEY)
+    os.chmod(IPC_SOCKET_PATH, 0o600)
+    threading.Thread(target=ipc_server_thread, args=(listener,), daemon=True, name="ipc").start()
+
+    env = dict(os.environ,
+               ATTENDANCE_LOG_LEVEL=logging.getLevelName(log.level),
+               ATTENDANCE_LOG_FORMAT=LOG_FORMAT,
+               ATTENDANCE_ROLE="worker",
+               ATTENDANCE_IPC_SOCKET=IPC_SOCKET_PATH,
+               ATTENDANCE_IPC_KEY=IPC_AUTHKEY.hex())
+    command = [sys.executable, "-m", "gunicorn",
+               "--workers", str(workers),
+               "--worker-class", "gthread",
+               "--threads", str(PRODUCTION_THREADS),
+               "--bind", f"{host}:{port}",
+               "app:app"]
+    log.info(f"🚀 Serving on {host}:{port} with {workers} gunicorn workers")
+    server = subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        server.wait()
+    except KeyboardInterrupt:
+        server.terminate()
+        server.wait()
+    finally:
+        listener.close()
+
+if APP_ROLE == "worker":
+    configure_logging()  # gunicorn imports this module; the owner passes its level through the environment
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="RFID attendance system")
+    parser.add_argument('--production', action='store_true',
+                        help='serve HTTP from gunicorn workers while this process owns the readers')
+    parser.add_argument('--workers', type=int, default=PRODUCTION_WORKERS)
+    parser.add_argument('--host', default=HTTP_HOST)
+    parser.add_argument('--port', type=int, default=HTTP_PORT)
+    parser.add_argument('--debug', action='store_true', help='Flask debugger (development only)')
+    parser.add_argument('--headless', action='store_true',
+                        help='readers start in auto scan mode and mark attendance without a browser')
+    parser.add_argument('--log-level', default=LOG_LEVEL, help='DEBUG, INFO, WARNING or ERROR')
+    parser.add_argument('--log-format', default=LOG_FORMAT, choices=('text', 'json'))
+    parser.add_argument('--aggregator', action='store_true', default=AGGREGATOR_MODE,
+                        help='collect scans from kiosks on the LAN and upload them for the whole building')
+    parser.add_argument('--forward-to', default=AGGREGATOR_URL, metavar='URL',
+                        help="aggregator to send scans to instead of the Apps Script, e.g. http://10.0.0.2:5001")
+    parser.add_argument('--kiosk-id', default=KIOSK_ID, help='name this kiosk reports to the aggregator')
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_format)
+    if args.headless:
+        DEFAULT_SCAN_MODE = 'auto'
+    AGGREGATOR_URL = args.forward_to
+    KIOSK_ID = args.kiosk_id
+    if (args.aggregator or AGGREGATOR_URL) and not AGGREGATOR_KEY:
+        parser.error("--aggregator and --forward-to need the shared key in ATTENDANCE_AGGREGATOR_KEY")
+    if args.aggregator:
+        AGGREGATOR_MODE = True
+        UPLOAD_BATCH_SIZE = AGGREGATOR_UPLOAD_BATCH_SIZE
+        UPLOAD_LINGER = AGGREGATOR_UPLOAD_LINGER
+        log.info("🏢 Aggregator mode: accepting scans from kiosks at /aggregator/exec")
+    if AGGREGATOR_URL:
+        log.info(f"📡 Forwarding scans to the aggregator at {AGGREGATOR_URL} as {KIOSK_ID}")
+
+    log.info("🏫 RFID attendance system starting...")
+    start_background_services()
+
+    if args.production:
+        run_production(args.host, args.port, args.workers)
+    else:
+        # No reloader: it would start a second set of reader threads on the same serial ports
+        app.run(debug=args.debug, use_reloader=False, threaded=True, host=args.host, port=args.port)
@@ -1,119 +1,651 @@
+const REGISTER_HEADERS = ["card_id", "role", "name", "roll_no", "subject", "date"];
+const REGISTER_FIELDS = ["role", "name", "roll_no", "subject"];
+
+const DEFAULT_PAGE_SIZE = 500;
+const MAX_PAGE_SIZE = 2000;
+const PAGE_PARAMS = ["offset", "limit", "fields", "date", "from", "to", "subject", "card_id"];
+
+// Partitioned roles are written to one tab per month ("Student 2026-10"). A tab named
+// just "Student" holds rows from before the rollover and is read (and split up) as well.
+const ARCHIVE_AFTER_MONTHS = 6;          // month tabs older than this move to the archive spreadsheet
+const ARCHIVE_ID_PROPERTY = "archive_spreadsheet_id";
+const REGISTER_GENERATION_PROPERTY = "register_generation";
+const REGISTER_COMPACT_RATIO = 0.2;      // rewrite the Register tab once this share of its rows is superseded
+// One wait per request, well under the kiosk's 30 s read timeout: a kiosk that gives up
+// resends the batch, so a request must not still be writing after the kiosk stopped waiting
+const LOCK_TIMEOUT_MS = 10000;
+const APPLIED_EVENT_TTL_S = 21600;       // how long a written row's event_id is remembered (the cache maximum)
+
+const ROLE_SHEETS = {
+  student: { name: "Student", headers: ["card_id", "name", "roll_no", "subject", "time", "date", "status", "role"], partitioned: true },
+  teacher: { name: "Teacher", headers: ["card_id", "name", "subject", "time", "date", "status", "role"], partitioned: true },
+  admin: { name: "Admin", headers: ["card_id", "name", "time", "date", "status", "role"] },
+  // One row per student per ended lecture: On-time, Late or Absent
+  roster: { name: "Roster", headers: ["date", "lecture_slot", "subject", "card_id", "name", "roll_no", "status", "time", "enrolled", "teacher_card"], partitioned: true }
+};
+
 function doPost(e) {
   try {
     const ss = SpreadsheetApp.getActiveSpreadsheet();
     const params = JSON.parse(e.postData.contents);
-    const role = (params.role || "").toLowerCase();
 
-    // ✅ Handle registration requests
+    // ✅ Handle batched rows from the write-behind queue
+    if (Array.isArray(params.batch)) {
+      const result = appendBatch(ss, params.batch);
+      return jsonResponse({
+        success: true,
+        message: "Batch recorded!",
+        rows: result.written,
+        unchanged: result.unchanged,
+        replayed: result.replayed,
+        conflicts: result.conflicts
+      });
+    }
+
     if (params.register_only === true) {
-      let registerSheet = ss.getSheetByName("Register");
-      if (!registerSheet) {
-        registerSheet = ss.insertSheet("Register");
-        registerSheet.appendRow(["card_id", "role", "name", "roll_no", "subject", "date"]);
+      const result = withLock(() => appendRegistrations(ss, [params]));
+      if (result.conflicts.length) {
+        return jsonResponse({ success: false, message: "Card was changed on the sheet", conflicts: result.conflicts });
       }
-
-      registerSheet.appendRow([
-        params.card_id || "-",
-        params.role || "-",
-        params.name || "-",
-        params.roll_no || "-",
-        params.subject || "-",
-        params.date || new Date()
-      ]);
-
       return jsonResponse({ success: true, message: "User registered successfully!" });
     }
 
-    // ✅ Handle attendance logging based on role
-    let sheetName = "";
-    let headers = [];
+    const target = resolveTarget(params);
+    if (!target) {
+      return jsonResponse({ success: false, message: "Invalid or missing role!" });
+    }
+
+    appendBatch(ss, [params]);
+    return jsonResponse({ success: true, message: "Attendance recorded!" });
+  } catch (error) {
+    return jsonResponse({ success: false, error: error.toString() });
+  }
+}
+
+// ✅ Write a batch of rows with one setValues() call per sheet (per month tab for partitioned roles).
+// The whole batch is written under one lock wait. Rows carry the kiosk's journal event_id: a row
+// whose id was already written (the kiosk timed out and resent the batch) is skipped.
+function appendBatch(ss, items) {
+  // Appends pick the next free row themselves, so writers (and the nightly archiver) take turns
+  return withLock(() => {
+    const registrations = items.filter(params => params.register_only === true);
+    const result = appendRegistrations(ss, registrations);
+    const rows = items.filter(params => params.register_only !== true);
+    const applied = appliedEventIds(rows);
+    const fresh = rows.filter(params => !params.event_id || !applied[String(params.event_id)]);
+    result.replayed = rows.length - fresh.length;
+    result.written += appendRows(ss, fresh);
+    rememberEventIds(fresh);
+    return result;
+  });
+}
 
-    if (role === "student") {
-      sheetName = "Student";
-      headers = ["card_id", "name", "roll_no", "subject", "time", "date", "status", "role"];
-    } else if (role === "teacher") {
-      sheetName = "Teacher";
-      headers = ["card_id", "name", "subject", "time", "date", "status", "role"];
-    } else if (role === "admin") {
-      sheetName = "Admin";
-      headers = ["card_id", "name", "time", "date", "status", "role"];
+// Attendance and roster rows, grouped by tab; returns the number of rows written
+function appendRows(ss, items) {
+  const groups = {};
+  let written = 0;
+  items.forEach(params => {
+    const target = resolveTarget(params);
+    if (!target) {
+      return;
+    }
+    const name = target.partitioned ? partitionName(target.name, partitionKey(params.date)) : target.name;
+    if (!groups[name]) {
+      groups[name] = { target: target, rows: [] };
+    }
+    if (target === ROLE_SHEETS.roster) {
+      rosterRows(params).forEach(row => groups[name].rows.push(row));
     } else {
-      return jsonResponse({ success: false, message: "Invalid or missing role!" });
+      groups[name].rows.push(buildRow(params));
     }
+  });
 
-    let sheet = ss.getSheetByName(sheetName);
-    if (!sheet) {
-      sheet = ss.insertSheet(sheetName);
-      sheet.appendRow(headers);
+  Object.keys(groups).forEach(name => {
+    const group = groups[name];
+    const rows = group.rows;
+    if (!rows.length) {
+      return;
+    }
+    const sheet = getOrCreateSheet(ss, name, group.target.headers);
+    sheet.getRange(sheet.getLastRow() + 1, 1, rows.length, group.target.headers.length).setValues(rows);
+    written += rows.length;
+  });
+  return written;
+}
+
+// Callers hold the script lock, so a resent batch sees the ids its first attempt wrote
+function appliedEventIds(items) {
+  const ids = items.filter(params => params.event_id).map(params => "event:" + params.event_id);
+  if (!ids.length) {
+    return {};
+  }
+  const cached = CacheService.getScriptCache().getAll(ids);
+  const applied = {};
+  Object.keys(cached).forEach(key => { applied[key.slice("event:".length)] = true; });
+  return applied;
+}
+
+function rememberEventIds(items) {
+  const values = {};
+  items.filter(params => params.event_id).forEach(params => { values["event:" + params.event_id] = "1"; });
+  if (Object.keys(values).length) {
+    CacheService.getScriptCache().putAll(values, APPLIED_EVENT_TTL_S);
+  }
+}
+
+// ✅ Append registrations to the Register tab, latest row per card wins.
+// A row the tab already has is skipped, so a retried batch is harmless. A row
+// whose `base` (the card as the kiosk knew it, null for a new card) no longer
+// matches the tab is refused and reported back as a conflict. Callers hold the script lock.
+function appendRegistrations(ss, items) {
+  const result = { written: 0, unchanged: 0, replayed: 0, conflicts: [] };
+  if (!items.length) {
+    return result;
+  }
+
+  const sheet = getOrCreateSheet(ss, "Register", REGISTER_HEADERS);
+  const lastRow = sheet.getLastRow();
+  const latest = {};
+  if (lastRow > 1) {
+    sheet.getRange(2, 1, lastRow - 1, REGISTER_FIELDS.length + 1).getValues().forEach(row => {
+      latest[String(row[0])] = registrationFields(row.slice(1));
+    });
+  }
+
+  const rows = [];
+  items.forEach(params => {
+    const cardId = String(params.card_id || "");
+    const current = latest[cardId] || null;
+    const local = registrationFields(REGISTER_FIELDS.map(field => params[field]));
+    if (current && sameRegistration(current, local)) {
+      result.unchanged++;
+      return;
+    }
+    // Kiosks that predate conflict checks send no base; their rows are appended as before
+    if ("base" in params) {
+      const base = params.base ? registrationFields(REGISTER_FIELDS.map(field => params.base[field])) : null;
+      const stale = base ? !current || !sameRegistration(current, base) : current !== null;
+      if (stale) {
+        result.conflicts.push({ card_id: cardId, local: local, sheet: current });
+        return;
+      }
     }
+    rows.push(buildRow(params));
+    latest[cardId] = local;
+  });
 
-    const row = [
+  if (rows.length) {
+    sheet.getRange(lastRow + 1, 1, rows.length, REGISTER_HEADERS.length).setValues(rows);
+  }
+  result.written = rows.length;
+  return result;
+}
+
+function registrationFields(values) {
+  const fields = {};
+  REGISTER_FIELDS.forEach((field, i) => {
+    const value = values[i] === undefined || values[i] === null ? "" : String(values[i]).trim();
+    fields[field] = value === "" ? "-" : value;
+  });
+  fields.role = fields.role.toLowerCase();
+  // Kiosks write "Math, Physics"; hand-typed cells may not be spaced that way
+  fields.subject = fields.subject.split(",").map(part => part.trim()).filter(part => part && part !== "-").join(", ") || "-";
+  return fields;
+}
+
+function sameRegistration(a, b) {
+  return REGISTER_FIELDS.every(field => a[field] === b[field]);
+}
+
+// ✅ A lecture's roster arrives as one item and is written with the rest of its batch
+function rosterRows(params) {
+  return (params.roster || []).map(entry => [
+    params.date || "-",
+    params.lecture_slot === undefined || params.lecture_slot === null ? "-" : params.lecture_slot,
+    params.subject || "-",
+    entry.card_id || "-",
+    entry.name || "-",
+    entry.roll_no || "-",
+    entry.status || "-",
+    entry.time || "-",
+    entry.enrolled || "-",
+    params.teacher_card || "-"
+  ]);
+}
+
+function resolveTarget(params) {
+  if (params.register_only === true) {
+    return { name: "Register", headers: REGISTER_HEADERS };
+  }
+  return ROLE_SHEETS[(params.role || "").toLowerCase()] || null;
+}
+
+// Callers hold the script lock, so two requests never both create the same tab
+function getOrCreateSheet(ss, name, headers) {
+  let sheet = ss.getSheetByName(name);
+  if (!sheet) {
+    sheet = ss.insertSheet(name);
+    sheet.appendRow(headers);
+    // New tabs come with 26 columns; a month of tabs adds up against the spreadsheet's cell limit
+    if (sheet.getMaxColumns() > headers.length) {
+      sheet.deleteColumns(headers.length + 1, sheet.getMaxColumns() - headers.length);
+    }
+  }
+  return sheet;
+}
+
+function withLock(fn) {
+  const lock = LockService.getScriptLock();
+  lock.waitLock(LOCK_TIMEOUT_MS);
+  try {
+    return fn();
+  } finally {
+    lock.releaseLock();
+  }
+}
+
+function buildRow(params) {
+  if (params.register_only === true) {
+    return [
       params.card_id || "-",
+      params.role || "-",
       params.name || "-",
+      params.roll_no || "-",
+      params.subject || "-",
+      params.date || new Date()
     ];
+  }
 
-    if (role === "student") {
-      row.push(
-        params.roll_no || "-",
-        params.subject || "-",
-        params.time || new Date().toLocaleTimeString(),
-        params.date || new Date().toLocaleDateString(),
-        params.status || "Present",
-        "Student"
-      );
-    } else if (role === "teacher") {
-      row.push(
-        params.subject || "-",
-        params.time || new Date().toLocaleTimeString(),
-        params.date || new Date().toLocaleDateString(),
-        params.status || "Present",
-        "Teacher"
-      );
-    } else if (role === "admin") {
-      row.push(
-        params.time || new Date().toLocaleTimeString(),
-        params.date || new Date().toLocaleDateString(),
-        params.status || "Active",
-        "Admin"
-      );
-    }
-
-    sheet.appendRow(row);
+  const role = (params.role || "").toLowerCase();
+  const row = [
+    params.card_id || "-",
+    params.name || "-",
+  ];
 
-    return jsonResponse({ success: true, message: "Attendance recorded!" });
-  } catch (error) {
-    return jsonResponse({ success: false, error: error.toString() });
+  if (role === "student") {
+    row.push(
+      params.roll_no || "-",
+      params.subject || "-",
+      params.time || new Date().toLocaleTimeString(),
+      params.date || new Date().toLocaleDateString(),
+      params.status || "Present",
+      "Student"
+    );
+  } else if (role === "teacher") {
+    row.push(
+      params.subject || "-",
+      params.time || new Date().toLocaleTimeString(),
+      params.date || new Date().toLocaleDateString(),
+      params.status || "Present",
+      "Teacher"
+    );
+  } else if (role === "admin") {
+    row.push(
+      params.time || new Date().toLocaleTimeString(),
+      params.date || new Date().toLocaleDateString(),
+      params.status || "Active",
+      "Admin"
+    );
   }
+
+  return row;
 }
 
 function doGet(e) {
   try {
     const ss = SpreadsheetApp.getActiveSpreadsheet();
-    const tab = e.parameter.tab;
-    const sheet = ss.getSheetByName(tab);
+    const view = resolveView(ss, e.parameter.tab, e.parameter);
 
-    if (!sheet) {
+    if (!view) {
       return jsonResponse({ error: "Sheet not found!" });
     }
 
-    const data = sheet.getDataRange().getDisplayValues(); // ← FIXED: Use getDisplayValues()
-    const headers = data[0];
-    const rows = data.slice(1);
-    
-    const json = rows.map(row => {
-      let obj = {};
-      headers.forEach((header, index) => {
-        obj[header] = row[index];
-      });
-      return obj;
-    });
+    // ✅ Paged read: any paging/filter parameter switches to bounded pages
+    if (PAGE_PARAMS.some(name => e.parameter[name] !== undefined)) {
+      return jsonResponse(readPage(view, e.parameter));
+    }
 
-    return jsonResponse(json);
+    const segments = viewSegments(view);
+    const totalRows = segments.reduce((sum, segment) => sum + segment.rows, 0);
+
+    // ✅ Incremental read: only rows after sheet row `since` (1 = header row)
+    if (e.parameter.since !== undefined) {
+      const since = Math.max(parseInt(e.parameter.since, 10) || 1, 1);
+      const rows = readObjects(segments, since - 1, totalRows - (since - 1));
+      return jsonResponse({ rows: rows, last_row: totalRows + 1, generation: view.generation });
+    }
+
+    return jsonResponse(readObjects(segments, 0, totalRows));
   } catch (error) {
     return jsonResponse({ error: error.toString() });
   }
 }
 
+// ✅ The sheets behind a tab, read back to back as if they were one. A partitioned role
+// ("Student") is its pre-rollover tab plus the month tabs the date filters can match;
+// archived months are only opened when date/from starts before the oldest live month,
+// or with archive=1. Any other name is that single tab.
+function resolveView(ss, tab, params) {
+  const target = Object.keys(ROLE_SHEETS).map(role => ROLE_SHEETS[role])
+    .find(candidate => candidate.partitioned && candidate.name === tab);
+  if (!target) {
+    const sheet = ss.getSheetByName(tab);
+    if (!sheet) {
+      return null;
+    }
+    return { sheets: [sheet], generation: tab === "Register" ? registerGeneration() : undefined };
+  }
+
+  const from = [params.date, params.from].filter(Boolean).map(date => date.slice(0, 7)).sort().pop() || null;
+  const to = [params.date, params.to].filter(Boolean).map(date => date.slice(0, 7)).sort()[0] || null;
+  const wanted = part => (!from || part.key >= from) && (!to || part.key <= to);
+
+  const live = listPartitions(ss, target.name);
+  let parts = live.filter(wanted);
+  const oldestLive = live.length ? live[0].key : null;
+  if (params.archive === "1" || (from && (!oldestLive || from < oldestLive))) {
+    const archive = openArchive();
+    if (archive) {
+      parts = listPartitions(archive, target.name).filter(wanted).concat(parts);
+    }
+  }
+
+  const legacy = ss.getSheetByName(target.name);
+  const sheets = parts.map(part => part.sheet);
+  return { sheets: legacy ? [legacy].concat(sheets) : sheets };
+}
+
+// Month tabs of `base` in a spreadsheet, oldest first
+function listPartitions(spreadsheet, base) {
+  const prefix = base + " ";
+  return spreadsheet.getSheets()
+    .map(sheet => ({ key: sheet.getName().slice(prefix.length), sheet: sheet }))
+    .filter(part => part.sheet.getName() === prefix + part.key && /^\d{4}-\d{2}$/.test(part.key))
+    .sort((a, b) => (a.key < b.key ? -1 : 1));
+}
+
+function partitionName(base, key) {
+  return base + " " + key;
+}
+
+// Month a row belongs to; rows without a usable date go to the current month
+function partitionKey(date) {
+  return monthOf(date) || Utilities.formatDate(new Date(), Session.getScriptTimeZone(), "yyyy-MM");
+}
+
+function monthOf(value) {
+  if (value === undefined || value === null || value === "") {
+    return null;
+  }
+  const date = isoDate(value);
+  return /^\d{4}-\d{2}-\d{2}$/.test(date) ? date.slice(0, 7) : null;
+}
+
+function viewSegments(view) {
+  let start = 0;
+  return view.sheets.map(sheet => {
+    const segment = { sheet: sheet, start: start, rows: Math.max(sheet.getLastRow() - 1, 0) };
+    start += segment.rows;
+    return segment;
+  });
+}
+
+// `count` data rows from `offset` across the view, as one { headers, values } chunk per sheet
+function readRows(segments, offset, count) {
+  const chunks = [];
+  segments.forEach(segment => {
+    const first = Math.max(offset, segment.start);
+    const last = Math.min(offset + count, segment.start + segment.rows);
+    if (first >= last) {
+      return;
+    }
+    const lastColumn = segment.sheet.getLastColumn();
+    chunks.push({
+      headers: segment.sheet.getRange(1, 1, 1, lastColumn).getDisplayValues()[0],
+      values: segment.sheet.getRange(first - segment.start + 2, 1, last - first, lastColumn).getDisplayValues()
+    });
+  });
+  return chunks;
+}
+
+function readObjects(segments, offset, count) {
+  return readRows(segments, offset, count)
+    .reduce((rows, chunk) => rows.concat(rowsToObjects(chunk.headers, chunk.values)), []);
+}
+
+// ✅ One page of a tab: scans at most `limit` sheet rows starting at data row `offset`
+// (0 = first row under the header), keeps those matching the filters and projects `fields`.
+// A page may hold fewer than `limit` rows when filters skip some; follow next_offset until null.
+function readPage(view, params) {
+  const offset = Math.max(parseInt(params.offset, 10) || 0, 0);
+  const limit = Math.min(Math.max(parseInt(params.limit, 10) || DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE);
+  const segments = viewSegments(view);
+  const totalRows = segments.reduce((sum, segment) => sum + segment.rows, 0);
+  const lastRow = totalRows + 1;
+  if (totalRows === 0 || offset >= totalRows) {
+    return { rows: [], offset: offset, next_offset: null, total_rows: totalRows, last_row: lastRow, generation: view.generation };
+  }
+
+  const count = Math.min(limit, totalRows - offset);
+  const rows = [];
+  readRows(segments, offset, count).forEach(chunk => {
+    const headers = chunk.headers;
+    const column = name => {
+      const index = headers.indexOf(name);
+      if (index < 0) {
+        throw new Error("Unknown column: " + name);
+      }
+      return index;
+    };
+    const filters = [];
+    ["subject", "card_id"].forEach(name => {
+      if (params[name] !== undefined) {
+        const index = column(name);
+        filters.push(row => String(row[index]) === params[name]);
+      }
+    });
+    if (params.date !== undefined || params.from !== undefined || params.to !== undefined) {
+      const index = column("date");
+      filters.push(row => {
+        const date = isoDate(row[index]);
+        return (params.date === undefined || date === params.date) &&
+          (params.from === undefined || date >= params.from) &&
+          (params.to === undefined || date <= params.to);
+      });
+    }
+
+    const fields = params.fields ? params.fields.split(",") : headers;
+    const indexes = fields.map(column);
+    chunk.values
+      .filter(row => filters.every(matches => matches(row)))
+      .forEach(row => {
+        const obj = {};
+        fields.forEach((field, i) => {
+          obj[field] = row[indexes[i]];
+        });
+        rows.push(obj);
+      });
+  });
+
+  const nextOffset = offset + count < totalRows ? offset + count : null;
+  return { rows: rows, offset: offset, next_offset: nextOffset, total_rows: totalRows, last_row: lastRow, generation: view.generation };
+}
+
+// ---------------- Nightly maintenance ----------------
+
+// ✅ Run once from the editor (Run → installTriggers) to schedule archiveOldPartitions at night
+function installTriggers() {
+  ScriptApp.getProjectTriggers()
+    .filter(trigger => trigger.getHandlerFunction() === "archiveOldPartitions")
+    .forEach(trigger => ScriptApp.deleteTrigger(trigger));
+  ScriptApp.newTrigger("archiveOldPartitions").timeBased().everyDays(1).atHour(2).create();
+}
+
+// ✅ Splits pre-rollover tabs into month tabs, moves month tabs older than
+// ARCHIVE_AFTER_MONTHS to the archive spreadsheet (dropping duplicate rows on the way)
+// and compacts the Register tab. Each step holds the script lock only for its own tab.
+function archiveOldPartitions() {
+  const ss = SpreadsheetApp.getActiveSpreadsheet();
+  const now = new Date();
+  const cutoff = Utilities.formatDate(new Date(now.getFullYear(), now.getMonth() - ARCHIVE_AFTER_MONTHS, 1),
+    Session.getScriptTimeZone(), "yyyy-MM");
+
+  Object.keys(ROLE_SHEETS).map(role => ROLE_SHEETS[role]).filter(target => target.partitioned).forEach(target => {
+    withLock(() => splitLegacyTab(ss, target, cutoff));
+    listPartitions(ss, target.name)
+      .filter(part => part.key < cutoff)
+      .forEach(part => withLock(() => archivePartition(ss, part.sheet)));
+  });
+  withLock(() => compactRegister(ss));
+}
+
+// Moves the rows of a pre-rollover tab ("Student") into month tabs; rows without a date stay
+function splitLegacyTab(ss, target, cutoff) {
+  const legacy = ss.getSheetByName(target.name);
+  if (!legacy || legacy.getLastRow() < 2) {
+    return;
+  }
+  const data = legacy.getDataRange().getValues();
+  const headers = data[0];
+  const dateIndex = headers.indexOf("date");
+  const months = {};
+  const undated = [];
+  data.slice(1).forEach(row => {
+    const key = dateIndex < 0 ? null : monthOf(row[dateIndex]);
+    if (!key) {
+      undated.push(row);
+      return;
+    }
+    (months[key] = months[key] || []).push(row);
+  });
+
+  Object.keys(months).sort().forEach(key => {
+    const name = partitionName(target.name, key);
+    const destination = key < cutoff
+      ? getOrCreateSheet(archiveSpreadsheet(ss), name, target.headers)
+      : getOrCreateSheet(ss, name, target.headers);
+    appendMapped(destination, headers, months[key]);
+  });
+
+  if (undated.length) {
+    replaceRows(legacy, undated, headers.length);
+  } else {
+    ss.deleteSheet(legacy);
+  }
+}
+
+// Appends a month tab to its namesake in the archive (a late upload may have recreated it) and deletes it
+function archivePartition(ss, sheet) {
+  const data = sheet.getDataRange().getValues();
+  const destination = getOrCreateSheet(archiveSpreadsheet(ss), sheet.getName(), data[0]);
+  appendMapped(destination, data[0], data.slice(1));
+  const archived = destination.getDataRange().getValues();
+  replaceRows(destination, uniqueRows(archived.slice(1)), archived[0].length);
+  ss.deleteSheet(sheet);
+}
+
+// ✅ Keeps only the latest row per card, in order. Kiosks read the Register tab
+// incrementally by row number, so the rewrite bumps a generation they compare
+// against to know their position is void and a full reload is needed.
+function compactRegister(ss) {
+  const sheet = ss.getSheetByName("Register");
+  if (!sheet || sheet.getLastRow() < 2) {
+    return;
+  }
+  const data = sheet.getDataRange().getValues();
+  const rows = data.slice(1);
+  const latest = {};
+  rows.forEach((row, i) => {
+    latest[String(row[0])] = i;
+  });
+  const kept = rows.filter((row, i) => latest[String(row[0])] === i);
+  if (rows.length - kept.length < rows.length * REGISTER_COMPACT_RATIO) {
+    return;
+  }
+  replaceRows(sheet, kept, data[0].length);
+  PropertiesService.getScriptProperties().setProperty(REGISTER_GENERATION_PROPERTY, new Date().toISOString());
+}
+
+function registerGeneration() {
+  return PropertiesService.getScriptProperties().getProperty(REGISTER_GENERATION_PROPERTY);
+}
+
+function openArchive() {
+  const id = PropertiesService.getScriptProperties().getProperty(ARCHIVE_ID_PROPERTY);
+  return id ? SpreadsheetApp.openById(id) : null;
+}
+
+function archiveSpreadsheet(ss) {
+  const archive = openArchive();
+  if (archive) {
+    return archive;
+  }
+  const created = SpreadsheetApp.create(ss.getName() + " (archive)");
+  PropertiesService.getScriptProperties().setProperty(ARCHIVE_ID_PROPERTY, created.getId());
+  return created;
+}
+
+// Appends rows laid out as `headers` under the destination's own header row
+function appendMapped(sheet, headers, rows) {
+  if (!rows.length) {
+    return;
+  }
+  const columns = sheet.getRange(1, 1, 1, sheet.getLastColumn()).getValues()[0];
+  const indexes = columns.map(column => headers.indexOf(column));
+  const mapped = rows.map(row => indexes.map(index => (index < 0 ? "-" : row[index])));
+  sheet.getRange(sheet.getLastRow() + 1, 1, mapped.length, columns.length).setValues(mapped);
+}
+
+// Replaces everything under the header row and drops the empty rows left behind
+function replaceRows(sheet, rows, width) {
+  const lastRow = sheet.getLastRow();
+  if (lastRow > 1) {
+    sheet.getRange(2, 1, lastRow - 1, sheet.getLastColumn()).clearContent();
+  }
+  if (rows.length) {
+    sheet.getRange(2, 1, rows.length, width).setValues(rows);
+  }
+  const spare = sheet.getMaxRows() - rows.length - 1;
+  if (spare > 0) {
+    sheet.deleteRows(rows.length + 2, spare);
+  }
+}
+
+// Retried uploads can leave identical rows behind
+function uniqueRows(rows) {
+  const seen = {};
+  return rows.filter(row => {
+    const key = JSON.stringify(row);
+    if (seen[key]) {
+      return false;
+    }
+    seen[key] = true;
+    return true;
+  });
+}
+
+// ✅ Dates are written as YYYY-MM-DD, but Sheets may have reformatted older cells
+function isoDate(value) {
+  if (/^\d{4}-\d{2}-\d{2}$/.test(value)) {
+    return value;
+  }
+  const parsed = new Date(value);
+  if (isNaN(parsed.getTime())) {
+    return String(value);
+  }
+  return Utilities.formatDate(parsed, Session.getScriptTimeZone(), "yyyy-MM-dd");
+}
+
+function rowsToObjects(headers, rows) {
+  return rows.map(row => {
+    let obj = {};
+    headers.forEach((header, index) => {
+      obj[header] = row[index];
+    });
+    return obj;
+  });
+}
+
 // ✅ Helper: Standardized JSON response
 function jsonResponse(obj) {
   return ContentService
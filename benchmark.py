@@ -0,0 +1,1265 @@
+"""Benchmarks for the RFID attendance system that run without reader hardware.
+
+Usage:
+    python benchmark.py reader [--scans N] [--interval SECONDS]
+    python benchmark.py session [--threads N] [--seconds S]
+    python benchmark.py trace [--students N] [--window S] [--out trace.csv]
+    python benchmark.py load [--trace trace.csv] [--speed X] [--path reader|http|both]
+                             [--latency S] [--jitter S] [--failure-rate P]
+    python benchmark.py reports [--students N] [--days N]
+    python benchmark.py directory [--users N]
+    python benchmark.py register [--cards N] [--latency S]
+    python benchmark.py batch [--scans N]
+    python benchmark.py startup [--students N] [--latency S]
+    python benchmark.py frontend [--bandwidth KBIT] [--rtt S] [--loads N]
+    python benchmark.py aggregator [--kiosks N] [--students N] [--window S] [--latency S] [--outage S]
+    python benchmark.py roster [--students N] [--days N]
+
+A trace is a CSV of `offset_seconds,card_id` lines; card ids are 12-character EM-18
+frames (10 hex digits + XOR checksum) so they can be replayed through the reader.
+"""
+import argparse
+import contextlib
+import csv
+import datetime
+import io
+import re
+import json
+import logging
+import os
+import pty
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+import tty
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+import flask
+import serial
+from werkzeug.serving import make_server
+
+import app
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def print_latency_report(title, latencies_ms, extra=None):
+    print(f"\n📊 {title}")
+    print(f"   samples: {len(latencies_ms)}")
+    if latencies_ms:
+        print(f"   p50: {percentile(latencies_ms, 50):.2f} ms")
+        print(f"   p95: {percentile(latencies_ms, 95):.2f} ms")
+        print(f"   p99: {percentile(latencies_ms, 99):.2f} ms")
+        print(f"   max: {max(latencies_ms):.2f} ms")
+    for key, value in (extra or {}).items():
+        print(f"   {key}: {value}")
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the app's per-scan output so it does not dominate the measurement"""
+    disabled = app.log.disabled
+    app.log.disabled = True
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        app.log.disabled = disabled
+
+
+def make_em18_frame(rng):
+    """Random EM-18 card frame with a valid checksum"""
+    data = bytes(rng.randrange(256) for _ in range(5))
+    checksum = 0
+    for byte in data:
+        checksum ^= byte
+    return data.hex().upper() + f"{checksum:02X}"
+
+
+# ---------------- READER LATENCY ----------------
+
+def bench_reader(scans, interval):
+    """Measure scan-to-callback latency of rfid_read_loop through a pseudo-terminal"""
+    master_fd, slave_fd = pty.openpty()
+    tty.setraw(slave_fd)
+    ser = serial.Serial(os.ttyname(slave_fd), app.RFID_BAUD_RATE, timeout=app.RFID_READ_TIMEOUT)
+
+    rng = random.Random(42)
+    frames = [make_em18_frame(rng) for _ in range(scans)]
+    sent_at = {}
+    latencies_ms = []
+    done = threading.Event()
+
+    def on_scan(session, card_id, now=None):
+        latencies_ms.append((time.perf_counter() - sent_at[card_id]) * 1000)
+        if len(latencies_ms) == scans:
+            done.set()
+
+    session = app.ReaderSession('bench')
+    session.card_scan_callback = on_scan
+    reader = threading.Thread(target=app.rfid_read_loop, args=(session, ser), daemon=True)
+    reader.start()
+
+    # Idle CPU: the reader should cost nothing while no card is presented
+    cpu_before = time.process_time()
+    time.sleep(1.0)
+    idle_cpu_ms = (time.process_time() - cpu_before) * 1000
+
+    for frame in frames:
+        sent_at[frame] = time.perf_counter()
+        os.write(master_fd, frame.encode('ascii') + b"\r\n")
+        time.sleep(interval)
+
+    done.wait(timeout=5 + scans * interval)
+    print_latency_report("Reader scan-to-callback latency (pty)", latencies_ms, {
+        'dropped': scans - len(latencies_ms),
+        'idle CPU over 1 s': f"{idle_cpu_ms:.1f} ms",
+    })
+
+
+# ---------------- SESSION STATE ----------------
+
+class UnsynchronizedSession:
+    """The old module-global style: three fields mutated one after another"""
+
+    def __init__(self):
+        self.attendance_enabled = False
+        self.current_teacher_subject = None
+        self.current_teacher_card = None
+
+    def start_lecture(self, teacher_card, subject):
+        self.current_teacher_subject = subject
+        self.current_teacher_card = teacher_card
+        self.attendance_enabled = True
+
+    def end_lecture(self):
+        self.attendance_enabled = False
+        self.current_teacher_subject = None
+        self.current_teacher_card = None
+
+
+def run_session_load(read_state, toggle, threads, seconds):
+    """Hammer `read_state` from reader threads while one thread keeps toggling lectures"""
+    stop = threading.Event()
+    reads = [0] * threads
+    torn = [0] * threads
+
+    def reader(index):
+        count = bad = 0
+        while not stop.is_set():
+            enabled, subject, teacher = read_state()
+            if enabled and (subject is None or teacher is None):
+                bad += 1  # a mark_attendance here would record subject=None
+            count += 1
+        reads[index] = count
+        torn[index] = bad
+
+    def toggler():
+        flip = 0
+        while not stop.is_set():
+            toggle(flip)
+            flip ^= 1
+
+    workers = [threading.Thread(target=reader, args=(i,)) for i in range(threads)]
+    workers.append(threading.Thread(target=toggler))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(reads) / seconds, sum(torn)
+
+
+def bench_session(threads, seconds):
+    """Snapshot reads of the lecture state machine vs. the old unsynchronized globals"""
+    plain = UnsynchronizedSession()
+
+    def plain_read():
+        return plain.attendance_enabled, plain.current_teacher_subject, plain.current_teacher_card
+
+    def plain_toggle(flip):
+        if flip:
+            plain.end_lecture()
+        else:
+            plain.start_lecture("T1", "Math")
+
+    session = app.ReaderSession('bench')
+    app.publish_event = lambda *args, **kwargs: None  # no subscribers; skip session_info()
+
+    def snapshot_read():
+        lecture = session.lecture
+        return lecture.attendance_enabled, lecture.subject, lecture.teacher_card
+
+    def snapshot_toggle(flip):
+        if flip:
+            session.end_lecture()
+        else:
+            session.start_lecture("T1", "Math")
+
+    # Switch threads far more often than the default 5 ms so interleavings actually happen
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    print(f"\n📊 Session state reads with {threads} reader threads + 1 toggling thread, {seconds}s each")
+    try:
+        for name, read_state, toggle in (("unsynchronized globals", plain_read, plain_toggle),
+                                         ("LectureState snapshot", snapshot_read, snapshot_toggle)):
+            rate, torn = run_session_load(read_state, toggle, threads, seconds)
+            print(f"   {name:<24} {rate:>12,.0f} reads/s   inconsistent reads: {torn}")
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+# ---------------- STUB APPS SCRIPT ----------------
+
+class StubAppsScript:
+    """Local stand-in for the Apps Script web app's doGet/doPost contract.
+
+    Every request sleeps for `latency` ± `jitter` seconds, and a `failure_rate`
+    fraction of them answer 503 (which the app's client retries).
+    """
+
+    def __init__(self, users, latency=0.0, jitter=0.0, failure_rate=0.0, seed=1):
+        self.register = [dict(user, card_id=card_id) for card_id, user in users.items()]
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.rows = defaultdict(list)  # role -> appended rows
+        self.applied = set()           # event_ids of rows already appended
+        self.stats = {'gets': 0, 'posts': 0, 'rows': 0, 'failures': 0, 'replayed': 0}
+        self.server = None
+
+    def respond(self, handler, body):
+        """Apply the configured latency/failure model, then answer `body` as JSON"""
+        with self.lock:
+            delay = max(0.0, self.rng.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+            fail = self.rng.random() < self.failure_rate
+        time.sleep(delay)
+        if fail:
+            with self.lock:
+                self.stats['failures'] += 1
+            handler.send_response(503)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return False
+        payload = json.dumps(body).encode()
+        try:
+            handler.send_response(200)
+            handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Content-Length', str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            return False  # the client went away, e.g. an app process the benchmark stopped
+        return True
+
+    def do_get(self, handler):
+        params = {name: values[0] for name, values in parse_qs(urlparse(handler.path).query).items()}
+        since = params.get('since')
+        if 'offset' in params or 'limit' in params:
+            body = self.read_page(params)
+        elif since:
+            # Sheet row 1 is the header, so data row i lives on sheet row i + 2
+            since = max(1, int(since))
+            body = {'rows': self.register[since - 1:], 'last_row': len(self.register) + 1}
+        else:
+            body = self.register
+        if self.respond(handler, body):
+            with self.lock:
+                self.stats['gets'] += 1
+
+    def read_page(self, params):
+        """Mirror of the script's readPage: scan `limit` rows from `offset`, filter, project"""
+        offset = max(0, int(params.get('offset', 0)))
+        limit = min(max(1, int(params.get('limit', 500))), 2000)
+        window = self.register[offset:offset + limit]
+        filters = {name: params[name] for name in ('subject', 'card_id', 'date') if name in params}
+        rows = [row for row in window if all(str(row.get(name)) == value for name, value in filters.items())]
+        if 'fields' in params:
+            fields = params['fields'].split(',')
+            rows = [{field: row.get(field) for field in fields} for row in rows]
+        next_offset = offset + len(window) if offset + len(window) < len(self.register) else None
+        return {'rows': rows, 'offset': offset, 'next_offset': next_offset,
+                'total_rows': len(self.register), 'last_row': len(self.register) + 1}
+
+    def do_post(self, handler):
+        payload = json.loads(handler.rfile.read(int(handler.headers.get('Content-Length', 0))) or b'{}')
+        batch = payload['batch'] if 'batch' in payload else [payload]
+        with self.lock:
+            registrations, conflicts = self.check_registrations([row for row in batch if row.get('register_only')])
+        if self.respond(handler, {'success': True, 'written': len(batch), 'conflicts': conflicts}):
+            with self.lock:
+                self.stats['posts'] += 1
+                self.stats['rows'] += len(batch)
+                self.register.extend(registrations)
+                for row in batch:
+                    if row.get('register_only'):
+                        continue
+                    # Mirror of the script's appendBatch: a row whose event_id was written is skipped
+                    if row.get('event_id') in self.applied:
+                        self.stats['replayed'] += 1
+                        continue
+                    if row.get('event_id'):
+                        self.applied.add(row['event_id'])
+                    self.rows[row.get('role')].append(row)
+
+    def check_registrations(self, rows):
+        """Mirror of the script's appendRegistrations: skip repeats, refuse edits against a stale base"""
+        fields = ('role', 'name', 'roll_no', 'subject')
+        latest = {str(row['card_id']): {field: row.get(field) for field in fields} for row in self.register}
+        accepted, conflicts = [], []
+        for row in rows:
+            local = {field: row.get(field) for field in fields}
+            current = latest.get(row['card_id'])
+            if current == local:
+                continue
+            if 'base' in row and row['base'] != current:
+                conflicts.append({'card_id': row['card_id'], 'local': local, 'sheet': current})
+                continue
+            accepted.append(dict(local, card_id=row['card_id']))
+            latest[row['card_id']] = local
+        return accepted, conflicts
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like script.google.com
+
+            def do_GET(self):
+                stub.do_get(self)
+
+            def do_POST(self):
+                stub.do_post(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}/exec"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ---------------- TRACES ----------------
+
+def make_roster(students, seed=7):
+    """Registered users for a lecture hall: `students` students plus one teacher per load path"""
+    rng = random.Random(seed)
+    users = {}
+    for i in range(students):
+        users[make_em18_frame(rng)] = {'role': 'student', 'name': f'Student {i + 1}',
+                                       'roll_no': str(i + 1), 'subject': '-'}
+    # Teachers come from their own stream so they never collide with a larger trace's students
+    teacher_rng = random.Random(seed + 1)
+    for subject in ('Reader Bench', 'HTTP Bench'):
+        users[make_em18_frame(teacher_rng)] = {'role': 'teacher', 'name': f'{subject} Teacher',
+                                       'roll_no': '-', 'subject': subject}
+    return users
+
+
+def make_trace(users, window, retap_rate=0.1, unknown_rate=0.01, seed=11):
+    """Arrivals for every student over `window` seconds, skewed towards the start of the lecture.
+
+    A `retap_rate` fraction tap again a few seconds later and an `unknown_rate`
+    fraction of taps are unregistered cards.
+    """
+    rng = random.Random(seed)
+    students = [card for card, user in users.items() if user['role'] == 'student']
+    trace = []
+    for card in students:
+        offset = rng.triangular(0, window, window * 0.15)
+        trace.append((offset, card))
+        if rng.random() < retap_rate:
+            trace.append((offset + rng.uniform(0.5, 10), card))
+    for _ in range(int(len(students) * unknown_rate)):
+        trace.append((rng.uniform(0, window), make_em18_frame(rng)))
+    trace.sort()
+    return trace
+
+
+def save_trace(trace, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        for offset, card in trace:
+            writer.writerow([f"{offset:.3f}", card])
+
+
+def load_trace(path):
+    with open(path, newline='') as f:
+        return sorted((float(offset), card) for offset, card in csv.reader(f) if offset)
+
+
+def replay(trace, speed, send):
+    """Call `send(card)` at each trace offset (compressed by `speed`); returns the scheduled times"""
+    started = time.perf_counter()
+    scheduled = []
+    for offset, card in trace:
+        due = started + offset / speed
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        scheduled.append(due)
+        send(card, due)
+    return scheduled
+
+
+# ---------------- LOAD TEST ----------------
+
+def start_bench_lecture(reader_id, subject, users):
+    """Register a reader in attendance mode and start a lecture on it"""
+    session = app.register_reader(reader_id)
+    teacher = next(card for card, user in users.items() if user.get('subject') == subject)
+    result = app.process_start_attendance(session, teacher)
+    if not result['success']:
+        raise RuntimeError(f"Could not start the {subject} lecture: {result['message']}")
+    session.set_scan_mode('attendance')
+    return session
+
+
+def load_reader_path(trace, speed, users):
+    """Replay the trace as EM-18 frames through a pty into the real reader thread"""
+    session = start_bench_lecture('bench-reader', 'Reader Bench', users)
+    master_fd, slave_fd = pty.openpty()
+    tty.setraw(slave_fd)
+    ser = serial.Serial(os.ttyname(slave_fd), app.RFID_BAUD_RATE, timeout=app.RFID_READ_TIMEOUT)
+
+    pending = defaultdict(deque)  # card -> send times still waiting for their ack
+    latencies_ms = []
+    outcomes = defaultdict(int)
+    lock = threading.Lock()
+    expected = [0]
+    debounced = [0]
+    reference = app.CardDebouncer()  # what the reader is supposed to drop on purpose
+    publish_event = app.publish_event
+
+    def on_publish(event_type, data, reader_id=None):
+        if event_type == 'scan' and reader_id == session.reader_id:
+            now = time.perf_counter()
+            with lock:
+                if pending[data['card_id']]:
+                    latencies_ms.append((now - pending[data['card_id']].popleft()) * 1000)
+                    result = data['result'] or {}
+                    outcomes['duplicate' if result.get('duplicate') else
+                             'marked' if result.get('success') else 'rejected'] += 1
+        publish_event(event_type, data, reader_id)
+
+    def send(card, due):
+        with lock:
+            if reference.accept(card, due):
+                pending[card].append(time.perf_counter())
+                expected[0] += 1
+            else:
+                debounced[0] += 1
+        os.write(master_fd, card.encode('ascii') + b"\r\n")
+
+    app.publish_event = on_publish
+    threading.Thread(target=app.rfid_read_loop, args=(session, ser), daemon=True).start()
+    cpu_before = time.process_time()
+    with quiet():
+        scheduled = replay(trace, speed, send)
+        deadline = time.perf_counter() + 10
+        while len(latencies_ms) < expected[0] and time.perf_counter() < deadline:
+            time.sleep(0.05)
+    cpu_ms = (time.process_time() - cpu_before) * 1000
+    app.publish_event = publish_event
+
+    return report_load("Reader thread: frame written -> scan result published", latencies_ms, scheduled, {
+        'sent': len(trace),
+        'debounced (intended)': debounced[0],
+        'dropped': expected[0] - len(latencies_ms),
+        **dict(outcomes),
+        'process CPU per 1000 scans (incl. stub)': f"{cpu_ms / max(1, len(trace)) * 1000:.0f} ms",
+        'EM-18 wire time at 9600 baud': f"{14 * 10 / app.RFID_BAUD_RATE * 1000:.1f} ms/frame",
+    })
+
+
+def load_http_path(trace, speed, users, clients):
+    """Replay the trace as POST /mark_attendance calls against a threaded local server"""
+    session = start_bench_lecture('bench-http', 'HTTP Bench', users)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no access log line per request
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/mark_attendance?reader={session.reader_id}"
+
+    local = threading.local()
+    latencies_ms = []
+    outcomes = defaultdict(int)
+    lock = threading.Lock()
+
+    def post(card, due):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        try:
+            response = local.session.post(url, json={'card_id': card}, timeout=30)
+            result = response.json() if response.status_code == 200 else None
+        except requests.exceptions.RequestException:
+            result = None
+        latency_ms = (time.perf_counter() - due) * 1000  # includes time queued for a free client
+        with lock:
+            if result is None:
+                outcomes['dropped'] += 1
+                return
+            latencies_ms.append(latency_ms)
+            outcomes['duplicate' if result.get('duplicate') else
+                     'marked' if result.get('success') else 'rejected'] += 1
+
+    cpu_before = time.process_time()
+    with quiet(), ThreadPoolExecutor(max_workers=clients) as pool:
+        scheduled = replay(trace, speed, lambda card, due: pool.submit(post, card, due))
+    cpu_ms = (time.process_time() - cpu_before) * 1000
+    server.shutdown()
+
+    return report_load(f"POST /mark_attendance ({clients} clients): scheduled -> response",
+                       latencies_ms, scheduled, {
+        'sent': len(trace),
+        'dropped': outcomes.pop('dropped', 0),
+        **dict(outcomes),
+        'process CPU per 1000 scans (incl. stub + clients)': f"{cpu_ms / max(1, len(trace)) * 1000:.0f} ms",
+    })
+
+
+def report_load(title, latencies_ms, scheduled, extra):
+    elapsed = (scheduled[-1] - scheduled[0]) if len(scheduled) > 1 else 0
+    offered = len(scheduled) / elapsed if elapsed else 0
+    print_latency_report(title, latencies_ms, dict({
+        'offered load': f"{offered:.1f} scans/s ({offered * 60:,.0f}/min)",
+    }, **extra))
+
+
+def wait_for_upload_drain(stub, timeout):
+    """Wait until the flusher has pushed every journaled row to the stub backend"""
+    started = time.perf_counter()
+    with quiet():
+        while app.count_unsynced_events() and time.perf_counter() - started < timeout:
+            time.sleep(0.1)
+    status = app.get_upload_queue_status()
+    backend = app.backend_client_status()
+    print(f"\n📤 Sheet sync after the replay")
+    print(f"   drained in: {time.perf_counter() - started:.1f} s (queue depth now {status['queue_depth']})")
+    print(f"   rows sent: {status['rows_sent']} in {status['batches_sent']} batches, "
+          f"{status['failed_batches']} failed batches")
+    print(f"   stub backend: {stub.stats['posts']} POSTs, {stub.stats['rows']} rows, "
+          f"{stub.stats['failures']} injected failures")
+    print(f"   client retries: {backend.get('retries')}, fast failures: {backend.get('fast_failures')}")
+
+
+def bench_load(args):
+    """End-to-end load test against a stub Apps Script backend"""
+    users = make_roster(args.students)
+    if args.trace:
+        trace = load_trace(args.trace)
+        # Cards in the trace that are not in the roster are registered as extra students
+        for _, card in trace:
+            users.setdefault(card, {'role': 'student', 'name': card, 'roll_no': card, 'subject': '-'})
+    else:
+        trace = make_trace(users, args.window)
+
+    stub = StubAppsScript(users, args.latency, args.jitter, args.failure_rate)
+    workdir = tempfile.mkdtemp(prefix='attendance-bench-')
+    app.WEB_APP_URL = stub.start()
+    app.JOURNAL_DB_PATH = os.path.join(workdir, 'journal.db')
+    app.USERS_SNAPSHOT_PATH = os.path.join(workdir, 'registered_users.json')
+    # One slot covering the whole day so the lecture is always in session
+    app.TIMETABLE = app.Timetable({'grace_minutes': 1, 'slots': {'1': ['00:00:00', '23:59:59']}})
+
+    with quiet():
+        app.preload_registered_users(full=True)
+        app.get_journal()
+        threading.Thread(target=app.upload_flusher_thread, daemon=True).start()
+    print(f"🏫 {len(app.REGISTERED_USERS)} registered users, {len(trace)} scans over "
+          f"{trace[-1][0]:.0f} s replayed at {args.speed}x; backend latency {args.latency}±{args.jitter} s, "
+          f"failure rate {args.failure_rate:.0%}")
+
+    if args.path in ('reader', 'both'):
+        load_reader_path(trace, args.speed, users)
+    if args.path in ('http', 'both'):
+        load_http_path(trace, args.speed, users, args.clients)
+    wait_for_upload_drain(stub, args.drain_timeout)
+    stub.stop()
+
+
+# ---------------- REPORTS ----------------
+
+def fill_semester_journal(students, days, slots=4, subjects=12, cohort=60, seed=5):
+    """Journal a semester of lectures: cohorts of `cohort` students, `slots` lectures a day"""
+    rng = random.Random(seed)
+    conn = app.get_journal()
+    first_day = datetime.date(2026, 1, 5).toordinal()
+    rows = []
+    for day_offset in range(days):
+        date = datetime.date.fromordinal(first_day + day_offset).isoformat()
+        for slot in range(1, slots + 1):
+            for group in range(0, students, cohort):
+                subject = f"Subject {(group // cohort + slot + day_offset) % subjects + 1}"
+                rows.append(("start_attendance", {"role": "teacher", "card_id": f"T{group}", "subject": subject,
+                                                  "date": date, "lecture_slot": slot, "time": "09:00:00"}))
+                for student in range(group, min(group + cohort, students)):
+                    if rng.random() < 0.85:
+                        rows.append(("mark_attendance", {
+                            "role": "student", "card_id": f"S{student:05d}", "name": f"Student {student}",
+                            "roll_no": str(student), "subject": subject, "date": date, "lecture_slot": slot,
+                            "time": "09:05:00", "status": "Late" if rng.random() < 0.15 else "On-time"}))
+    with app.journal_lock:
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO events (recorded_at, kind, payload) VALUES (?, ?, ?)",
+                         ((payload["date"], kind, json.dumps(payload)) for kind, payload in rows))
+        conn.execute("COMMIT")
+    return sum(1 for kind, _ in rows if kind == "mark_attendance")
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def bench_reports(students, days):
+    """Columnar report build, snapshot and query times over a synthetic semester"""
+    if not app.load_numpy():
+        print("❌ numpy is not installed (pip install numpy)")
+        return
+    workdir = tempfile.mkdtemp(prefix='attendance-bench-')
+    app.JOURNAL_DB_PATH = os.path.join(workdir, 'journal.db')
+    app.REPORTS_SNAPSHOT_PATH = os.path.join(workdir, 'attendance_columns.npz')
+    with quiet():
+        scans, fill_ms = timed(fill_semester_journal, students, days)
+    print(f"\n📊 Reports over {students} students x {days} days: {scans:,} attendance rows "
+          f"(journal filled in {fill_ms / 1000:.1f} s)")
+
+    store = app.AttendanceColumns()
+    events, cold_ms = timed(store.refresh)
+    print(f"   cold build from journal: {cold_ms:,.0f} ms ({events:,} events)")
+    with store.lock:
+        _, save_ms = timed(store.save_snapshot)
+    size_mb = os.path.getsize(app.REPORTS_SNAPSHOT_PATH) / 1e6
+    print(f"   snapshot write: {save_ms:,.0f} ms ({size_mb:.1f} MB)")
+
+    store = app.AttendanceColumns()
+    with quiet():
+        _, load_ms = timed(store.load_snapshot)
+    print(f"   snapshot load (restart): {load_ms:,.0f} ms")
+
+    # One more lecture arriving after the snapshot
+    with quiet():
+        for student in range(60):
+            app.journal_event("mark_attendance", "student", {
+                "card_id": f"S{student:05d}", "name": f"Student {student}", "roll_no": str(student),
+                "subject": "Subject 1", "date": "2026-06-01", "lecture_slot": 1, "time": "09:01:00",
+                "status": "On-time"})
+    events, incremental_ms = timed(store.refresh)
+    print(f"   incremental refresh: {incremental_ms:.1f} ms ({events} new events)")
+
+    cols = store.columns()
+    for view, kwargs in (("subjects", {}), ("slots", {}), ("daily", {}), ("students", {}),
+                         ("students", {"student": "S00042"}), ("all", {"subject": "Subject 3"})):
+        _, query_ms = timed(app.build_attendance_report, cols, view, **kwargs)
+        label = view + (f" {kwargs}" if kwargs else "")
+        print(f"   /reports view={label:<32} {query_ms:8.1f} ms")
+
+
+def bench_roster(students, days, cohort=60):
+    """Absentees of one lecture: rebuilt from the attendance history vs. the roster built as it ends"""
+    workdir = tempfile.mkdtemp(prefix='attendance-bench-')
+    app.JOURNAL_DB_PATH = os.path.join(workdir, 'journal.db')
+    with quiet():
+        scans = fill_semester_journal(students, days, cohort=cohort)
+    # The semester's first lecture in slot 1, held for every 12th cohort (see fill_semester_journal)
+    subject, date, slot = "Subject 2", "2026-01-05", 1
+    app.REGISTERED_USERS = app.UserDirectory(app.parse_registered_user({
+        'card_id': f"S{i:05d}", 'role': 'student', 'name': f"Student {i}", 'roll_no': str(i),
+        'subject': subject if (i // cohort) % 12 == 0 else "Elsewhere"}) for i in range(students))
+
+    def rebuild():
+        # What a report had to do: every attendance row against the Register tab
+        expected = {record.card_id for record in app.REGISTERED_USERS.students_in(subject)}
+        seen = {row['card_id'] for row in app.read_journal_payloads("mark_attendance", "")
+                if row['date'] == date and row['lecture_slot'] == slot and row['subject'] == subject}
+        return expected - seen
+
+    absent, rebuild_ms = timed(rebuild)
+    session = app.ReaderSession("roster-bench")
+    for row in app.read_journal_payloads("mark_attendance", date):
+        if (row['date'], row['lecture_slot'], row['subject']) == (date, slot, subject):
+            session.check_in((date, slot, subject), row['card_id'], row['time'], row['status'])  # the live taps
+    ended = app.LectureState(True, "T0", subject, slot, f"{date}T09:00:00", 1)
+    roster, roster_ms = timed(app.lecture_roster, session, ended)
+    assert roster['absent'] == len(absent)
+    print(f"\n📊 Absentees of one {len(roster['roster'])}-student lecture, {scans:,} attendance rows in the history")
+    print(f"   rebuilt from history:   {rebuild_ms:10.2f} ms ({len(absent)} absent)")
+    print(f"   roster at lecture end:  {roster_ms:10.2f} ms ({roster['absent']} absent, "
+          f"{len(roster['roster'])} roster rows in one journal event)")
+
+
+# ---------------- USER DIRECTORY ----------------
+
+def make_register_json(count, seed=3):
+    """Register tab as the doGet JSON text: students enrol in one of 60 five-subject programmes"""
+    rng = random.Random(seed)
+    subjects = [f"Subject {i}" for i in range(40)]
+    programmes = [", ".join(rng.sample(subjects, 5)) for _ in range(60)]
+    rows = []
+    for i in range(count):
+        draw = rng.random()
+        role = "Student" if draw < 0.95 else "Teacher" if draw < 0.99 else "Admin"
+        subject = rng.choice(programmes) if role == "Student" else rng.choice(subjects)
+        rows.append({"card_id": f"{i:012X}", "role": role, "name": f"User {i}",
+                     "roll_no": str(100000 + i) if role == "Student" else "-", "subject": subject})
+    return json.dumps(rows)
+
+
+def measure_footprint(build):
+    """Bytes allocated by `build()` that are still alive afterwards"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return result, size
+
+
+def bench_directory(count):
+    """Footprint and lookup latency of UserDirectory vs. the old dict of dicts"""
+    text = make_register_json(count)
+    cards = [row["card_id"] for row in json.loads(text)]
+
+    # Both start from the doGet response text, so every string they keep is counted
+    def build_dicts():
+        return {str(u["card_id"]): {"role": u["role"].lower(), "name": u["name"],
+                                    "roll_no": u.get("roll_no", "-"), "subject": u.get("subject", "-")}
+                for u in json.loads(text)}
+
+    def build_directory():
+        return app.UserDirectory(app.parse_registered_user(u) for u in json.loads(text))
+
+    old, old_bytes = measure_footprint(build_dicts)
+    new, new_bytes = measure_footprint(build_directory)
+
+    rng = random.Random(1)
+    probe = [rng.choice(cards) for _ in range(100000)] + ["UNKNOWN"] * 1000
+
+    def old_lookup():
+        for card in probe:
+            user = old.get(card)
+            if user and user["role"] == "teacher":
+                user["subject"]
+            elif user:
+                user["name"], user["roll_no"]
+
+    def new_lookup():
+        for card in probe:
+            user = new.get(card)
+            if user and user.role == "teacher":
+                user.subject
+            elif user:
+                user.name, user.roll_no
+
+    def old_students_in():
+        return [user for user in old.values() if user["role"] == "student"
+                and "Subject 7" in [part.strip() for part in user["subject"].split(",")]]
+
+    def new_students_in():
+        return new.students_in("Subject 7")
+
+    assert len(old_students_in()) == len(new_students_in())
+    old_ns = min(timeit.repeat(old_lookup, number=1, repeat=5)) / len(probe) * 1e9
+    new_ns = min(timeit.repeat(new_lookup, number=1, repeat=5)) / len(probe) * 1e9
+    old_query = min(timeit.repeat(old_students_in, number=1, repeat=5)) * 1000
+    new_query = min(timeit.repeat(new_students_in, number=1, repeat=5)) * 1000
+
+    # A Register tab where a fifth of the cards were re-registered later (later rows win)
+    rows = json.loads(text)
+    superseded = rows + [dict(row, name=row["name"] + " (re-registered)") for row in rows[::5]]
+    build_superseded = min(timeit.repeat(
+        lambda: app.UserDirectory(app.parse_registered_user(u) for u in superseded), number=1, repeat=3)) * 1000
+
+    print(f"\n📊 User directory with {count:,} cards")
+    print(f"   {'':<26}{'dict of dicts':>16}{'UserDirectory':>16}")
+    print(f"   {'memory (incl. indexes)':<26}{old_bytes / 1e6:>13.1f} MB{new_bytes / 1e6:>13.1f} MB")
+    print(f"   {'lookup + role check':<26}{old_ns:>13.0f} ns{new_ns:>13.0f} ns")
+    print(f"   {'students in a subject':<26}{old_query:>13.2f} ms{new_query:>13.2f} ms")
+    print(f"   build with {len(superseded) - count:,} superseded rows: {build_superseded:.0f} ms")
+
+
+# ---------------- REGISTRATION ----------------
+
+def make_new_cards(count, seed=21):
+    rng = random.Random(seed)
+    return [{'card_id': make_em18_frame(rng), 'role': 'student', 'name': f'New Student {i + 1}',
+             'roll_no': f'N{i + 1}', 'subject': 'Math, Physics'} for i in range(count)]
+
+
+def bench_register(count, latency, old_samples):
+    """Registration throughput of the old blocking POST vs. local-first registration and bulk sync"""
+    users = make_roster(200)
+    stub = StubAppsScript(users, latency)
+    workdir = tempfile.mkdtemp(prefix='attendance-bench-')
+    app.WEB_APP_URL = stub.start()
+    app.JOURNAL_DB_PATH = os.path.join(workdir, 'journal.db')
+    app.USERS_SNAPSHOT_PATH = os.path.join(workdir, 'registered_users.json')
+    with quiet():
+        app.preload_registered_users(full=True)
+        app.get_journal()
+        threading.Thread(target=app.upload_flusher_thread, daemon=True).start()
+    client = app.app.test_client()
+    cards = make_new_cards(count * 3 + old_samples)
+    print(f"🏫 {len(app.REGISTERED_USERS)} registered users; backend latency {latency} s")
+
+    # Before: every registration waited for its own POST to the sheet
+    latencies = []
+    for card in cards[:old_samples]:
+        started = time.perf_counter()
+        app.send_to_google_sheet(card['role'], dict(card, date='2026-01-01'), register_only=True)
+        latencies.append((time.perf_counter() - started) * 1000)
+    print_latency_report("Blocking registration (one POST per card, before)", latencies, {
+        'throughput': f"{1000 / (sum(latencies) / len(latencies)):.1f} cards/s"})
+    cards = cards[old_samples:]
+
+    latencies = []
+    for card in cards[:count]:
+        started = time.perf_counter()
+        assert client.post('/register_user', json=card).get_json()['success']
+        latencies.append((time.perf_counter() - started) * 1000)
+    print_latency_report("Local-first /register_user", latencies, {
+        'throughput': f"{1000 / (sum(latencies) / len(latencies)):,.0f} cards/s"})
+
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=['card_id', 'role', 'name', 'roll_no', 'subject'])
+    writer.writeheader()
+    writer.writerows(cards[count:count * 2] + cards[:5])  # 5 repeats of cards registered above
+    started = time.perf_counter()
+    result = client.post('/register_bulk', data=text.getvalue(), content_type='text/csv').get_json()
+    elapsed = time.perf_counter() - started
+    print(f"\n📥 /register_bulk: {count + 5} CSV rows in {elapsed * 1000:.1f} ms ({result['counts']})")
+
+    session = app.get_reader_session()
+    client.post('/register_session', json={'users': [dict(card, card_id=None) for card in cards[count * 2:]]})
+    latencies = []
+    with quiet():
+        for card in cards[count * 2:]:
+            started = time.perf_counter()
+            app.dispatch_card_scan(session, card['card_id'])
+            latencies.append((time.perf_counter() - started) * 1000)
+    print_latency_report("Scan-to-register session (tap to registered)", latencies,
+                         {'still waiting': len(session.register_queue)})
+
+    wait_for_upload_drain(stub, 120)
+    registered = {row['card_id'] for row in stub.register}
+    missing = [card['card_id'] for card in cards if card['card_id'] not in registered]
+    print(f"   Register tab rows: {len(stub.register)}, new cards missing: {len(missing)}")
+
+    # Another kiosk edits a card; this one then edits its stale copy of the same card
+    victim = cards[0]
+    with stub.lock:
+        stub.register.append(dict(victim, name='Edited Elsewhere'))
+    client.post('/register_user', json=dict(victim, name='Edited Here'))
+    with quiet():
+        while app.count_unsynced_events():
+            time.sleep(0.1)
+    conflicts = client.get('/registration_conflicts').get_json()
+    print(f"   conflicts: {conflicts['count']} "
+          f"({', '.join(c['local']['name'] + ' vs ' + c['sheet']['name'] for c in conflicts['conflicts'])}); "
+          f"local copy now: {app.REGISTERED_USERS.get(victim['card_id']).name}")
+    stub.stop()
+
+
+# ---------------- BATCH ATTENDANCE ----------------
+
+def bench_batch(scans):
+    """Catching up an offline backlog: one /mark_attendance call per scan vs. /mark_attendance_batch"""
+    users = make_roster(scans)
+    workdir = tempfile.mkdtemp(prefix='attendance-bench-')
+    app.JOURNAL_DB_PATH = os.path.join(workdir, 'journal.db')
+    app.TIMETABLE = app.Timetable({'grace_minutes': 1, 'slots': {'1': ['00:00:00', '23:59:59']}})
+    app.REGISTERED_USERS = app.UserDirectory(app.parse_registered_user(dict(user, card_id=card))
+                                             for card, user in users.items())
+    students = [card for card, user in users.items() if user['role'] == 'student']
+    client = app.app.test_client()
+    now = datetime.datetime.now()
+    backlog = [{'event_id': f'handheld-{i}', 'card_id': card, 'scanned_at': now.isoformat()}
+               for i, card in enumerate(students)]
+
+    with quiet():
+        # Before: one request per scan, into a running lecture
+        teacher = next(card for card, user in users.items() if user['subject'] == 'Reader Bench')
+        client.post('/start_attendance', json={'card_id': teacher})
+        started = time.perf_counter()
+        for scan in backlog:
+            client.post('/mark_attendance', json={'card_id': scan['card_id'], 'event_id': scan['event_id']})
+        per_scan = time.perf_counter() - started
+        client.post('/force_end_lecture', json={})
+
+        # After: the same backlog for another day's lecture, in one request
+        yesterday = (now - datetime.timedelta(days=1)).isoformat()
+        batch = [dict(scan, event_id='batch-' + scan['event_id'], scanned_at=yesterday, subject='Catch-up')
+                 for scan in backlog]
+        started = time.perf_counter()
+        counts = client.post('/mark_attendance_batch', json={'scans': batch}).get_json()['counts']
+        batched = time.perf_counter() - started
+        started = time.perf_counter()
+        replay = client.post('/mark_attendance_batch', json={'scans': batch}).get_json()['counts']
+        replayed = time.perf_counter() - started
+    print(f"\n📊 Catching up {len(backlog):,} offline scans")
+    print(f"   one request per scan: {per_scan:.2f} s ({len(backlog) / per_scan:,.0f} scans/s)")
+    print(f"   one batch request:    {batched:.2f} s ({len(backlog) / batched:,.0f} scans/s) {counts}")
+    print(f"   replaying the batch:  {replayed:.2f} s {replay}")
+    print(f"   journal rows: {app.count_unsynced_events()}")
+
+
+# ---------------- COLD START ----------------
+
+def free_port():
+    with contextlib.closing(socket.socket()) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def cold_start(workdir, url, card, master_fd, timeout=60):
+    """Start app.py in `workdir` with a card already on the reader; returns its /ready report"""
+    port = free_port()
+    env = dict(os.environ, ATTENDANCE_WEB_APP_URL=url)
+    started = time.time()
+    server = subprocess.Popen([sys.executable, os.path.abspath(app.__file__), '--port', str(port),
+                               '--log-level', 'WARNING'], cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    http_up = None
+    report = None
+    try:
+        next_tap = 0
+        while time.time() - started < timeout:
+            if time.time() >= next_tap:
+                # A student taps from the moment the Pi powers on until answered (repeats are debounced)
+                os.write(master_fd, card.encode('ascii') + b"\r\n")
+                next_tap = time.time() + 0.1
+            try:
+                response = requests.get(f'http://127.0.0.1:{port}/ready', timeout=0.5)
+            except requests.exceptions.RequestException:
+                time.sleep(0.02)
+                continue
+            http_up = http_up or time.time() - started
+            report = response.json()
+            if report['ready'] and report['first_result_s'] is not None:
+                break
+            time.sleep(0.02)
+    finally:
+        server.terminate()
+        server.wait()
+    return http_up, report
+
+
+def bench_startup(students, latency):
+    """Time to accept HTTP, to be ready and to answer the first tap: first boot vs. restart"""
+    users = make_roster(students)
+    stub = StubAppsScript(users, latency)
+    url = stub.start()
+    workdir = tempfile.mkdtemp(prefix='attendance-bench-')
+    master_fd, slave_fd = pty.openpty()
+    tty.setraw(slave_fd)  # kept open so taps written before the app opens the port wait in the pty
+    with open(os.path.join(workdir, 'readers.json'), 'w') as f:
+        json.dump([{'id': 'door', 'port': os.ttyname(slave_fd), 'scan_mode': 'auto'}], f)
+    card = next(card for card, user in users.items() if user['role'] == 'student')
+
+    runs = [('first boot (no snapshot)', cold_start(workdir, url, card, master_fd)),
+            ('restart (snapshot on disk)', cold_start(workdir, url, card, master_fd))]
+    stub.stop()
+
+    print(f"\n📊 Cold start with {len(users):,} users, backend latency {latency} s (seconds after process start)")
+    print(f"   {'':<24}" + "".join(f"{title:>28}" for title, _ in runs))
+    rows = [('HTTP answering', lambda http_up, report: http_up),
+            ('first tap accepted', lambda http_up, report: report['first_scan_s']),
+            ('first tap answered', lambda http_up, report: report['first_result_s'])]
+    rows += [(f'stage: {stage}', lambda http_up, report, stage=stage: report['stages'].get(stage, {}).get('seconds'))
+             for stage in ('timetable', 'journal', 'users', 'readers', 'frontend', 'reports')]
+    for label, value in rows:
+        cells = [value(*result) if result[1] else None for _, result in runs]
+        print(f"   {label:<24}" + "".join(f"{cell:>26.2f} s" if cell is not None else f"{'-':>28}"
+                                          for cell in cells))
+
+
+# ---------------- FRONTEND ----------------
+
+def bench_frontend(bandwidth_kbit, rtt, loads):
+    """Page-load bytes and modelled load time: the inline page rendered per request vs. cached assets"""
+    if not os.path.exists(os.path.join(app.app.root_path, app.app.template_folder, 'index.html')):
+        app.app.template_folder = app.app.root_path  # a checkout keeps index.html next to app.py
+    client = app.app.test_client()
+    headers = {'Accept-Encoding': 'gzip, deflate, br'}
+    overhead = 300  # response headers, roughly
+
+    # Before: one page with the CSS and JS inline, rendered and sent uncompressed on every load
+    with open(os.path.join(app.app.template_folder, 'index.html'), encoding='utf-8') as f:
+        shell = f.read()
+    inline = shell
+    for name in app.FRONTEND_ASSETS:
+        with open(os.path.join(app.app.static_folder, name), encoding='utf-8') as f:
+            body = f.read()
+        tag = '<style>' + body + '</style>' if name.endswith('.css') else '<script>' + body + '</script>'
+        inline = re.sub(r'<(link|script)[^>]*' + re.escape(name) + r'[^>]*>(</script>)?', lambda _: tag, inline)
+    with app.app.app_context():
+        old_ms = min(timeit.repeat(lambda: flask.render_template_string(inline), number=20, repeat=5)) / 20 * 1000
+    old_bytes = len(inline.encode()) + overhead
+
+    # After: the page revalidates (304), the fingerprinted assets come from the browser cache
+    first = client.get('/', headers=headers)
+    urls = re.findall(r'/assets/[^"]+', client.get('/').get_data(as_text=True))
+    assets = [client.get(url, headers=headers) for url in urls]
+    repeat_headers = dict(headers, **{'If-None-Match': first.headers['ETag']})
+    new_ms = min(timeit.repeat(lambda: client.get('/', headers=repeat_headers), number=20, repeat=5)) / 20 * 1000
+    first_page = len(first.data) + overhead
+    first_assets = sum(len(asset.data) + overhead for asset in assets)
+    repeat_bytes = overhead
+
+    def link_ms(nbytes, round_trips=1):
+        return round_trips * rtt * 1000 + nbytes * 8 / bandwidth_kbit
+
+    old_load = link_ms(old_bytes) + old_ms
+    # HTML first, then the stylesheet and script in parallel
+    first_load = link_ms(first_page) + link_ms(first_assets)
+    repeat_load = link_ms(repeat_bytes) + new_ms
+    encoding = first.headers.get('Content-Encoding') or 'identity'
+    print(f"\n📊 Frontend page load over {bandwidth_kbit} kbit/s, {rtt * 1000:.0f} ms RTT ({encoding})")
+    print(f"   {'':<28}{'inline page':>14}{'cached assets':>16}")
+    print(f"   {'first load bytes':<28}{old_bytes:>12,} B{first_page + first_assets:>14,} B")
+    print(f"   {'reload bytes':<28}{old_bytes:>12,} B{repeat_bytes:>14,} B")
+    print(f"   {'server time per page':<28}{old_ms:>11.2f} ms{new_ms:>13.2f} ms")
+    print(f"   {'first load (modelled)':<28}{old_load:>11.0f} ms{first_load:>13.0f} ms")
+    print(f"   {'reload (modelled)':<28}{old_load:>11.0f} ms{repeat_load:>13.0f} ms")
+    print(f"   {f'{loads} reloads transferred':<28}{old_bytes * loads / 1e6:>11.2f} MB"
+          f"{(first_page + first_assets + repeat_bytes * (loads - 1)) / 1e6:>13.2f} MB")
+
+
+# ---------------- BUILDING AGGREGATOR ----------------
+
+def start_app(workdir, port, env, *args):
+    """Run app.py from `workdir` on `port` with its output discarded"""
+    return subprocess.Popen([sys.executable, os.path.abspath(app.__file__), '--port', str(port),
+                             '--log-level', 'WARNING', *args], cwd=workdir,
+                            env=dict(os.environ, ATTENDANCE_AGGREGATOR_KEY='bench-building-key', **env),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/ready', timeout=0.5).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f'app on port {port} did not become ready')
+
+
+def run_building(users, kiosks, window, latency, aggregated, outage):
+    """Every kiosk streams its room's scans over `window` seconds; returns upstream and drain figures"""
+    stub = StubAppsScript(users, latency)
+    url = stub.start()
+    students = [card for card, user in users.items() if user['role'] == 'student']
+    rooms = [students[k::kiosks] for k in range(kiosks)]
+    processes = []
+    aggregator = None
+    if aggregated:
+        aggregator = {'dir': tempfile.mkdtemp(prefix='attendance-aggregator-'), 'port': free_port()}
+        aggregator['process'] = start_app(aggregator['dir'], aggregator['port'], {'ATTENDANCE_WEB_APP_URL': url},
+                                          '--aggregator')
+        wait_ready(aggregator['port'])
+
+    ports = []
+    for k in range(kiosks):
+        workdir = tempfile.mkdtemp(prefix=f'attendance-kiosk{k}-')
+        with open(os.path.join(workdir, 'timetable.json'), 'w') as f:
+            json.dump({'grace_minutes': 1, 'slots': {'1': ['00:00:00', '23:59:59']}}, f)
+        ports.append(free_port())
+        forward = ('--forward-to', f"http://127.0.0.1:{aggregator['port']}", '--kiosk-id', f'room-{k}') if aggregated else ()
+        processes.append(start_app(workdir, ports[-1], {'ATTENDANCE_WEB_APP_URL': url}, *forward))
+    for port in ports:
+        wait_ready(port)
+    gets_before = stub.stats['gets']
+
+    def kiosk(k):
+        rng = random.Random(k)
+        due = sorted(rng.uniform(0, window) for _ in rooms[k])
+        started = time.time()
+        with requests.Session() as http:
+            for i, (card, at) in enumerate(zip(rooms[k], due)):
+                time.sleep(max(0.0, started + at - time.time()))
+                scan = {'event_id': f'room-{k}-{i}', 'card_id': card,
+                        'scanned_at': datetime.datetime.now().isoformat(), 'subject': f'Room {k}'}
+                result = http.post(f'http://127.0.0.1:{ports[k]}/mark_attendance_batch', json={'scans': [scan]})
+                assert result.json()['results'][0]['success'], result.text
+
+    def outage_window():
+        # The aggregator goes away mid-lecture; kiosks keep their rows in their journals meanwhile
+        time.sleep(window / 3)
+        aggregator['process'].terminate()
+        aggregator['process'].wait()
+        time.sleep(outage)
+        aggregator['process'] = start_app(aggregator['dir'], aggregator['port'], {'ATTENDANCE_WEB_APP_URL': url},
+                                          '--aggregator')
+
+    started = time.time()
+    threads = [threading.Thread(target=kiosk, args=(k,)) for k in range(kiosks)]
+    if aggregated and outage:
+        threads.append(threading.Thread(target=outage_window))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    last_scan = time.time()
+    expected = len(students)
+    while len(stub.rows['student']) < expected and time.time() - last_scan < 180:
+        time.sleep(0.1)
+    drained = time.time() - last_scan
+    time.sleep(2)  # anything still in flight would show up as a duplicate
+
+    rows = stub.rows['student']
+    result = {'scans': expected, 'rows': len(rows), 'unique': len({(row['card_id'], row['subject']) for row in rows}),
+              'posts': stub.stats['posts'], 'scan_gets': stub.stats['gets'] - gets_before,
+              'startup_gets': gets_before, 'seconds': last_scan - started, 'drained': drained}
+    for process in processes + ([aggregator['process']] if aggregator else []):
+        process.terminate()
+        process.wait()
+    stub.stop()
+    return result
+
+
+def bench_aggregator(kiosks, students, window, latency, outage):
+    """Upstream Apps Script calls with every kiosk uploading directly vs. through one aggregator"""
+    users = make_roster(kiosks * students)
+    runs = [('kiosks → Apps Script', run_building(users, kiosks, window, latency, False, 0)),
+            (f'via aggregator ({outage:.0f} s outage)', run_building(users, kiosks, window, latency, True, outage))]
+
+    print(f"\n📊 {kiosks} kiosks × {students} students over {window:.0f} s, backend latency {latency} s")
+    print(f"   {'':<30}" + "".join(f"{title:>34}" for title, _ in runs))
+    rows = [('Apps Script POSTs', lambda r: f"{r['posts']:,}"),
+            ('rows per POST', lambda r: f"{r['rows'] / max(r['posts'], 1):.1f}"),
+            ('Apps Script GETs at startup', lambda r: f"{r['startup_gets']:,}"),
+            ('rows in the sheet / scans', lambda r: f"{r['rows']:,} / {r['scans']:,}"),
+            ('duplicate rows', lambda r: f"{r['rows'] - r['unique']:,}"),
+            ('last scan → sheet', lambda r: f"{r['drained']:.1f} s")]
+    for label, value in rows:
+        print(f"   {label:<30}" + "".join(f"{value(result):>34}" for _, result in runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    reader = sub.add_parser('reader', help='scan-to-callback latency through a pty stand-in reader')
+    reader.add_argument('--scans', type=int, default=200)
+    reader.add_argument('--interval', type=float, default=0.02, help='seconds between simulated taps')
+
+    session = sub.add_parser('session', help='lecture state reads under concurrent start/end transitions')
+    session.add_argument('--threads', type=int, default=4)
+    session.add_argument('--seconds', type=float, default=2.0)
+
+    trace = sub.add_parser('trace', help='write a synthetic lecture-hall arrival trace')
+    trace.add_argument('--students', type=int, default=300)
+    trace.add_argument('--window', type=float, default=600, help='seconds over which students arrive')
+    trace.add_argument('--retap-rate', type=float, default=0.1)
+    trace.add_argument('--unknown-rate', type=float, default=0.01)
+    trace.add_argument('--out', default='trace.csv')
+
+    load = sub.add_parser('load', help='replay a trace through the reader thread and /mark_attendance')
+    load.add_argument('--trace', help='CSV trace to replay (default: a synthetic one)')
+    load.add_argument('--students', type=int, default=300)
+    load.add_argument('--window', type=float, default=600, help='arrival window of the synthetic trace')
+    load.add_argument('--speed', type=float, default=20, help='replay speed-up over the trace offsets')
+    load.add_argument('--path', choices=('reader', 'http', 'both'), default='both')
+    load.add_argument('--clients', type=int, default=8, help='concurrent HTTP clients')
+    load.add_argument('--latency', type=float, default=0.8, help='stub backend latency (s)')
+    load.add_argument('--jitter', type=float, default=0.3, help='stub backend latency std-dev (s)')
+    load.add_argument('--failure-rate', type=float, default=0.05, help='fraction of stub calls answering 503')
+    load.add_argument('--drain-timeout', type=float, default=120)
+
+    reports = sub.add_parser('reports', help='columnar report build and query times over a synthetic semester')
+    reports.add_argument('--students', type=int, default=3000)
+    reports.add_argument('--days', type=int, default=100, help='teaching days in the semester')
+
+    directory = sub.add_parser('directory', help='user directory footprint and lookup latency vs. a dict of dicts')
+    directory.add_argument('--users', type=int, default=50000)
+
+    register = sub.add_parser('register', help='registration throughput: blocking POSTs vs. local-first bulk sync')
+    register.add_argument('--cards', type=int, default=300, help='cards per registration path')
+    register.add_argument('--latency', type=float, default=0.8, help='stub backend latency (s)')
+    register.add_argument('--old-samples', type=int, default=10, help='cards sent through the blocking path')
+
+    batch = sub.add_parser('batch', help='offline backlog catch-up: per-scan requests vs. one batch request')
+    batch.add_argument('--scans', type=int, default=5000)
+
+    startup = sub.add_parser('startup', help='cold start: time to HTTP, readiness and the first answered tap')
+    startup.add_argument('--students', type=int, default=5000)
+    startup.add_argument('--latency', type=float, default=2.0, help='stub backend latency (s)')
+
+    frontend = sub.add_parser('frontend', help='page-load bytes and time: inline page vs. cached, compressed assets')
+    frontend.add_argument('--bandwidth', type=float, default=1000, help='kiosk link speed (kbit/s)')
+    frontend.add_argument('--rtt', type=float, default=0.1, help='kiosk link round-trip time (s)')
+    frontend.add_argument('--loads', type=int, default=100, help='page loads per kiosk per day')
+
+    aggregator = sub.add_parser('aggregator', help='upstream requests: kiosks uploading directly vs. via an aggregator')
+    aggregator.add_argument('--kiosks', type=int, default=10)
+    aggregator.add_argument('--students', type=int, default=60, help='scans per kiosk')
+    aggregator.add_argument('--window', type=float, default=30, help='seconds over which students arrive')
+    aggregator.add_argument('--latency', type=float, default=0.8, help='stub backend latency (s)')
+    aggregator.add_argument('--outage', type=float, default=8, help='seconds the aggregator is down mid-run')
+
+    roster = sub.add_parser('roster', help='absentees of a lecture: rebuilt from history vs. roster at lecture end')
+    roster.add_argument('--students', type=int, default=3000)
+    roster.add_argument('--days', type=int, default=60, help='teaching days of history')
+
+    args = parser.parse_args()
+    if args.command == 'reader':
+        bench_reader(args.scans, args.interval)
+    elif args.command == 'session':
+        bench_session(args.threads, args.seconds)
+    elif args.command == 'trace':
+        users = make_roster(args.students)
+        trace = make_trace(users, args.window, args.retap_rate, args.unknown_rate)
+        save_trace(trace, args.out)
+        print(f"✅ Wrote {len(trace)} scans over {trace[-1][0]:.0f} s to {args.out}")
+    elif args.command == 'load':
+        bench_load(args)
+    elif args.command == 'reports':
+        bench_reports(args.students, args.days)
+    elif args.command == 'directory':
+        bench_directory(args.users)
+    elif args.command == 'register':
+        bench_register(args.cards, args.latency, args.old_samples)
+    elif args.command == 'batch':
+        bench_batch(args.scans)
+    elif args.command == 'startup':
+        bench_startup(args.students, args.latency)
+    elif args.command == 'frontend':
+        bench_frontend(args.bandwidth, args.rtt, args.loads)
+    elif args.command == 'roster':
+        bench_roster(args.students, args.days)
+    elif args.command == 'aggregator':
+        bench_aggregator(args.kiosks, args.students, args.window, args.latency, args.outage)
+
+
+if __name__ == '__main__':
+    main()
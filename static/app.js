@@ -0,0 +1,532 @@
+    let currentScanMode = null;
+    let scanInterval = null;
+    let messageCounter = 0;
+
+    // Which RFID reader (classroom door) this page controls, e.g. /?reader=room-101
+    const READER_ID = new URLSearchParams(window.location.search).get('reader');
+
+    function apiUrl(path) {
+        return READER_ID ? `${path}?reader=${encodeURIComponent(READER_ID)}` : path;
+    }
+
+    // Initialize page
+    document.addEventListener('DOMContentLoaded', function() {
+        loadUsers();
+        updateRfidStatus();
+        if (window.EventSource) {
+            // Server pushes scans, session changes and reader status
+            connectEventStream();
+        } else {
+            updateSessionInfo();
+            startCardScanning();
+            setInterval(updateSessionInfo, 3000);
+            setInterval(updateRfidStatus, 8000);
+        }
+        toggleRoleFields(); // Initialize role fields
+    });
+
+    function connectEventStream() {
+        const events = new EventSource(apiUrl('/events'));
+
+        events.addEventListener('scan', e => {
+            handleScannedCard(JSON.parse(e.data));
+        });
+        events.addEventListener('session', e => {
+            renderSessionInfo(JSON.parse(e.data));
+        });
+        events.addEventListener('rfid_status', e => {
+            renderRfidStatus(JSON.parse(e.data).rfid_connected);
+        });
+        events.onerror = () => {
+            // EventSource reconnects by itself; show the reader as unknown meanwhile
+            document.getElementById('rfidStatus').textContent = '❌';
+        };
+    }
+
+    function switchTab(tabName) {
+        // Hide all tabs
+        document.querySelectorAll('.tab-content').forEach(tab => {
+            tab.classList.remove('active');
+        });
+        document.querySelectorAll('.tab-btn').forEach(btn => {
+            btn.classList.remove('active');
+        });
+
+        // Show selected tab
+        document.getElementById(tabName + 'Tab').classList.add('active');
+        event.target.classList.add('active');
+    }
+
+    async function updateRfidStatus() {
+        try {
+            const response = await fetch(apiUrl('/get_rfid_status'));
+            const data = await response.json();
+
+            const portSelect = document.getElementById('portSelect');
+
+            // Update available ports
+            portSelect.innerHTML = '<option value="">Select a port...</option>';
+            data.available_ports.forEach(port => {
+                const option = document.createElement('option');
+                option.value = port.device;
+                option.textContent = `${port.device} - ${port.description}`;
+                portSelect.appendChild(option);
+            });
+
+            renderRfidStatus(data.rfid_connected);
+
+        } catch (error) {
+            console.error('Error updating RFID status:', error);
+            document.getElementById('rfidStatus').textContent = '❌';
+        }
+    }
+
+    function renderRfidStatus(connected) {
+        const statusElement = document.getElementById('rfidStatus');
+        if (connected) {
+            statusElement.textContent = '✅';
+            statusElement.style.color = '#28a745';
+        } else {
+            statusElement.textContent = '❌';
+            statusElement.style.color = '#dc3545';
+        }
+    }
+
+    function showPortSelector() {
+        document.getElementById('portSelector').classList.toggle('hidden');
+        updateRfidStatus(); // refresh the port list
+    }
+
+    async function connectToPort() {
+        const portSelect = document.getElementById('portSelect');
+        const selectedPort = portSelect.value;
+
+        if (!selectedPort) {
+            showMessage('Please select a port', 'error');
+            return;
+        }
+
+        try {
+            const response = await fetch(apiUrl('/manual_port'), {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ port: selectedPort })
+            });
+
+            const data = await response.json();
+
+            if (data.success) {
+                showMessage(data.message, 'success');
+                document.getElementById('portSelector').classList.add('hidden');
+                updateRfidStatus();
+            } else {
+                showMessage(data.message, 'error');
+            }
+        } catch (error) {
+            showMessage('Error connecting to port: ' + error.message, 'error');
+        }
+    }
+
+    function startCardScanning() {
+        scanInterval = setInterval(checkForScannedCard, 500);
+    }
+
+    async function checkForScannedCard() {
+        try {
+            const response = await fetch(apiUrl('/get_scanned_card'));
+            const data = await response.json();
+
+            if (data.card_id) {
+                handleScannedCard(data);
+            }
+        } catch (error) {
+            console.error('Error checking for scanned card:', error);
+        }
+    }
+
+    // The server already ran the scan through the attendance pipeline; show its result
+    function handleScannedCard(scan) {
+        const cardId = scan.card_id;
+        document.getElementById('lastScannedCard').textContent = cardId;
+        document.getElementById('scannedCardInfo').classList.remove('hidden');
+
+        const indicator = document.getElementById('scanIndicator');
+        indicator.textContent = '✅';
+        setTimeout(() => {
+            indicator.textContent = '📱';
+        }, 1000);
+
+        switch(scan.mode) {
+            case 'registration':
+                completeRegistration(cardId);
+                break;
+            case 'bulk_registration':
+                if (scan.result) {
+                    const next = scan.result.remaining ? ` (${scan.result.remaining} left)` : '';
+                    showMessage(scan.result.message + next, scan.result.success ? 'success' : 'error');
+                }
+                break;
+            case 'start_attendance':
+                showStartResult(scan.result, scan.mode);
+                break;
+            case 'attendance':
+            case 'auto':
+                if (scan.result && scan.result.lecture_slot) {
+                    showStartResult(scan.result, scan.mode);
+                } else {
+                    showAttendanceResult(scan.result, scan.mode);
+                }
+                break;
+            default:
+                showMessage(`Card scanned: ${cardId} (No active mode)`, 'info');
+        }
+    }
+
+    function setScanMode(mode) {
+        currentScanMode = mode;
+        const modeElement = document.getElementById('currentScanMode');
+        const instructionElement = document.getElementById('scanInstruction');
+
+        // Reset all mode indicators
+        document.querySelectorAll('.btn').forEach(btn => {
+            btn.style.opacity = '1';
+        });
+
+        switch(mode) {
+            case 'registration':
+                modeElement.textContent = '📝 REGISTRATION MODE';
+                instructionElement.textContent = 'Scan an RFID card to register it';
+                document.getElementById('registerModeBtn').style.opacity = '0.8';
+                break;
+            case 'start_attendance':
+                modeElement.textContent = '🎯 START SESSION MODE';
+                instructionElement.textContent = 'Scan teacher card to start session';
+                document.getElementById('startAttendanceBtn').style.opacity = '0.8';
+                break;
+            case 'attendance':
+                modeElement.textContent = '📋 ATTENDANCE MODE';
+                instructionElement.textContent = 'Scan student cards for attendance';
+                document.getElementById('markAttendanceBtn').style.opacity = '0.8';
+                break;
+            default:
+                modeElement.textContent = 'No active scan mode';
+                instructionElement.textContent = 'Select an action and scan RFID card';
+        }
+
+        fetch(apiUrl('/set_scan_mode'), {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ mode: mode, subject: mode === 'start_attendance' ? lectureSubject() : null })
+        });
+    }
+
+    // Shown when a teacher of several subjects taps without one picked
+    function lectureSubject() {
+        const group = document.getElementById('lectureSubjectGroup');
+        return group.style.display === 'none' ? null : document.getElementById('lectureSubject').value || null;
+    }
+
+    function askLectureSubject(subjects) {
+        const select = document.getElementById('lectureSubject');
+        select.innerHTML = '';
+        select.add(new Option('Choose...', ''));
+        subjects.forEach(subject => select.add(new Option(subject, subject)));
+        document.getElementById('lectureSubjectGroup').style.display = 'block';
+    }
+
+    function setRegistrationMode() {
+        const name = document.getElementById('regName').value;
+        const role = document.getElementById('regRole').value;
+
+        if (!name) {
+            showMessage('Please enter name before scanning card', 'error');
+            return;
+        }
+
+        setScanMode('registration');
+        document.getElementById('registrationStatus').classList.remove('hidden');
+        document.getElementById('registrationStatus').textContent = 'Ready to scan RFID card for registration...';
+        showMessage('Registration mode activated. Scan RFID card.', 'info');
+    }
+
+    async function completeRegistration(cardId) {
+        const name = document.getElementById('regName').value;
+        const role = document.getElementById('regRole').value;
+        const rollNo = document.getElementById('regRollNo').value;
+        const subject = document.getElementById('regSubject').value;
+
+        try {
+            const response = await fetch(apiUrl('/register_user'), {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    card_id: cardId,
+                    name: name,
+                    role: role,
+                    roll_no: rollNo,
+                    subject: subject
+                })
+            });
+
+            const data = await response.json();
+
+            if (data.success) {
+                showMessage(`✅ User registered! Card: ${cardId}`, 'success');
+                // Clear form
+                document.getElementById('regName').value = '';
+                document.getElementById('regRollNo').value = '';
+                document.getElementById('regSubject').value = '';
+                document.getElementById('registrationStatus').classList.add('hidden');
+                document.getElementById('userCount').textContent = data.user_count;
+                setScanMode(null);
+            } else {
+                showMessage(data.message, 'error');
+            }
+        } catch (error) {
+            showMessage('Error registering user: ' + error.message, 'error');
+        }
+    }
+
+    // Register a CSV of cards at once, or queue a CSV of people and hand out cards by scanning
+    async function importRegistrations(endpoint) {
+        const file = document.getElementById('bulkFile').files[0];
+        if (!file) {
+            showMessage('Please choose a CSV file first', 'error');
+            return;
+        }
+        const form = new FormData();
+        form.append('file', file);
+
+        try {
+            const response = await fetch(apiUrl(endpoint), { method: 'POST', body: form });
+            const data = await response.json();
+            if (!data.success) {
+                showMessage(data.message, 'error');
+            } else if (endpoint === '/register_session') {
+                showMessage(`${data.message}. Scan a card for ${data.next ? data.next.name : 'each person'}.`, 'info');
+            } else {
+                const problems = data.problems.length ? ` ${data.problems.length} rows skipped, see console.` : '';
+                showMessage(data.message + '.' + problems, data.problems.length ? 'info' : 'success');
+                data.problems.forEach(problem => console.warn(`Row ${problem.index + 1}: ${problem.message}`));
+                document.getElementById('userCount').textContent = data.user_count;
+            }
+        } catch (error) {
+            showMessage('Error importing registrations: ' + error.message, 'error');
+        }
+    }
+
+    function setStartAttendanceMode() {
+        setScanMode('start_attendance');
+        showMessage('Scan teacher RFID card to start session', 'info');
+    }
+
+    function showStartResult(data, mode) {
+        if (data.success) {
+            document.getElementById('lectureSubjectGroup').style.display = 'none';
+            showMessage(data.message, 'success');
+            if (mode !== 'auto') {
+                setScanMode('attendance');
+            }
+            updateSessionInfo();
+            loadUsers();
+            switchTab('manage');
+            document.getElementById('startAttendanceBtn').style.display = 'none';
+            document.getElementById('endLectureBtn').style.display = 'block';
+            document.getElementById('markAttendanceBtn').style.display = 'block';
+            document.getElementById('markAttendanceBtn').textContent = '📋 Marking...';
+            document.getElementById('markAttendanceBtn').style.background = '#28a745';
+            document.getElementById('markAttendanceBtn').disabled = false;
+            document.getElementById('endLectureBtn').disabled = false;
+            document.getElementById('startAttendanceBtn').disabled = true;
+            document.getElementById('startAttendanceBtn').style.background = '#6c757d';
+            document.getElementById('startAttendanceBtn').textContent = '▶️ Session Active';
+            document.getElementById('startAttendanceBtn').style.opacity = '0.6';
+        } else {
+            if (data.choose_subject && mode !== 'auto') {
+                askLectureSubject(data.choose_subject);
+            }
+            showMessage(data.message, 'error');
+        }
+    }
+
+function setAttendanceMode() {
+    setScanMode('attendance');
+    showMessage('Attendance mode active. Scan student cards.', 'info');
+}
+
+function showAttendanceResult(data, mode) {
+    if (data.success) {
+        if (data.action === 'end_lecture') {
+            showMessage('Lecture ended successfully', 'success');
+            if (mode !== 'auto') {
+                setScanMode(null);
+            }
+            resetSessionUI();
+        } else {
+            showMessage(data.message, 'success');
+        }
+    } else {
+        showMessage(data.message, 'error');
+    }
+    updateSessionInfo();
+}
+
+function resetSessionUI() {
+    document.getElementById('startAttendanceBtn').style.display = 'block';
+    document.getElementById('endLectureBtn').style.display = 'block';
+    document.getElementById('markAttendanceBtn').style.display = 'block';
+    document.getElementById('markAttendanceBtn').textContent = '📋 Mark Attendance';
+    document.getElementById('markAttendanceBtn').style.background = '';
+    document.getElementById('markAttendanceBtn').disabled = false;
+    document.getElementById('endLectureBtn').disabled = false;
+    document.getElementById('startAttendanceBtn').disabled = false;
+    document.getElementById('startAttendanceBtn').style.background = '';
+    document.getElementById('startAttendanceBtn').textContent = '▶️ Start Session';
+    document.getElementById('startAttendanceBtn').style.opacity = '1';
+}
+
+async function endLecture() {
+    if (!confirm('Are you sure you want to end the current lecture?')) {
+        return;
+    }
+
+    try {
+        const response = await fetch(apiUrl('/force_end_lecture'), {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            }
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            showMessage('Lecture ended successfully', 'success');
+            setScanMode(null);
+            resetSessionUI();
+            updateSessionInfo();
+        } else {
+            showMessage(data.message, 'error');
+        }
+    } catch (error) {
+        showMessage('Error ending lecture: ' + error.message, 'error');
+    }
+}
+
+function forceEndSession() {
+    endLecture();
+}
+
+function toggleRoleFields() {
+    const role = document.getElementById('regRole').value;
+    const rollNoGroup = document.getElementById('rollNoGroup');
+    const subjectGroup = document.getElementById('subjectGroup');
+
+    if (role === 'student') {
+        rollNoGroup.style.display = 'block';
+        subjectGroup.style.display = 'none';
+    } else if (role === 'teacher') {
+        rollNoGroup.style.display = 'none';
+        subjectGroup.style.display = 'block';
+    } else {
+        rollNoGroup.style.display = 'none';
+        subjectGroup.style.display = 'none';
+    }
+}
+
+function showMessage(message, type = 'info') {
+    const container = document.getElementById('messageContainer');
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message message-${type}`;
+    messageDiv.textContent = message;
+
+    // Add timestamp
+    const timestamp = new Date().toLocaleTimeString();
+    messageDiv.innerHTML = `<small style="color: #666;">[${timestamp}]</small> ${message}`;
+
+    container.appendChild(messageDiv);
+
+    // Auto-remove after 8 seconds
+    setTimeout(() => {
+        if (messageDiv.parentNode) {
+            messageDiv.remove();
+        }
+    }, 8000);
+
+    // Keep only last 10 messages
+    while (container.children.length > 10) {
+        container.removeChild(container.firstChild);
+    }
+
+    // Auto-scroll to bottom
+    container.scrollTop = container.scrollHeight;
+}
+
+async function loadUsers() {
+    const btn = document.getElementById('loadUsersBtn');
+    btn.classList.add('loading');
+
+    try {
+        const response = await fetch(apiUrl('/load_users'), {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            }
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            showMessage(data.message, 'success');
+            document.getElementById('userCount').textContent = data.user_count || '0';
+        } else {
+            showMessage(data.message, 'error');
+        }
+    } catch (error) {
+        showMessage('Error loading users: ' + error.message, 'error');
+    } finally {
+        btn.classList.remove('loading');
+    }
+}
+
+async function updateSessionInfo() {
+    try {
+        const response = await fetch(apiUrl('/get_current_session'));
+        renderSessionInfo(await response.json());
+    } catch (error) {
+        console.error('Error updating session info:', error);
+    }
+}
+
+function renderSessionInfo(data) {
+    const sessionStatus = document.getElementById('sessionStatus');
+    const sessionActive = document.getElementById('sessionActive');
+    const currentSubject = document.getElementById('currentSubject');
+    const currentSlot = document.getElementById('currentSlot');
+    const lectureSlot = document.getElementById('lectureSlot');
+
+    if (data.attendance_enabled) {
+        sessionStatus.textContent = 'Active';
+        sessionStatus.style.color = '#28a745';
+        sessionActive.textContent = 'Active';
+        currentSubject.textContent = data.current_subject || '-';
+        currentSlot.textContent = data.current_lecture_slot || '-';
+        lectureSlot.textContent = data.current_lecture_slot || '-';
+    } else {
+        sessionStatus.textContent = 'Inactive';
+        sessionStatus.style.color = '#dc3545';
+        sessionActive.textContent = 'Inactive';
+        currentSubject.textContent = '-';
+        currentSlot.textContent = '-';
+        lectureSlot.textContent = data.current_lecture_slot || '-';
+    }
+}
+
+// Initialize
+toggleRoleFields();
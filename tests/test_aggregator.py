@@ -0,0 +1,34 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def aggregator(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "JOURNAL_DB_PATH", str(tmp_path / "journal.db"))
+    monkeypatch.setattr(app, "journal_conn", None)
+    monkeypatch.setattr(app, "AGGREGATOR_MODE", True)
+    monkeypatch.setattr(app, "AGGREGATOR_KEY", "building-key")
+    yield app.app.test_client()
+    if app.journal_conn is not None:
+        app.journal_conn.close()
+
+
+FORWARDED = {"kiosk": "room-101", "events": [
+    {"id": "room-101/1/1", "kind": "register", "row": {"role": "student", "register_only": True, "card_id": "X"}}]}
+
+
+@pytest.mark.parametrize("key", [None, "", "wrong-key"])
+def test_the_aggregator_refuses_callers_without_the_building_key(aggregator, key):
+    headers = {app.AGGREGATOR_KEY_HEADER: key} if key is not None else {}
+
+    assert aggregator.post("/aggregator/exec", json=FORWARDED, headers=headers).status_code == 401
+    assert aggregator.get("/aggregator/exec?tab=Register", headers=headers).status_code == 401
+    assert app.read_journal_payloads("register", "") == []
+
+
+def test_a_kiosk_with_the_building_key_is_accepted(aggregator):
+    response = aggregator.post("/aggregator/exec", json=FORWARDED, headers={app.AGGREGATOR_KEY_HEADER: "building-key"})
+
+    assert response.get_json()['rows'] == 1
+    assert [row['card_id'] for row in app.read_journal_payloads("register", "")] == ["X"]
@@ -0,0 +1,185 @@
+from datetime import datetime
+
+import pytest
+
+import app
+
+
+LECTURE_DAY = datetime(2026, 3, 2)  # a Monday
+
+
+def at(clock):
+    hour, minute = map(int, clock.split(":"))
+    return LECTURE_DAY.replace(hour=hour, minute=minute)
+
+
+@pytest.fixture
+def kiosk(tmp_path, monkeypatch):
+    """A reader with slot 2 (10:30-12:30, Math), a teacher of Math and Physics, four students of Math and a staff card"""
+    monkeypatch.setattr(app, "JOURNAL_DB_PATH", str(tmp_path / "journal.db"))
+    monkeypatch.setattr(app, "journal_conn", None)
+    monkeypatch.setattr(app, "TIMETABLE", app.Timetable({"grace_minutes": 15, "slots": {"2": ["10:30:00", "12:30:00", "Math"]}}))
+    monkeypatch.setattr(app, "REGISTERED_USERS", app.UserDirectory([
+        app.UserRecord("T1", "Teacher", "Teacher One", subject="Math, Physics"),
+        app.UserRecord("A", "Student", "Student A", "1", "Math"),
+        app.UserRecord("B", "Student", "Student B", "2", "Math"),
+        app.UserRecord("C", "Student", "Student C", "3", "Math"),
+        app.UserRecord("D", "Student", "Student D", "4", "Math"),
+        app.UserRecord("S1", "Staff", "Staff One"),
+    ]))
+    yield app.ReaderSession("test-kiosk")
+    if app.journal_conn is not None:
+        app.journal_conn.close()
+
+
+def marked_rows():
+    return app.read_journal_payloads("mark_attendance", "")
+
+
+def test_taps_after_the_slot_ends_belong_to_the_running_lecture(kiosk):
+    assert app.process_start_attendance(kiosk, "T1", at("10:35"))['success']
+    assert app.process_attendance_scan(kiosk, "A", at("10:40"))['status'] == "On-time"
+    assert app.process_attendance_scan(kiosk, "B", at("10:50"))['status'] == "Late"
+    # The slot is over but the lecture is not: same dedup index, same slot
+    assert app.process_attendance_scan(kiosk, "C", at("12:35"))['status'] == "Late"
+    repeat = app.process_attendance_scan(kiosk, "A", at("12:36"))
+    assert repeat['duplicate'] and repeat['status'] == "On-time"
+
+    rows = marked_rows()
+    assert sorted(row['card_id'] for row in rows) == ["A", "B", "C"]
+    assert {row['lecture_slot'] for row in rows} == {2}
+    assert {row['date'] for row in rows} == {"2026-03-02"}
+
+
+def test_a_card_with_an_unknown_role_is_rejected(kiosk, monkeypatch):
+    monkeypatch.setattr(app, "reader_sessions", {kiosk.reader_id: kiosk})
+    kiosk.start_lecture("T1", "Math", 2, started_at=at("10:35"))
+
+    response = app.app.test_client().post("/mark_attendance", json={"card_id": "S1", "event_id": "e1"})
+    assert response.status_code == 200
+    assert response.get_json() == {'success': False, 'message': 'Unsupported role: staff'}
+    assert marked_rows() == []
+
+
+def test_the_roster_of_a_lecture_that_ran_past_its_slot(kiosk):
+    assert app.process_start_attendance(kiosk, "T1", at("10:35"))['subject'] == "Math"
+    app.process_attendance_scan(kiosk, "A", at("10:40"))
+    app.process_attendance_scan(kiosk, "B", at("10:50"))
+    app.process_attendance_scan(kiosk, "C", at("12:35"))
+    ended = app.end_lecture_and_journal(kiosk, at("12:40"))
+
+    roster, = app.read_journal_payloads("lecture_roster", "")
+    assert (roster['subject'], roster['lecture_slot'], roster['date']) == ("Math", 2, "2026-03-02")
+    assert {row['card_id']: row['status'] for row in roster['roster']} == {
+        "A": "On-time", "B": "Late", "C": "Late", "D": "Absent"}
+    ended_row, = app.read_journal_payloads("end_lecture", "")
+    assert ended_row['lecture_slot'] == ended.slot == 2
+
+
+def test_a_lecture_is_for_one_of_the_teachers_subjects(kiosk):
+    assert app.process_start_attendance(kiosk, "T1", at("10:35"), subject="Chemistry") == {
+        'success': False, 'message': 'Teacher One does not teach Chemistry', 'choose_subject': ["Math", "Physics"]}
+    assert app.process_start_attendance(kiosk, "T1", at("10:35"), subject="Physics")['subject'] == "Physics"
+
+
+def test_a_card_tap_takes_the_picked_subject_or_asks_for_one(kiosk, monkeypatch):
+    monkeypatch.setattr(app, "TIMETABLE", app.Timetable({"grace_minutes": 15, "slots": {"2": ["10:30:00", "12:30:00"]}}))
+    kiosk.set_scan_mode("start_attendance")
+
+    # No subject in the timetable and none picked: a teacher of two subjects is asked, not guessed for
+    unclear = app.handle_start_attendance_scan(kiosk, "T1", at("10:35"))
+    assert not unclear['success'] and unclear['choose_subject'] == ["Math", "Physics"]
+    assert not kiosk.lecture.attendance_enabled
+
+    kiosk.set_scan_mode("start_attendance", "Physics")
+    assert app.handle_start_attendance_scan(kiosk, "T1", at("10:36"))['subject'] == "Physics"
+    assert kiosk.lecture.subject == "Physics" and kiosk.start_subject is None
+
+
+def post_batch(kiosk, *scans):
+    response = app.app.test_client().post("/mark_attendance_batch", json={
+        "reader": kiosk.reader_id,
+        "scans": [{"event_id": event_id, "card_id": card_id, "scanned_at": at(clock).isoformat()}
+                  for event_id, card_id, clock in scans]})
+    return response.get_json()['results']
+
+
+def test_batch_scans_after_the_slot_ends_belong_to_the_running_lecture(kiosk, monkeypatch):
+    monkeypatch.setattr(app, "reader_sessions", {kiosk.reader_id: kiosk})
+    app.process_start_attendance(kiosk, "T1", at("10:35"))
+    assert app.process_attendance_scan(kiosk, "A", at("12:40"))['status'] == "Late"
+
+    late, again = post_batch(kiosk, ("e1", "B", "12:41"), ("e2", "A", "12:42"))
+    assert late['success'] and late['status'] == "Late"
+    assert again['duplicate']
+    assert {(row['card_id'], row['lecture_slot']) for row in marked_rows()} == {("A", 2), ("B", 2)}
+
+
+def test_a_resent_event_id_is_replayed_and_adds_no_row(kiosk, monkeypatch):
+    monkeypatch.setattr(app, "reader_sessions", {kiosk.reader_id: kiosk})
+    app.process_start_attendance(kiosk, "T1", at("10:35"))
+
+    first, same_batch = post_batch(kiosk, ("e1", "A", "10:40"), ("e1", "A", "10:40"))
+    assert first['status'] == "On-time" and not first.get('replayed')
+    assert same_batch == dict(first, replayed=True)
+    next_batch, = post_batch(kiosk, ("e1", "A", "10:40"))
+    assert next_batch == dict(first, replayed=True)
+
+    client = app.app.test_client()
+    live = client.post("/mark_attendance", json={"card_id": "B", "event_id": "m1"}).get_json()
+    assert live['success'] and not live.get('replayed')
+    assert client.post("/mark_attendance", json={"card_id": "B", "event_id": "m1"}).get_json() == dict(live, replayed=True)
+
+    assert sorted(row['card_id'] for row in marked_rows()) == ["A", "B"]
+
+
+def test_check_ins_are_rolled_back_when_journaling_fails(kiosk, monkeypatch):
+    monkeypatch.setattr(app, "reader_sessions", {kiosk.reader_id: kiosk})
+    app.process_start_attendance(kiosk, "T1", at("10:35"))
+
+    def disk_full(*args, **kwargs):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as failing:
+        failing.setattr(app, "journal_client_events", disk_full)
+        failing.setattr(app, "journal_event", disk_full)
+        batch, = post_batch(kiosk, ("e1", "A", "10:40"))
+        live = app.process_attendance_scan(kiosk, "B", at("10:41"))
+    assert batch == dict(live, event_id="e1") == {
+        'success': False, 'message': 'Failed to record attendance data', 'event_id': "e1"}
+
+    # Nothing was remembered: the same event_id and the same card go through once the journal works
+    batch, = post_batch(kiosk, ("e1", "A", "10:40"))
+    live = app.process_attendance_scan(kiosk, "B", at("10:41"))
+    assert batch['status'] == live['status'] == "On-time"
+    assert not batch.get('duplicate') and not live.get('duplicate')
+    assert sorted(row['card_id'] for row in marked_rows()) == ["A", "B"]
+
+
+def test_a_tap_that_races_the_end_of_its_lecture_is_rejected(kiosk, monkeypatch):
+    app.process_start_attendance(kiosk, "T1", at("10:35"))
+    app.process_attendance_scan(kiosk, "A", at("10:40"))
+    classify = app.get_student_status
+
+    def teacher_taps_out_meanwhile(now, **kwargs):
+        # B's tap has read the running lecture; the lecture ends before it is checked in
+        app.end_lecture_and_journal(kiosk, at("12:00"))
+        return classify(now, **kwargs)
+
+    monkeypatch.setattr(app, "get_student_status", teacher_taps_out_meanwhile)
+    assert app.process_attendance_scan(kiosk, "B", at("12:00")) == {'success': False, 'message': 'Lecture already ended'}
+
+    roster, = app.read_journal_payloads("lecture_roster", "")
+    statuses = {row['card_id']: row['status'] for row in roster['roster']}
+    assert statuses["A"] == "On-time" and statuses["B"] == "Absent"
+    assert [row['card_id'] for row in marked_rows()] == ["A"]
+
+
+def test_the_roster_keeps_the_ended_lectures_scans_when_the_next_one_starts_first(kiosk):
+    app.process_start_attendance(kiosk, "T1", at("10:35"))
+    app.process_attendance_scan(kiosk, "A", at("10:40"))
+    ended = kiosk.end_lecture()
+    app.process_start_attendance(kiosk, "T1", at("12:00"), subject="Physics")
+
+    roster = app.lecture_roster(kiosk, ended)
+    assert {row['card_id']: row['status'] for row in roster['roster']}["A"] == "On-time"
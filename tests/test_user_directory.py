@@ -0,0 +1,44 @@
+import threading
+
+import app
+
+
+def test_reregistering_a_card_moves_it_between_buckets():
+    directory = app.UserDirectory([
+        app.UserRecord("A", "Student", "Student A", "1", "Math, Physics"),
+        app.UserRecord("B", "Student", "Student B", "2", "Math"),
+    ])
+    directory.add(app.UserRecord("A", "Teacher", "Teacher A", subject="Physics"))
+
+    assert [record.card_id for record in directory.students_in("Math")] == ["B"]
+    assert directory.students_in("Physics") == []
+    assert [record.name for record in directory.find(role="teacher", subject="Physics")] == ["Teacher A"]
+    assert directory.find(roll_no="1") == []
+
+    directory.remove("B")
+    assert directory.find(role="student") == []
+    assert len(directory) == 1
+
+
+def test_lookups_survive_registrations_on_another_thread():
+    directory = app.UserDirectory(app.UserRecord(f"S{i}", "Student", f"Student {i}", str(i), "Math")
+                                  for i in range(2000))
+    stop = threading.Event()
+
+    def register():
+        i = 2000
+        while not stop.is_set():
+            directory.add(app.UserRecord(f"S{i}", "Student", f"Student {i}", str(i), "Math"))
+            directory.remove(f"S{i - 1000}")
+            i += 1
+
+    writer = threading.Thread(target=register)
+    writer.start()
+    try:
+        for _ in range(300):
+            directory.students_in("Math")
+            directory.find()
+            directory.to_dict()
+    finally:
+        stop.set()
+        writer.join()
@@ -0,0 +1,41 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def warming_up():
+    app.scans_on_hold.set()
+    yield app.ReaderSession("test-kiosk")
+    app.scans_on_hold.clear()
+    app.pending_scans.clear()
+
+
+def test_registration_taps_are_not_held(warming_up):
+    warming_up.set_scan_mode("registration")
+    app.dispatch_card_scan(warming_up, "NEWCARD")
+
+    assert [scan['result'] for scan in warming_up.scan_queue] == [None]
+    assert not app.pending_scans
+
+
+def test_attendance_taps_are_held_until_users_load(warming_up):
+    warming_up.set_scan_mode("attendance")
+    app.dispatch_card_scan(warming_up, "A")
+
+    assert [scan['result'].get('buffered') for scan in warming_up.scan_queue] == [True]
+    assert [card_id for _, card_id, _ in app.pending_scans] == ["A"]
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/mark_attendance", {"card_id": "A", "event_id": "e1"}),
+    ("/mark_attendance_batch", {"scans": [{"event_id": "e1", "card_id": "A", "scanned_at": 0}]}),
+    ("/start_attendance", {"card_id": "T1"}),
+])
+def test_scan_api_asks_clients_to_retry_while_users_load(warming_up, monkeypatch, path, body):
+    monkeypatch.setattr(app, "reader_sessions", {warming_up.reader_id: warming_up})
+    response = app.app.test_client().post(path, json=body)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(app.WARMUP_RETRY_AFTER)
+    assert "Card not registered" not in response.get_json()['message']